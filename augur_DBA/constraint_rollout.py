@@ -0,0 +1,251 @@
+#SPDX-License-Identifier: MIT
+"""
+Roll out constraint changes in two phases instead of one.
+
+Scripts like more_cowbell/index.sql drop and re-add foreign keys in a single
+ALTER TABLE. Postgres then checks every existing row while it holds the
+table's ACCESS EXCLUSIVE lock, and collection stalls for as long as that
+takes.
+
+--rewrite turns such a script into two files:
+
+- <name>_not_valid.sql: the same statements, with every added FOREIGN KEY
+  or CHECK constraint marked NOT VALID. Each statement only touches the
+  catalog and holds its lock for milliseconds. New rows are checked from
+  then on.
+- <name>_validate.sql: one VALIDATE CONSTRAINT per added constraint. It
+  checks the existing rows under SHARE UPDATE EXCLUSIVE, which does not
+  block reads or writes.
+
+--validate connects and validates every constraint that is still NOT VALID,
+smallest table first, one transaction each. It stops starting new ones once
+--budget minutes are used up. Rerun it, e.g. nightly, until nothing is
+left.
+
+ALTER CONSTRAINT ... DEFERRABLE statements (all of
+augur_DBA/alter_constraints.sql) never check rows and pass through as is.
+"""
+import os
+import re
+import json
+import time
+import argparse
+import psycopg2
+import psycopg2.errors
+from psycopg2 import sql
+from contributors_fk_rewrite import with_retries
+
+CONFIG_FILE = "db.config.json"
+APPLICATION_NAME = "augur_DBA/constraint_rollout"
+LOCK_TIMEOUT = "2s"
+RETRIES = 8
+BUDGET_MINUTES = 60
+
+ALTER_TABLE_RE = re.compile(r'^\s*ALTER\s+TABLE\s+(?:ONLY\s+)?(?:IF\s+EXISTS\s+)?((?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)\s+(.*)$',
+                            re.IGNORECASE | re.DOTALL)
+ADD_CONSTRAINT_RE = re.compile(r'^\s*ADD\s+CONSTRAINT\s+("[^"]+"|\w+)\s+(FOREIGN\s+KEY|CHECK)\b', re.IGNORECASE)
+NOT_VALID_RE = re.compile(r'\bNOT\s+VALID\s*$', re.IGNORECASE)
+
+# Constraints still waiting for validation, smallest table first
+NOT_VALID_SQL = """
+SELECT ns.nspname, rel.relname, con.conname, con.contype, rel.relkind,
+       pg_total_relation_size(rel.oid) AS bytes
+FROM pg_constraint con
+JOIN pg_class rel ON rel.oid = con.conrelid
+JOIN pg_namespace ns ON ns.oid = rel.relnamespace
+WHERE NOT con.convalidated
+  AND con.contype IN ('f', 'c')
+  AND (%(schema)s IS NULL OR ns.nspname = %(schema)s)
+  AND (%(table)s IS NULL OR rel.relname = %(table)s)
+ORDER BY bytes, ns.nspname, rel.relname, con.conname;
+"""
+
+
+def read_db_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+
+def split_top_level(text, separator):
+    """
+    Split on separator outside quotes, comments and parentheses.
+    """
+    parts, current, depth, quote = [], [], 0, None
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            current.append(ch)
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+            current.append(ch)
+        elif text.startswith("--", i):
+            end = text.find("\n", i)
+            end = len(text) if end == -1 else end
+            current.append(text[i:end])
+            i = end
+            continue
+        elif ch == "(":
+            depth += 1
+            current.append(ch)
+        elif ch == ")":
+            depth -= 1
+            current.append(ch)
+        elif ch == separator and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+        i += 1
+    if "".join(current).strip():
+        parts.append("".join(current))
+    return parts
+
+
+def strip_comments(text):
+    return "\n".join(line for line in text.splitlines() if not line.strip().startswith("--")).strip()
+
+
+def rewrite_statement(statement):
+    """
+    Returns:
+        (rewritten statement, [(table, constraint) added NOT VALID])
+    """
+    m = ALTER_TABLE_RE.match(strip_comments(statement))
+    if not m:
+        return statement.strip(), []
+    table, body = m.group(1), m.group(2)
+    actions, added = [], []
+    for action in split_top_level(body, ","):
+        action = action.strip()
+        add = ADD_CONSTRAINT_RE.match(action)
+        if add:
+            if not NOT_VALID_RE.search(action):
+                action = f"{action} NOT VALID"
+            added.append((table, add.group(1)))
+        actions.append(action)
+    return f"ALTER TABLE {table}\n  " + ",\n  ".join(actions), added
+
+
+def rewrite_file(path, lock_timeout=LOCK_TIMEOUT):
+    with open(path, 'r') as f:
+        statements = [s for s in split_top_level(f.read(), ";") if strip_comments(s)]
+
+    base = os.path.splitext(path)[0]
+    not_valid_path, validate_path = f"{base}_not_valid.sql", f"{base}_validate.sql"
+    added = []
+    with open(not_valid_path, 'w') as f:
+        f.write(f"-- Phase 1, generated from {os.path.basename(path)} by constraint_rollout.py.\n")
+        f.write("-- Catalog-only changes: existing rows are checked in phase 2.\n")
+        f.write("-- NOT VALID is not supported for foreign keys on partitioned tables before Postgres 18.\n")
+        f.write(f"SET lock_timeout = '{lock_timeout}';\n\n")
+        for statement in statements:
+            rewritten, constraints = rewrite_statement(statement)
+            added += constraints
+            f.write(rewritten + ";\n\n")
+    with open(validate_path, 'w') as f:
+        f.write(f"-- Phase 2, generated from {os.path.basename(path)} by constraint_rollout.py.\n")
+        f.write("-- Each VALIDATE takes SHARE UPDATE EXCLUSIVE; reads and writes carry on.\n")
+        f.write("-- python constraint_rollout.py --validate does the same with a time budget.\n\n")
+        for table, constraint in added:
+            f.write(f"ALTER TABLE {table} VALIDATE CONSTRAINT {constraint};\n")
+
+    print(f"✅ {path}: {len(statements)} statements, {len(added)} constraints made NOT VALID")
+    print(f"   {not_valid_path}")
+    print(f"   {validate_path}")
+    return added
+
+
+def pretty_size(size):
+    for unit in ("B", "kB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def validate(budget_minutes=BUDGET_MINUTES, schema=None, table=None, hard=False,
+             lock_timeout=LOCK_TIMEOUT, retries=RETRIES):
+    config = read_db_config()
+    conn = psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name=APPLICATION_NAME
+    )
+    start = time.perf_counter()
+    deadline = start + budget_minutes * 60
+    done, failed = [], []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(NOT_VALID_SQL, {"schema": schema, "table": table})
+            pending = cursor.fetchall()
+        conn.rollback()
+        total = len(pending)
+        print(f"{total} constraints are NOT VALID ({pretty_size(sum(row[5] for row in pending))} of tables to scan), "
+              f"budget {budget_minutes} minutes.")
+
+        for i, (nspname, relname, conname, contype, relkind, size) in enumerate(pending, 1):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            label = f"{nspname}.{relname}"
+            if contype == "f" and relkind == "p":
+                print(f"[{i}/{total}] {label} {conname}: skipped, partitioned table")
+                continue
+
+            def work(cursor):
+                if hard:
+                    # Give up on this one rather than overrun the budget
+                    cursor.execute("SET LOCAL statement_timeout = %s;", (f"{int(remaining * 1000)}ms",))
+                cursor.execute(sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {};").format(
+                    sql.Identifier(nspname, relname), sql.Identifier(conname)
+                ))
+
+            constraint_start = time.perf_counter()
+            try:
+                with_retries(conn, label, work, retries, lock_timeout)
+                done.append(conname)
+                print(f"[{i}/{total}] {label} {conname}: validated in {time.perf_counter() - constraint_start:.1f}s "
+                      f"({pretty_size(size)})")
+            except psycopg2.errors.QueryCanceled:
+                print(f"[{i}/{total}] {label} {conname}: ⚠️  stopped at the end of the budget, retry next run")
+                break
+            except Exception as e:
+                failed.append(conname)
+                print(f"❌ [{i}/{total}] {label} {conname}: {e}".strip())
+    finally:
+        conn.close()
+
+    left = total - len(done)
+    elapsed = (time.perf_counter() - start) / 60
+    print(f"Validated {len(done)} constraints in {elapsed:.1f} minutes; {left} still NOT VALID"
+          f"{f', {len(failed)} failed (violating rows?)' if failed else ''}.")
+    if not left:
+        print("✅ All constraints are validated.")
+    return left
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Add constraints NOT VALID first and validate them later, within a time budget.")
+    parser.add_argument("--rewrite", nargs="+", metavar="SQL_FILE", help="Scripts to split into *_not_valid.sql and *_validate.sql.")
+    parser.add_argument("--validate", action="store_true", help="Validate the NOT VALID constraints in the database.")
+    parser.add_argument("--budget", type=float, default=BUDGET_MINUTES, help=f"Minutes to spend validating per run (default: {BUDGET_MINUTES}).")
+    parser.add_argument("--hard", action="store_true", help="Cancel a validation still running when the budget runs out.")
+    parser.add_argument("--schema", default=None, help="Only validate constraints in this schema.")
+    parser.add_argument("--table", default=None, help="Only validate constraints on this table.")
+    parser.add_argument("--lock-timeout", default=LOCK_TIMEOUT, help=f"lock_timeout for each statement (default: {LOCK_TIMEOUT}).")
+    parser.add_argument("--retries", type=int, default=RETRIES, help=f"Attempts per VALIDATE (default: {RETRIES}).")
+    args = parser.parse_args()
+
+    if not args.rewrite and not args.validate:
+        parser.error("nothing to do; give --rewrite and/or --validate")
+    for path in args.rewrite or []:
+        rewrite_file(path, args.lock_timeout)
+    if args.validate:
+        left = validate(args.budget, args.schema, args.table, args.hard, args.lock_timeout, args.retries)
+        raise SystemExit(0 if not left else 3)
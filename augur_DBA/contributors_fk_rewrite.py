@@ -0,0 +1,324 @@
+#SPDX-License-Identifier: MIT
+"""
+Rewrite every foreign key that points at augur_data.contributors (or any of
+its hash partitions), instead of writing ALTERs by hand for each table the
+way contributors_partition_update_fk.py does for issue_events.
+
+The constraints come from pg_constraint. Work is grouped by referencing
+table, since every ALTER on a table takes that table's lock anyway, and the
+tables are processed in parallel, each on its own connection. Every
+transaction runs with a short lock_timeout. When it cannot get its locks it
+rolls back, backs off and tries again, so it never queues behind (and
+blocks) collection traffic.
+
+Deferrability is changed in place with ALTER CONSTRAINT. Changing ON UPDATE
+needs the constraint to be dropped and re-added. It is re-added NOT VALID
+where Postgres allows it and then validated in a second transaction, so the
+check of existing rows does not hold an exclusive lock.
+"""
+import re
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import psycopg2
+import psycopg2.pool
+import psycopg2.errors
+from psycopg2 import sql
+
+CONFIG_FILE = "db.config.json"
+APPLICATION_NAME = "augur_DBA/contributors_fk_rewrite"
+MAX_WORKERS = 8
+LOCK_TIMEOUT = "2s"
+RETRIES = 8
+MAX_BACKOFF = 30
+
+# pg_constraint codes for ON UPDATE / ON DELETE
+FK_ACTIONS = {
+    "a": "NO ACTION",
+    "r": "RESTRICT",
+    "c": "CASCADE",
+    "n": "SET NULL",
+    "d": "SET DEFAULT",
+}
+
+DEFERRABLE_MODES = {
+    "deferred": "DEFERRABLE INITIALLY DEFERRED",
+    "immediate": "DEFERRABLE INITIALLY IMMEDIATE",
+    "not-deferrable": "NOT DEFERRABLE",
+}
+
+ON_UPDATE_CHOICES = {
+    "no-action": "a",
+    "restrict": "r",
+    "cascade": "c",
+    "set-null": "n",
+    "set-default": "d",
+}
+
+# Constraints referencing the table or any of its partitions. Constraints
+# with a conparentid were cloned from a parent constraint and follow it.
+FK_SQL = """
+SELECT
+  con.oid,
+  ns.nspname,
+  rel.relname,
+  rel.relkind,
+  con.conname,
+  con.conparentid <> 0 AS derived,
+  con.condeferrable,
+  con.condeferred,
+  con.confupdtype,
+  con.convalidated,
+  pg_get_constraintdef(con.oid) AS definition
+FROM pg_constraint con
+JOIN pg_class rel ON rel.oid = con.conrelid
+JOIN pg_namespace ns ON ns.oid = rel.relnamespace
+WHERE con.contype = 'f'
+  AND con.confrelid IN (SELECT relid FROM pg_partition_tree(%s::regclass))
+ORDER BY ns.nspname, rel.relname, con.conname;
+"""
+
+DEFINITION_CLAUSES_RE = re.compile(
+    r'\s+(ON UPDATE (NO ACTION|RESTRICT|CASCADE|SET NULL|SET DEFAULT)'
+    r'|NOT DEFERRABLE|DEFERRABLE|INITIALLY (DEFERRED|IMMEDIATE)|NOT VALID)'
+)
+
+
+def read_db_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+
+def deferrable_state(mode):
+    return {
+        "deferred": (True, True),
+        "immediate": (True, False),
+        "not-deferrable": (False, False),
+    }[mode]
+
+
+def plan_changes(constraints, deferrable=None, on_update=None, include_derived=False):
+    """
+    Decide what each constraint needs. Derived constraints are left to
+    their parent, which Postgres recurses from, unless include_derived is
+    set for a second pass.
+    Returns:
+        {(schema, table): [constraint dict with an added 'action' key]}
+    """
+    by_table = {}
+    for con in constraints:
+        wants_update = on_update is not None and con["confupdtype"] != on_update
+        wants_deferral = deferrable is not None and (
+            (con["condeferrable"], con["condeferred"]) != deferrable_state(deferrable)
+        )
+        if not (wants_update or wants_deferral):
+            continue
+        if con["derived"] and (wants_update or not include_derived):
+            continue
+        if wants_update:
+            con["action"] = "replace"
+        else:
+            con["action"] = "alter"
+        by_table.setdefault((con["schema"], con["table"]), []).append(con)
+    return by_table
+
+
+def replacement_definition(con, deferrable=None, on_update=None):
+    definition = DEFINITION_CLAUSES_RE.sub("", con["definition"])
+    update_code = on_update if on_update is not None else con["confupdtype"]
+    if update_code != "a":
+        definition += f" ON UPDATE {FK_ACTIONS[update_code]}"
+    if deferrable is not None:
+        definition += f" {DEFERRABLE_MODES[deferrable]}"
+    elif con["condeferrable"]:
+        definition += " DEFERRABLE INITIALLY " + ("DEFERRED" if con["condeferred"] else "IMMEDIATE")
+    # NOT VALID is not allowed on a partitioned referencing table
+    if con["relkind"] != "p":
+        definition += " NOT VALID"
+    return definition
+
+
+def load_constraints(cursor, referenced):
+    cursor.execute(FK_SQL, (referenced,))
+    columns = [col.name for col in cursor.description]
+    constraints = []
+    for row in cursor.fetchall():
+        con = dict(zip(columns, row))
+        con["schema"] = con.pop("nspname")
+        con["table"] = con.pop("relname")
+        constraints.append(con)
+    return constraints
+
+
+def with_retries(conn, label, work, retries=RETRIES, lock_timeout=LOCK_TIMEOUT):
+    """
+    Run work(cursor) in one transaction under lock_timeout, retrying with
+    jittered exponential backoff when a lock is not available.
+    Returns:
+        number of attempts it took
+    """
+    for attempt in range(1, retries + 1):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET LOCAL lock_timeout = %s;", (lock_timeout,))
+                work(cursor)
+            conn.commit()
+            return attempt
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            if attempt == retries:
+                raise
+            delay = min(MAX_BACKOFF, 0.5 * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            print(f"  {label}: lock busy, retry {attempt}/{retries - 1} in {delay:.1f}s")
+            time.sleep(delay)
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def rewrite_table(pool, schema, table, constraints, deferrable, on_update, retries, lock_timeout):
+    conn = pool.getconn()
+    start = time.perf_counter()
+    target = sql.Identifier(schema, table)
+    label = f"{schema}.{table}"
+    try:
+        def apply(cursor):
+            for con in constraints:
+                name = sql.Identifier(con["conname"])
+                if con["action"] == "alter":
+                    cursor.execute(sql.SQL("ALTER TABLE {} ALTER CONSTRAINT {} " + DEFERRABLE_MODES[deferrable]).format(
+                        target, name
+                    ))
+                else:
+                    cursor.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(target, name))
+                    cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} ").format(target, name)
+                                   + sql.SQL(replacement_definition(con, deferrable, on_update)))
+
+        attempts = with_retries(conn, label, apply, retries, lock_timeout)
+
+        # VALIDATE only takes SHARE UPDATE EXCLUSIVE, so reads and writes carry on
+        for con in constraints:
+            if con["action"] == "replace" and con["relkind"] != "p" and con["convalidated"]:
+                attempts += with_retries(conn, label, lambda cursor, con=con: cursor.execute(
+                    sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {}").format(target, sql.Identifier(con["conname"]))
+                ), retries, lock_timeout)
+        return len(constraints), attempts, time.perf_counter() - start
+    finally:
+        pool.putconn(conn)
+
+
+def run(referenced, deferrable=None, on_update=None, workers=MAX_WORKERS,
+        lock_timeout=LOCK_TIMEOUT, retries=RETRIES, dry_run=False):
+    config = read_db_config()
+    pool = psycopg2.pool.ThreadedConnectionPool(
+        1,
+        max(workers, 1),
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name=APPLICATION_NAME
+    )
+    start = time.perf_counter()
+    failed = []
+    try:
+        # Parents recurse to their derived constraints, so a second pass only
+        # finds derived constraints Postgres did not update on its own. It
+        # runs even when the parents need nothing, since an interrupted
+        # earlier run can leave the parents done and their derived ones not.
+        for pass_no in (1, 2):
+            conn = pool.getconn()
+            try:
+                with conn.cursor() as cursor:
+                    constraints = load_constraints(cursor, referenced)
+                conn.rollback()
+            finally:
+                pool.putconn(conn)
+
+            if pass_no == 1:
+                print(f"Found {len(constraints)} foreign keys referencing {referenced} "
+                      f"on {len({(c['schema'], c['table']) for c in constraints})} tables.")
+            plan = plan_changes(constraints, deferrable, on_update, include_derived=pass_no == 2)
+            if not plan:
+                if pass_no == 1:
+                    print("Parent constraints need no changes; checking derived constraints.")
+                    continue
+                print("All constraints match.")
+                break
+
+            total = sum(len(cons) for cons in plan.values())
+            print(f"Pass {pass_no}: {total} constraints on {len(plan)} tables need changes.")
+            if dry_run:
+                for (schema, table), cons in sorted(plan.items()):
+                    for con in cons:
+                        print(f"  {schema}.{table} {con['conname']}: {con['action']}")
+                break
+
+            done = 0
+            with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+                futures = {
+                    executor.submit(rewrite_table, pool, schema, table, cons, deferrable, on_update,
+                                    retries, lock_timeout): (schema, table)
+                    for (schema, table), cons in plan.items()
+                }
+                for future in as_completed(futures):
+                    schema, table = futures[future]
+                    try:
+                        count, attempts, elapsed = future.result()
+                        done += count
+                        print(f"[{done}/{total}] {schema}.{table}: {count} constraints "
+                              f"in {elapsed:.1f}s ({attempts} transactions)")
+                    except Exception as e:
+                        failed.append(f"{schema}.{table}")
+                        print(f"❌ {schema}.{table} failed: {e}".strip())
+            if failed:
+                break
+    finally:
+        pool.closeall()
+
+    elapsed = time.perf_counter() - start
+    if failed:
+        print(f"Finished in {elapsed:.1f}s with {len(failed)} failed tables: {', '.join(sorted(failed))}")
+    else:
+        print(f"✅ Finished in {elapsed:.1f}s")
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Change the foreign keys that reference augur_data.contributors.")
+    parser.add_argument(
+        "--referenced",
+        default="augur_data.contributors",
+        help="Referenced table; FKs to any of its partitions are included (default: augur_data.contributors)."
+    )
+    parser.add_argument(
+        "--deferrable",
+        choices=list(DEFERRABLE_MODES),
+        default="deferred",
+        help="Deferrability to set (default: deferred, i.e. DEFERRABLE INITIALLY DEFERRED)."
+    )
+    parser.add_argument(
+        "--on-update",
+        choices=list(ON_UPDATE_CHOICES),
+        default=None,
+        help="ON UPDATE action to set. Constraints are dropped and re-added for this. Default: leave as is."
+    )
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help=f"Tables to change at once (default: {MAX_WORKERS}).")
+    parser.add_argument("--lock-timeout", default=LOCK_TIMEOUT, help=f"lock_timeout per attempt (default: {LOCK_TIMEOUT}).")
+    parser.add_argument("--retries", type=int, default=RETRIES, help=f"Attempts per transaction (default: {RETRIES}).")
+    parser.add_argument("--dry-run", action="store_true", help="List what would change and exit.")
+    args = parser.parse_args()
+
+    failed = run(
+        args.referenced,
+        deferrable=args.deferrable,
+        on_update=ON_UPDATE_CHOICES.get(args.on_update),
+        workers=args.workers,
+        lock_timeout=args.lock_timeout,
+        retries=args.retries,
+        dry_run=args.dry_run
+    )
+    raise SystemExit(1 if failed else 0)
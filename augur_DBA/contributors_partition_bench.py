@@ -0,0 +1,327 @@
+#SPDX-License-Identifier: MIT
+"""
+Measure how the number of hash partitions on contributors affects the
+workload, instead of picking a modulus (512 in
+contributors-hash-partitioned.sql) without numbers.
+
+Everything happens in the bench schema of a scratch database. The contributor
+rows are either a sample copied from a live instance (--sample-from) or
+synthetic. For every modulus the script builds a hash-partitioned copy and
+an issue_events table with a foreign key to it, then measures:
+
+- point lookups by cntrb_id (latency, planning included),
+- planning time for a lookup by cntrb_id (pruned to one partition) and by
+  gh_login (which has to plan every partition),
+- inserts into issue_events, where each row pays an FK check,
+- concurrent inserts into contributors from several connections, which is
+  what hash partitioning is meant to help.
+
+It writes the numbers to a CSV and recommends the modulus with the best
+all-round score.
+"""
+import io
+import csv
+import json
+import time
+import random
+import argparse
+from datetime import datetime
+from statistics import mean, quantiles
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+
+APPLICATION_NAME = "augur_DBA/contributors_partition_bench"
+SCRATCH_CONFIG_FILE = "scratch.config.json"
+MODULI = [32, 64, 128, 256, 512]
+ROWS = 1000000
+LOOKUPS = 5000
+FK_ROWS = 50000
+WRITERS = 8
+WRITER_ROWS = 5000
+PLAN_SAMPLES = 50
+
+SOURCE_DDL = """
+CREATE SCHEMA IF NOT EXISTS bench;
+DROP TABLE IF EXISTS bench.contributors_source;
+CREATE TABLE bench.contributors_source (
+  cntrb_id uuid PRIMARY KEY,
+  cntrb_login varchar,
+  cntrb_email varchar,
+  gh_user_id int8,
+  gh_login varchar
+);
+"""
+
+SYNTHETIC_SQL = """
+INSERT INTO bench.contributors_source
+SELECT gen_random_uuid(), 'user' || g, 'user' || g || '@example.com', g, 'user' || g
+FROM generate_series(1, %(rows)s) g;
+"""
+
+SAMPLE_SQL = """
+COPY (
+  SELECT cntrb_id, cntrb_login, cntrb_email, gh_user_id, gh_login
+  FROM augur_data.contributors TABLESAMPLE SYSTEM ({percent})
+  LIMIT {rows}
+) TO STDOUT WITH (FORMAT csv)
+"""
+
+# Same shape as step 1-2 of contributors-hash-partitioned.sql, cut down to
+# the columns the benchmark touches
+BUILD_SQL = """
+DROP TABLE IF EXISTS bench.issue_events_m{m};
+DROP TABLE IF EXISTS bench.contributors_m{m};
+CREATE TABLE bench.contributors_m{m} (
+  cntrb_id uuid NOT NULL,
+  cntrb_login varchar,
+  cntrb_email varchar,
+  gh_user_id int8,
+  gh_login varchar,
+  data_collection_date timestamp(0) DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (cntrb_id)
+) PARTITION BY HASH (cntrb_id);
+DO $$
+BEGIN
+  FOR i IN 0..{m} - 1 LOOP
+    EXECUTE format('CREATE TABLE bench.contributors_m{m}_p%s PARTITION OF bench.contributors_m{m} FOR VALUES WITH (modulus {m}, remainder %s);', i, i);
+  END LOOP;
+END $$;
+INSERT INTO bench.contributors_m{m} (cntrb_id, cntrb_login, cntrb_email, gh_user_id, gh_login)
+SELECT * FROM bench.contributors_source;
+CREATE INDEX ON bench.contributors_m{m} (gh_login);
+CREATE TABLE bench.issue_events_m{m} (
+  event_id bigserial PRIMARY KEY,
+  issue_id int8,
+  cntrb_id uuid REFERENCES bench.contributors_m{m} (cntrb_id),
+  action varchar,
+  created_at timestamp(0) DEFAULT CURRENT_TIMESTAMP
+);
+ANALYZE bench.contributors_m{m};
+"""
+
+# metric: True when higher is better
+METRICS = {
+    "lookup_ms": False,
+    "lookup_p95_ms": False,
+    "plan_pruned_ms": False,
+    "plan_unpruned_ms": False,
+    "fk_insert_rows_s": True,
+    "parallel_insert_rows_s": True,
+}
+
+
+def read_config(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def connect(config):
+    return psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name=APPLICATION_NAME
+    )
+
+
+def load_source(conn, rows, sample_config=None):
+    with conn.cursor() as cursor:
+        cursor.execute(SOURCE_DDL)
+        if sample_config is None:
+            print(f"Generating {rows} synthetic contributors...")
+            cursor.execute(SYNTHETIC_SQL, {"rows": rows})
+        else:
+            source = connect(sample_config)
+            try:
+                with source.cursor() as src:
+                    src.execute("SELECT greatest(reltuples, 1) FROM pg_class WHERE oid = 'augur_data.contributors'::regclass;")
+                    percent = min(100.0, rows / float(src.fetchone()[0]) * 100 * 1.2)
+                    buf = io.StringIO()
+                    src.copy_expert(SAMPLE_SQL.format(percent=percent, rows=int(rows)), buf)
+            finally:
+                source.close()
+            buf.seek(0)
+            cursor.copy_expert("COPY bench.contributors_source FROM STDIN WITH (FORMAT csv)", buf)
+            print(f"Copied a {percent:.2f}% sample of augur_data.contributors.")
+        cursor.execute("ANALYZE bench.contributors_source;")
+        cursor.execute("SELECT cntrb_id::text, gh_login FROM bench.contributors_source;")
+        keys = cursor.fetchall()
+    conn.commit()
+    print(f"Scratch source holds {len(keys)} contributors.")
+    return keys
+
+
+def planning_ms(cursor, query, params):
+    cursor.execute("EXPLAIN (ANALYZE, SUMMARY, FORMAT JSON) " + query, params)
+    return cursor.fetchone()[0][0]["Planning Time"]
+
+
+def bench_lookups(conn, m, keys, lookups):
+    table = f"bench.contributors_m{m}"
+    sample = random.sample(keys, min(lookups, len(keys)))
+    timings = []
+    with conn.cursor() as cursor:
+        for cntrb_id, _ in sample:
+            start = time.perf_counter()
+            cursor.execute(f"SELECT * FROM {table} WHERE cntrb_id = %s;", (cntrb_id,))
+            cursor.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        pruned = []
+        unpruned = []
+        for cntrb_id, gh_login in sample[:PLAN_SAMPLES]:
+            pruned.append(planning_ms(cursor, f"SELECT * FROM {table} WHERE cntrb_id = %s", (cntrb_id,)))
+            unpruned.append(planning_ms(cursor, f"SELECT * FROM {table} WHERE gh_login = %s", (gh_login or "",)))
+    conn.rollback()
+    return {
+        "lookup_ms": mean(timings),
+        "lookup_p95_ms": quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0],
+        "plan_pruned_ms": mean(pruned),
+        "plan_unpruned_ms": mean(unpruned),
+    }
+
+
+def bench_fk_inserts(conn, m, keys, rows):
+    ids = [random.choice(keys)[0] for _ in range(rows)]
+    with conn.cursor() as cursor:
+        start = time.perf_counter()
+        cursor.execute(f"""
+            INSERT INTO bench.issue_events_m{m} (issue_id, cntrb_id, action)
+            SELECT n, id, 'closed'
+            FROM unnest(%s::uuid[]) WITH ORDINALITY AS t(id, n);
+        """, (ids,))
+        elapsed = time.perf_counter() - start
+    conn.commit()
+    return {"fk_insert_rows_s": rows / elapsed}
+
+
+def insert_worker(config, m, rows):
+    conn = connect(config)
+    try:
+        with conn.cursor() as cursor:
+            for i in range(rows):
+                cursor.execute(
+                    f"INSERT INTO bench.contributors_m{m} (cntrb_id, cntrb_login) VALUES (gen_random_uuid(), %s);",
+                    (f"writer{i}",)
+                )
+                # Commit in small batches, as collection workers do
+                if i % 100 == 99:
+                    conn.commit()
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def bench_parallel_inserts(config, m, writers, rows_per_writer):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        for future in [executor.submit(insert_worker, config, m, rows_per_writer) for _ in range(writers)]:
+            future.result()
+    return {"parallel_insert_rows_s": writers * rows_per_writer / (time.perf_counter() - start)}
+
+
+def score(results):
+    """
+    Average, over all metrics, of how far each modulus is from the best
+    value measured for that metric. 1.0 means best at everything.
+    """
+    scores = {}
+    for m, metrics in results.items():
+        ratios = []
+        for name, higher_is_better in METRICS.items():
+            values = [r[name] for r in results.values()]
+            best = max(values) if higher_is_better else min(values)
+            value = metrics[name]
+            ratios.append(best / value if higher_is_better else value / best)
+        scores[m] = mean(ratios)
+    return scores
+
+
+def write_report(results, scores, out_prefix="partition_bench"):
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    csv_file = f"{out_prefix}_{ts}.csv"
+    with open(csv_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["modulus", *METRICS, "score"])
+        writer.writeheader()
+        for m, metrics in sorted(results.items()):
+            writer.writerow({"modulus": m, **{k: round(v, 3) for k, v in metrics.items()}, "score": round(scores[m], 3)})
+    print(f"📄 Results written to {csv_file}")
+
+
+def main(scratch_config, moduli, rows, sample_config=None, lookups=LOOKUPS, fk_rows=FK_ROWS,
+         writers=WRITERS, writer_rows=WRITER_ROWS, keep=False):
+    conn = connect(scratch_config)
+    results = {}
+    try:
+        keys = load_source(conn, rows, sample_config)
+        for m in moduli:
+            print(f"\nModulus {m}:")
+            start = time.perf_counter()
+            with conn.cursor() as cursor:
+                cursor.execute(BUILD_SQL.format(m=m))
+            conn.commit()
+            print(f"  built in {time.perf_counter() - start:.1f}s")
+
+            metrics = bench_lookups(conn, m, keys, lookups)
+            metrics.update(bench_fk_inserts(conn, m, keys, fk_rows))
+            metrics.update(bench_parallel_inserts(scratch_config, m, writers, writer_rows))
+            results[m] = metrics
+            for name, value in metrics.items():
+                print(f"  {name:<24} {value:>12,.3f}")
+
+            if not keep:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE bench.issue_events_m{m}; DROP TABLE bench.contributors_m{m};")
+                conn.commit()
+        if not keep:
+            with conn.cursor() as cursor:
+                cursor.execute("DROP TABLE bench.contributors_source;")
+            conn.commit()
+    finally:
+        conn.close()
+
+    scores = score(results)
+    print("\nModulus  " + "  ".join(f"{name:>22}" for name in METRICS) + "     score")
+    for m in sorted(results):
+        print(f"{m:>7}  " + "  ".join(f"{results[m][name]:>22,.3f}" for name in METRICS) + f"  {scores[m]:>8.3f}")
+    # Ties go to fewer partitions, which are cheaper to maintain
+    best = min(scores, key=lambda m: (round(scores[m], 2), m))
+    print(f"\n✅ Recommended modulus: {best} (score {scores[best]:.3f}; 1.0 = best on every metric)")
+    write_report(results, scores)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark hash partition counts for augur_data.contributors in a scratch database.")
+    parser.add_argument(
+        "--scratch-config",
+        default=SCRATCH_CONFIG_FILE,
+        help=f"Connection settings for the scratch database; tables go in its bench schema (default: {SCRATCH_CONFIG_FILE})."
+    )
+    parser.add_argument(
+        "--sample-from",
+        default=None,
+        help="Connection settings (e.g. db.config.json) of an instance to sample contributors from. Default: synthetic rows."
+    )
+    parser.add_argument("--moduli", type=int, nargs="+", default=MODULI, help="Partition counts to try (default: 32 64 128 256 512).")
+    parser.add_argument("--rows", type=int, default=ROWS, help=f"Contributors to load (default: {ROWS}).")
+    parser.add_argument("--lookups", type=int, default=LOOKUPS, help=f"Point lookups per modulus (default: {LOOKUPS}).")
+    parser.add_argument("--fk-rows", type=int, default=FK_ROWS, help=f"issue_events rows inserted per modulus (default: {FK_ROWS}).")
+    parser.add_argument("--writers", type=int, default=WRITERS, help=f"Concurrent contributor writers (default: {WRITERS}).")
+    parser.add_argument("--writer-rows", type=int, default=WRITER_ROWS, help=f"Rows inserted by each writer (default: {WRITER_ROWS}).")
+    parser.add_argument("--keep", action="store_true", help="Keep the bench tables for a closer look.")
+    args = parser.parse_args()
+
+    main(
+        read_config(args.scratch_config),
+        args.moduli,
+        args.rows,
+        sample_config=read_config(args.sample_from) if args.sample_from else None,
+        lookups=args.lookups,
+        fk_rows=args.fk_rows,
+        writers=args.writers,
+        writer_rows=args.writer_rows,
+        keep=args.keep
+    )
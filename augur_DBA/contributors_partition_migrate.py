@@ -0,0 +1,411 @@
+#SPDX-License-Identifier: MIT
+"""
+Online copy of augur_data.contributors into the hash-partitioned
+augur_data.contributors_new (created by steps 1-4 of
+contributors-hash-partitioned.sql), replacing the single INSERT ... SELECT
+of step 5 and the swap of steps 6-8.
+
+1. A trigger on contributors records the cntrb_id of every row inserted,
+   updated or deleted from here on in contributors_migration_log.
+2. Rows are copied in cntrb_id order, batch_size at a time, one short
+   transaction per batch (keyset pagination). Before each batch the copy
+   waits while replication lag or the number of active backends is too high.
+3. Catch-up re-syncs the logged rows from contributors until the log is
+   nearly empty.
+4. Cutover locks contributors against writes, applies the last of the log,
+   swaps the names, and moves the foreign keys over to the new table, all in
+   one transaction under lock_timeout. The moved keys are added NOT VALID
+   where Postgres allows it and validated after the swap.
+
+The copy can be stopped and rerun: it resumes after the highest cntrb_id
+already in contributors_new, and the log covers anything that changed below it.
+"""
+import json
+import time
+import random
+import argparse
+import psycopg2
+import psycopg2.errors
+from psycopg2 import sql
+from contributors_fk_rewrite import load_constraints
+
+CONFIG_FILE = "db.config.json"
+APPLICATION_NAME = "augur_DBA/contributors_partition_migrate"
+SOURCE = "augur_data.contributors"
+TARGET = "augur_data.contributors_new"
+OLD = "contributors_old"
+LOG = "augur_data.contributors_migration_log"
+
+BATCH_SIZE = 10000
+MAX_LAG = 30
+MAX_ACTIVE = 64
+THROTTLE_SLEEP = 5
+CUTOVER_THRESHOLD = 1000
+LOCK_TIMEOUT = "3s"
+RETRIES = 10
+PROGRESS_SECONDS = 10
+
+CAPTURE_DDL = """
+CREATE TABLE IF NOT EXISTS augur_data.contributors_migration_log (
+  id bigserial PRIMARY KEY,
+  cntrb_id uuid NOT NULL
+);
+CREATE OR REPLACE FUNCTION augur_data.contributors_migration_capture() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    INSERT INTO augur_data.contributors_migration_log (cntrb_id) VALUES (OLD.cntrb_id);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO augur_data.contributors_migration_log (cntrb_id) VALUES (NEW.cntrb_id);
+  END IF;
+  RETURN NULL;
+END $$;
+DROP TRIGGER IF EXISTS contributors_migration_capture ON augur_data.contributors;
+CREATE TRIGGER contributors_migration_capture
+AFTER INSERT OR UPDATE OR DELETE ON augur_data.contributors
+FOR EACH ROW EXECUTE FUNCTION augur_data.contributors_migration_capture();
+"""
+
+TRIGGER_EXISTS_SQL = """
+SELECT 1 FROM pg_trigger
+WHERE tgrelid = 'augur_data.contributors'::regclass
+  AND tgname = 'contributors_migration_capture';
+"""
+
+# The source is read by key order from its primary key index. The last key
+# of the batch is where the next batch starts.
+COPY_BATCH_SQL = """
+WITH batch AS (
+  SELECT {columns} FROM augur_data.contributors
+  WHERE cntrb_id > %(after)s
+  ORDER BY cntrb_id
+  LIMIT %(batch_size)s
+),
+copied AS (
+  INSERT INTO augur_data.contributors_new ({columns})
+  SELECT {columns} FROM batch
+  ON CONFLICT DO NOTHING
+  RETURNING 1
+)
+SELECT
+  (SELECT count(*) FROM batch),
+  (SELECT count(*) FROM copied),
+  (SELECT cntrb_id FROM batch ORDER BY cntrb_id DESC LIMIT 1);
+"""
+
+# Re-sync up to batch_size logged keys: whatever the source holds for them now
+# replaces what the target has, which covers inserts, updates and deletes.
+# Re-syncs up to batch_size logged keys: deletes them from the log and copies
+# their current rows from the source, or nothing if the row is gone. The key
+# table is created once per session and emptied on every pass, so several
+# passes can run in one transaction, as they do at cutover.
+CATCH_UP_TEMPLATE = """
+CREATE TEMP TABLE IF NOT EXISTS {keys} ({key} {key_type} PRIMARY KEY) ON COMMIT DELETE ROWS;
+TRUNCATE {keys};
+WITH picked AS (
+  DELETE FROM {log}
+  WHERE id IN (SELECT id FROM {log} ORDER BY id LIMIT %(batch_size)s)
+  RETURNING {key}
+)
+INSERT INTO {keys} SELECT DISTINCT {key} FROM picked;
+DELETE FROM {target} WHERE {key} IN (SELECT {key} FROM {keys});
+INSERT INTO {target} ({columns})
+SELECT {columns} FROM {source} WHERE {key} IN (SELECT {key} FROM {keys});
+SELECT count(*) FROM {keys};
+"""
+
+LAG_SQL = """
+SELECT coalesce(max(extract(epoch FROM greatest(write_lag, flush_lag, replay_lag))), 0)
+FROM pg_stat_replication;
+"""
+
+ACTIVE_SQL = """
+SELECT count(*) FROM pg_stat_activity
+WHERE state = 'active' AND backend_type = 'client backend' AND pid <> pg_backend_pid();
+"""
+
+
+def read_db_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s"
+
+
+def target_columns(cursor):
+    cursor.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum;
+    """, (TARGET,))
+    return sql.SQL(", ").join(sql.Identifier(row[0]) for row in cursor.fetchall())
+
+
+def wait_for_headroom(cursor, max_lag, max_active):
+    """
+    Block while replicas are behind by more than max_lag seconds or more
+    than max_active client backends are busy.
+    Returns:
+        seconds spent waiting
+    """
+    waited = 0
+    while True:
+        cursor.execute(LAG_SQL)
+        lag = float(cursor.fetchone()[0])
+        cursor.execute(ACTIVE_SQL)
+        active = cursor.fetchone()[0]
+        cursor.connection.rollback()
+        if lag <= max_lag and active <= max_active:
+            return waited
+        if waited == 0:
+            print(f"  throttling: replication lag {lag:.0f}s, {active} active backends")
+        time.sleep(THROTTLE_SLEEP)
+        waited += THROTTLE_SLEEP
+
+
+def with_retries(conn, work, retries=RETRIES, lock_timeout=LOCK_TIMEOUT):
+    for attempt in range(1, retries + 1):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET LOCAL lock_timeout = %s;", (lock_timeout,))
+                result = work(cursor)
+            conn.commit()
+            return result
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            if attempt == retries:
+                raise
+            delay = min(30, 0.5 * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            print(f"  lock busy, retry {attempt}/{retries - 1} in {delay:.1f}s")
+            time.sleep(delay)
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def install_capture(conn, lock_timeout, retries):
+    with conn.cursor() as cursor:
+        cursor.execute(TRIGGER_EXISTS_SQL)
+        installed = cursor.fetchone() is not None
+    conn.rollback()
+    if installed:
+        print("Change capture trigger already installed, resuming.")
+        return
+    # CREATE TRIGGER briefly blocks writes to contributors
+    with_retries(conn, lambda cursor: cursor.execute(CAPTURE_DDL), retries, lock_timeout)
+    print("Installed change capture trigger on augur_data.contributors.")
+
+
+def copy_rows(conn, columns, batch_size, max_lag, max_active):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass;", (SOURCE,))
+        estimate = max(cursor.fetchone()[0], 0)
+        cursor.execute("SELECT cntrb_id FROM augur_data.contributors_new ORDER BY cntrb_id DESC LIMIT 1;")
+        row = cursor.fetchone()
+        cursor.execute("""
+            SELECT coalesce(sum(greatest(c.reltuples, 0)), 0)::bigint
+            FROM pg_partition_tree(%s::regclass) t
+            JOIN pg_class c ON c.oid = t.relid
+            WHERE t.isleaf;
+        """, (TARGET,))
+        done = cursor.fetchone()[0]
+    conn.rollback()
+
+    after = row[0] if row else "00000000-0000-0000-0000-000000000000"
+    if row:
+        print(f"Resuming copy after {after} (about {done} rows already copied).")
+    print(f"Copying about {estimate} rows in batches of {batch_size}...")
+
+    query = sql.SQL(COPY_BATCH_SQL).format(columns=columns)
+    start = time.perf_counter()
+    copied = 0
+    skipped = 0
+    throttled = 0
+    last_report = start
+    while True:
+        with conn.cursor() as cursor:
+            throttled += wait_for_headroom(cursor, max_lag, max_active)
+            cursor.execute(query, {"after": after, "batch_size": batch_size})
+            count, inserted, last = cursor.fetchone()
+        conn.commit()
+        if not count:
+            break
+        copied += count
+        skipped += count - inserted
+        after = last
+
+        now = time.perf_counter()
+        if now - last_report >= PROGRESS_SECONDS:
+            last_report = now
+            rate = copied / (now - start)
+            remaining = max(estimate - done - copied, 0)
+            eta = format_duration(remaining / rate) if rate else "?"
+            print(f"  {done + copied} / ~{estimate} rows, {rate:,.0f} rows/s, ETA {eta}")
+
+    elapsed = time.perf_counter() - start
+    rate = copied / elapsed if elapsed else 0
+    print(f"Copied {copied} rows in {format_duration(elapsed)} ({rate:,.0f} rows/s, "
+          f"{format_duration(throttled)} throttled).")
+    if skipped:
+        print(f"⚠️  {skipped} rows conflicted with a unique index on {TARGET} and were not copied.")
+
+
+def catch_up_sql(log, source, target, key, key_type, columns):
+    """
+    CATCH_UP_TEMPLATE for one migration; log, source and target are
+    schema.table names.
+    """
+    return sql.SQL(CATCH_UP_TEMPLATE).format(
+        keys=sql.Identifier(f"migration_keys_{key}"),
+        key=sql.Identifier(key),
+        key_type=sql.SQL(key_type),
+        log=sql.Identifier(*log.split(".")),
+        source=sql.Identifier(*source.split(".")),
+        target=sql.Identifier(*target.split(".")),
+        columns=columns
+    )
+
+
+def catch_up(cursor, columns, batch_size):
+    cursor.execute(catch_up_sql(LOG, SOURCE, TARGET, "cntrb_id", "uuid", columns), {"batch_size": batch_size})
+    return cursor.fetchone()[0]
+
+
+def pending_changes(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM augur_data.contributors_migration_log;")
+        pending = cursor.fetchone()[0]
+    conn.rollback()
+    return pending
+
+
+def run_catch_up(conn, columns, batch_size, max_lag, max_active, threshold):
+    """
+    Apply logged changes until fewer than threshold remain. Collection keeps
+    writing meanwhile, so this only has to outpace it, not reach zero.
+    """
+    pending = pending_changes(conn)
+    print(f"Catching up on {pending} logged changes...")
+    start = time.perf_counter()
+    applied = 0
+    while pending >= threshold:
+        with conn.cursor() as cursor:
+            wait_for_headroom(cursor, max_lag, max_active)
+            applied += catch_up(cursor, columns, batch_size)
+        conn.commit()
+        pending = pending_changes(conn)
+    print(f"Re-synced {applied} keys in {format_duration(time.perf_counter() - start)}; {pending} left for cutover.")
+
+
+def cutover(conn, columns, batch_size, move_fks, lock_timeout, retries):
+    moved = []
+
+    def swap(cursor):
+        moved.clear()
+        cursor.execute("LOCK TABLE augur_data.contributors IN EXCLUSIVE MODE;")
+        while catch_up(cursor, columns, batch_size):
+            pass
+        cursor.execute("DROP TRIGGER contributors_migration_capture ON augur_data.contributors;")
+
+        constraints = []
+        if move_fks:
+            # Derived constraints on partitions go with their parent
+            constraints = [con for con in load_constraints(cursor, SOURCE) if not con["derived"]]
+            for con in constraints:
+                cursor.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {};").format(
+                    sql.Identifier(con["schema"], con["table"]), sql.Identifier(con["conname"])
+                ))
+
+        cursor.execute(sql.SQL("ALTER TABLE augur_data.contributors RENAME TO {};").format(sql.Identifier(OLD)))
+        cursor.execute("ALTER TABLE augur_data.contributors_new RENAME TO contributors;")
+
+        # The saved definitions name augur_data.contributors, which is now the new table
+        for con in constraints:
+            definition = con["definition"]
+            not_valid = con["relkind"] != "p" and "NOT VALID" not in definition
+            if not_valid:
+                definition += " NOT VALID"
+            cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} ").format(
+                sql.Identifier(con["schema"], con["table"]), sql.Identifier(con["conname"])
+            ) + sql.SQL(definition))
+            if not_valid:
+                moved.append(con)
+        return len(constraints)
+
+    start = time.perf_counter()
+    count = with_retries(conn, swap, retries, lock_timeout)
+    print(f"Cutover done in {time.perf_counter() - start:.1f}s: augur_data.contributors is now hash partitioned, "
+          f"the old table is augur_data.{OLD}, {count} foreign keys moved.")
+
+    for con in moved:
+        start = time.perf_counter()
+        with_retries(conn, lambda cursor, con=con: cursor.execute(
+            sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {};").format(
+                sql.Identifier(con["schema"], con["table"]), sql.Identifier(con["conname"])
+            )
+        ), retries, lock_timeout)
+        print(f"  validated {con['schema']}.{con['table']} {con['conname']} in {time.perf_counter() - start:.1f}s")
+
+
+def migrate(batch_size=BATCH_SIZE, max_lag=MAX_LAG, max_active=MAX_ACTIVE, threshold=CUTOVER_THRESHOLD,
+            do_cutover=True, move_fks=True, lock_timeout=LOCK_TIMEOUT, retries=RETRIES):
+    config = read_db_config()
+    conn = psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name=APPLICATION_NAME
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s);", (TARGET,))
+            if cursor.fetchone()[0] is None:
+                raise SystemExit(f"{TARGET} does not exist; run steps 1-4 of contributors-hash-partitioned.sql first.")
+            columns = target_columns(cursor)
+        conn.rollback()
+
+        install_capture(conn, lock_timeout, retries)
+        copy_rows(conn, columns, batch_size, max_lag, max_active)
+        run_catch_up(conn, columns, batch_size, max_lag, max_active, threshold)
+        if do_cutover:
+            cutover(conn, columns, batch_size, move_fks, lock_timeout, retries)
+            print(f"✅ Done. Drop augur_data.{OLD} and augur_data.contributors_migration_log once you are happy.")
+        else:
+            print("✅ Copy is caught up. Rerun without --no-cutover to swap the tables.")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Copy augur_data.contributors into contributors_new online and swap them.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"Rows per copy transaction (default: {BATCH_SIZE}).")
+    parser.add_argument("--max-lag", type=float, default=MAX_LAG, help=f"Pause while replication lag is above this many seconds (default: {MAX_LAG}).")
+    parser.add_argument("--max-active", type=int, default=MAX_ACTIVE, help=f"Pause while more client backends than this are active (default: {MAX_ACTIVE}).")
+    parser.add_argument(
+        "--cutover-threshold",
+        type=int,
+        default=CUTOVER_THRESHOLD,
+        help=f"Start the cutover once fewer logged changes than this are left (default: {CUTOVER_THRESHOLD})."
+    )
+    parser.add_argument("--lock-timeout", default=LOCK_TIMEOUT, help=f"lock_timeout for the trigger install and cutover (default: {LOCK_TIMEOUT}).")
+    parser.add_argument("--retries", type=int, default=RETRIES, help=f"Attempts for the trigger install and cutover (default: {RETRIES}).")
+    parser.add_argument("--no-cutover", action="store_true", help="Copy and catch up, but leave the tables as they are.")
+    parser.add_argument("--keep-fks", action="store_true", help="Leave foreign keys on the old table instead of moving them at cutover.")
+    args = parser.parse_args()
+
+    migrate(
+        batch_size=args.batch_size,
+        max_lag=args.max_lag,
+        max_active=args.max_active,
+        threshold=args.cutover_threshold,
+        do_cutover=not args.no_cutover,
+        move_fks=not args.keep_fks,
+        lock_timeout=args.lock_timeout,
+        retries=args.retries
+    )
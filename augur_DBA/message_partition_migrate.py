@@ -0,0 +1,578 @@
+#SPDX-License-Identifier: MIT
+"""
+Move augur_data.message (100M+ rows) to a partitioned table online, the way
+contributors_partition_migrate.py does for contributors.
+
+Two layouts are available:
+
+- hash: HASH (repo_id) over --partitions partitions. Per-repo deletes and
+  updates (more_cowbell) and per-repo min/max lookups (augur_monitor) touch
+  one partition.
+- range: RANGE (msg_timestamp) by quarter or year, plus a DEFAULT partition
+  for NULL, far-future and pre --min-date timestamps. Quarterly counts touch
+  one partition. --extend adds the upcoming partitions later on.
+
+Postgres requires every unique key of a partitioned table to include the
+partition column. The primary key becomes (msg_id, <partition column>), or a
+unique index when that column allows NULLs, and other unique indexes get the
+column appended. Foreign keys from other tables that reference message
+(msg_id) alone cannot point at the new table. They are listed up front and
+only dropped at cutover with --drop-referencing-fks; their definitions are
+saved to a file first.
+
+The copy itself uses a change capture trigger, keyset batches on msg_id with
+throttling, catch-up and a short cutover under lock_timeout. At cutover the
+old table's indexes get an _old suffix and the new ones take over their
+names.
+"""
+import re
+import json
+import time
+import argparse
+from datetime import date, datetime
+import psycopg2
+from psycopg2 import sql
+from contributors_fk_rewrite import load_constraints
+from contributors_partition_migrate import catch_up_sql, format_duration, wait_for_headroom, with_retries
+
+CONFIG_FILE = "db.config.json"
+APPLICATION_NAME = "augur_DBA/message_partition_migrate"
+SCHEMA = "augur_data"
+SOURCE = "message"
+TARGET = "message_new"
+OLD = "message_old"
+KEY = "msg_id"
+LOG = "message_migration_log"
+
+SCHEMES = {
+    "hash": "repo_id",
+    "range": "msg_timestamp",
+}
+PARTITIONS = 64
+INTERVAL = "quarter"
+AHEAD = 4
+MIN_DATE = date(2000, 1, 1)
+
+BATCH_SIZE = 20000
+MAX_LAG = 30
+MAX_ACTIVE = 64
+CUTOVER_THRESHOLD = 1000
+LOCK_TIMEOUT = "3s"
+RETRIES = 10
+PROGRESS_SECONDS = 10
+NAMEDATALEN = 63
+
+CAPTURE_DDL = """
+CREATE TABLE IF NOT EXISTS augur_data.message_migration_log (
+  id bigserial PRIMARY KEY,
+  msg_id bigint NOT NULL
+);
+CREATE OR REPLACE FUNCTION augur_data.message_migration_capture() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    INSERT INTO augur_data.message_migration_log (msg_id) VALUES (OLD.msg_id);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO augur_data.message_migration_log (msg_id) VALUES (NEW.msg_id);
+  END IF;
+  RETURN NULL;
+END $$;
+DROP TRIGGER IF EXISTS message_migration_capture ON augur_data.message;
+CREATE TRIGGER message_migration_capture
+AFTER INSERT OR UPDATE OR DELETE ON augur_data.message
+FOR EACH ROW EXECUTE FUNCTION augur_data.message_migration_capture();
+"""
+
+COPY_BATCH_SQL = """
+WITH batch AS (
+  SELECT {columns} FROM augur_data.message
+  WHERE msg_id > %(after)s
+  ORDER BY msg_id
+  LIMIT %(batch_size)s
+),
+copied AS (
+  INSERT INTO augur_data.message_new ({columns})
+  SELECT {columns} FROM batch
+  ON CONFLICT DO NOTHING
+  RETURNING 1
+)
+SELECT (SELECT count(*) FROM batch), (SELECT count(*) FROM copied), (SELECT max(msg_id) FROM batch);
+"""
+
+INDEXES_SQL = """
+SELECT i.relname, ix.indisunique, pg_get_indexdef(ix.indexrelid)
+FROM pg_index ix
+JOIN pg_class i ON i.oid = ix.indexrelid
+WHERE ix.indrelid = 'augur_data.message'::regclass
+  AND NOT ix.indisprimary;
+"""
+
+OUTGOING_FKS_SQL = """
+SELECT conname, pg_get_constraintdef(oid)
+FROM pg_constraint
+WHERE conrelid = 'augur_data.message'::regclass AND contype = 'f';
+"""
+
+# Indexes of a table, or of the partitions of a partitioned table
+TABLE_INDEXES_SQL = """
+SELECT i.relname
+FROM pg_index ix
+JOIN pg_class i ON i.oid = ix.indexrelid
+WHERE ix.indrelid = %(table)s::regclass
+   OR ix.indrelid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %(table)s::regclass);
+"""
+
+SERIAL_SQL = """
+SELECT a.attname, pg_get_serial_sequence('augur_data.message', a.attname)
+FROM pg_attribute a
+WHERE a.attrelid = 'augur_data.message'::regclass AND a.attnum > 0 AND NOT a.attisdropped
+  AND pg_get_serial_sequence('augur_data.message', a.attname) IS NOT NULL;
+"""
+
+INDEX_HEAD_RE = re.compile(r'^CREATE (UNIQUE )?INDEX (\S+) ON (\S+) (USING \w+ )')
+
+
+def read_db_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+
+def qualified(name):
+    return sql.Identifier(SCHEMA, name)
+
+
+def new_name(name, suffix="_new"):
+    name = f"{name}{suffix}"
+    return name if len(name) <= NAMEDATALEN else name[:NAMEDATALEN]
+
+
+def period_start(day, interval):
+    if interval == "year":
+        return date(day.year, 1, 1)
+    return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+
+
+def next_period(day, interval):
+    if interval == "year":
+        return date(day.year + 1, 1, 1)
+    month = day.month + 3
+    return date(day.year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def partition_suffix(start, interval):
+    return f"p{start.year}" if interval == "year" else f"p{start.year}q{(start.month - 1) // 3 + 1}"
+
+
+def retarget_index(indexdef, name, column, add_column):
+    """
+    Point an index definition from pg_get_indexdef at message_new under a
+    new name, appending the partition column to unique indexes.
+    """
+    m = INDEX_HEAD_RE.match(indexdef)
+    if not m:
+        raise ValueError(f"Cannot parse index definition: {indexdef}")
+    rest = indexdef[m.end():]
+    # Find the parenthesis closing the column list
+    depth = 0
+    for i, ch in enumerate(rest):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                break
+    columns, tail = rest[:i], rest[i:]
+    if add_column and not re.search(rf'\b{column}\b', columns):
+        columns += f", {column}"
+    return f"CREATE {m.group(1) or ''}INDEX {name} ON {SCHEMA}.{TARGET} {m.group(4)}{columns}{tail}"
+
+
+def create_range_partitions(cursor, table, first_day, last_day, interval, tablespace=""):
+    """
+    Create the partitions covering first_day..last_day. Rows of a new range
+    are moved out of the default partition first, since Postgres refuses to
+    create a range the default partition overlaps.
+    """
+    created = 0
+    start = period_start(first_day, interval)
+    while start <= last_day:
+        end = next_period(start, interval)
+        partition = f"{table}_{partition_suffix(start, interval)}"
+        cursor.execute("SELECT to_regclass(%s);", (f"{SCHEMA}.{partition}",))
+        if cursor.fetchone()[0] is None:
+            bounds = {"start": start, "end": end}
+            cursor.execute(sql.SQL("CREATE TEMP TABLE message_moved (LIKE {}) ON COMMIT DROP;").format(qualified(table)))
+            cursor.execute(sql.SQL("""
+                WITH moved AS (
+                  DELETE FROM {} WHERE msg_timestamp >= %(start)s AND msg_timestamp < %(end)s RETURNING *
+                )
+                INSERT INTO message_moved SELECT * FROM moved;
+            """).format(qualified(f"{table}_pdefault")), bounds)
+            cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%(start)s) TO (%(end)s)").format(
+                qualified(partition), qualified(table)
+            ) + sql.SQL(tablespace) + sql.SQL(";"), bounds)
+            cursor.execute(sql.SQL("INSERT INTO {} SELECT * FROM message_moved;").format(qualified(table)))
+            cursor.execute("DROP TABLE message_moved;")
+            created += 1
+        start = end
+    return created
+
+
+def referencing_fks(cursor):
+    return [con for con in load_constraints(cursor, f"{SCHEMA}.{SOURCE}") if not con["derived"]]
+
+
+def build_target(conn, scheme, partitions, interval, ahead, tablespace, min_date=MIN_DATE):
+    column = SCHEMES[scheme]
+    tablespace = f" TABLESPACE {tablespace}" if tablespace else ""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT attnotnull FROM pg_attribute
+            WHERE attrelid = 'augur_data.message'::regclass AND attname = %s;
+        """, (column,))
+        not_null = cursor.fetchone()[0]
+
+        cursor.execute(sql.SQL("""
+            CREATE TABLE {} (LIKE augur_data.message INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS)
+            PARTITION BY {} ({})
+        """).format(qualified(TARGET), sql.SQL(scheme.upper()), sql.Identifier(column)) + sql.SQL(tablespace + ";"))
+
+        if scheme == "hash":
+            for i in range(partitions):
+                cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} FOR VALUES WITH (MODULUS {}, REMAINDER {})").format(
+                    qualified(f"{TARGET}_p{i}"), qualified(TARGET), sql.Literal(partitions), sql.Literal(i)
+                ) + sql.SQL(tablespace + ";"))
+            print(f"Created {TARGET} with {partitions} hash partitions on repo_id.")
+        else:
+            cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} DEFAULT").format(
+                qualified(f"{TARGET}_pdefault"), qualified(TARGET)
+            ) + sql.SQL(tablespace + ";"))
+            cursor.execute("SELECT min(msg_timestamp)::date, max(msg_timestamp)::date FROM augur_data.message;")
+            first_day, last_day = cursor.fetchone()
+            today = date.today()
+            # Rows from before min_date (bad timestamps) go to the default partition
+            first_day = max(first_day or today, min(min_date, today))
+            horizon = today
+            for _ in range(ahead):
+                horizon = next_period(horizon, interval)
+            # Anything past the horizon (bad timestamps) stays in the default partition
+            created = create_range_partitions(cursor, TARGET, first_day, min(max(last_day or today, today), horizon),
+                                              interval, tablespace)
+            print(f"Created {TARGET} with {created} {interval} range partitions on msg_timestamp and a default partition.")
+
+        # Unique keys have to include the partition column
+        if not_null:
+            cursor.execute(sql.SQL("ALTER TABLE {} ADD PRIMARY KEY ({}, {});").format(
+                qualified(TARGET), sql.Identifier(KEY), sql.Identifier(column)
+            ))
+        else:
+            cursor.execute(sql.SQL("CREATE UNIQUE INDEX {} ON {} ({}, {});").format(
+                sql.Identifier(f"{TARGET}_{KEY}_{column}_key"), qualified(TARGET), sql.Identifier(KEY), sql.Identifier(column)
+            ))
+
+        cursor.execute(INDEXES_SQL)
+        for name, unique, indexdef in cursor.fetchall():
+            cursor.execute(retarget_index(indexdef, new_name(name), column, unique))
+            if unique:
+                print(f"  unique index {name} now includes {column}")
+
+        cursor.execute(OUTGOING_FKS_SQL)
+        for name, definition in cursor.fetchall():
+            cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} ").format(qualified(TARGET), sql.Identifier(name))
+                           + sql.SQL(definition + ";"))
+    conn.commit()
+
+
+def target_columns(cursor):
+    cursor.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = 'augur_data.message_new'::regclass AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum;
+    """)
+    return sql.SQL(", ").join(sql.Identifier(row[0]) for row in cursor.fetchall())
+
+
+def copy_rows(conn, columns, batch_size, max_lag, max_active):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT greatest(reltuples, 0)::bigint FROM pg_class WHERE oid = 'augur_data.message'::regclass;")
+        estimate = cursor.fetchone()[0]
+        cursor.execute("SELECT max(msg_id) FROM augur_data.message_new;")
+        after = cursor.fetchone()[0]
+    conn.rollback()
+
+    if after is not None:
+        print(f"Resuming copy after msg_id {after}.")
+    after = after if after is not None else -1
+    print(f"Copying about {estimate} rows in batches of {batch_size}...")
+
+    query = sql.SQL(COPY_BATCH_SQL).format(columns=columns)
+    start = time.perf_counter()
+    copied = skipped = throttled = 0
+    last_report = start
+    while True:
+        with conn.cursor() as cursor:
+            throttled += wait_for_headroom(cursor, max_lag, max_active)
+            cursor.execute(query, {"after": after, "batch_size": batch_size})
+            count, inserted, last = cursor.fetchone()
+        conn.commit()
+        if not count:
+            break
+        copied += count
+        skipped += count - inserted
+        after = last
+
+        now = time.perf_counter()
+        if now - last_report >= PROGRESS_SECONDS:
+            last_report = now
+            rate = copied / (now - start)
+            eta = format_duration(max(estimate - copied, 0) / rate) if rate else "?"
+            print(f"  msg_id {after}: {copied} rows this run, {rate:,.0f} rows/s, ETA {eta}")
+
+    elapsed = time.perf_counter() - start
+    rate = copied / elapsed if elapsed else 0
+    print(f"Copied {copied} rows in {format_duration(elapsed)} ({rate:,.0f} rows/s, "
+          f"{format_duration(throttled)} throttled).")
+    if skipped:
+        print(f"⚠️  {skipped} rows conflicted with a unique index on {TARGET} and were not copied.")
+
+
+def catch_up(cursor, columns, batch_size):
+    cursor.execute(catch_up_sql(f"{SCHEMA}.{LOG}", f"{SCHEMA}.{SOURCE}", f"{SCHEMA}.{TARGET}", KEY, "bigint", columns),
+                   {"batch_size": batch_size})
+    return cursor.fetchone()[0]
+
+
+def pending_changes(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM augur_data.message_migration_log;")
+        pending = cursor.fetchone()[0]
+    conn.rollback()
+    return pending
+
+
+def save_fk_definitions(fks):
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = f"message_dropped_fks_{ts}.sql"
+    with open(path, "w") as f:
+        for con in fks:
+            f.write(f'ALTER TABLE "{con["schema"]}"."{con["table"]}" ADD CONSTRAINT "{con["conname"]}" {con["definition"]};\n')
+    print(f"📄 Definitions of the {len(fks)} referencing foreign keys written to {path}")
+
+
+def rename_indexes(cursor):
+    """
+    After the tables are swapped: move the old table's index names to an _old
+    suffix and give the new table's indexes, <name>_new or message_new_*,
+    the names the old ones had.
+    Returns:
+        number of indexes of the new table renamed
+    """
+    cursor.execute(TABLE_INDEXES_SQL, {"table": f"{SCHEMA}.{OLD}"})
+    old_names = [row[0] for row in cursor.fetchall()]
+    for name in old_names:
+        cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {};").format(qualified(name), sql.Identifier(new_name(name, "_old"))))
+
+    originals = {new_name(name): name for name in old_names}
+    cursor.execute(TABLE_INDEXES_SQL, {"table": f"{SCHEMA}.{SOURCE}"})
+    renamed = 0
+    for (name,) in cursor.fetchall():
+        if name in originals:
+            target = originals[name]
+        elif name.startswith(f"{TARGET}_"):
+            target = SOURCE + name[len(TARGET):]
+        else:
+            continue
+        cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {};").format(qualified(name), sql.Identifier(target)))
+        renamed += 1
+    return renamed
+
+
+def cutover(conn, columns, batch_size, drop_fks, lock_timeout, retries):
+    def swap(cursor):
+        cursor.execute("LOCK TABLE augur_data.message IN EXCLUSIVE MODE;")
+        while catch_up(cursor, columns, batch_size):
+            pass
+        cursor.execute("DROP TRIGGER message_migration_capture ON augur_data.message;")
+
+        fks = referencing_fks(cursor)
+        if fks and not drop_fks:
+            raise SystemExit("Foreign keys reference augur_data.message; rerun with --drop-referencing-fks.")
+        for con in fks:
+            cursor.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {};").format(
+                sql.Identifier(con["schema"], con["table"]), sql.Identifier(con["conname"])
+            ))
+
+        cursor.execute(SERIAL_SQL)
+        sequences = cursor.fetchall()
+
+        cursor.execute(sql.SQL("ALTER TABLE augur_data.message RENAME TO {};").format(sql.Identifier(OLD)))
+        cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {};").format(qualified(TARGET), sql.Identifier(SOURCE)))
+        cursor.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'augur_data.message'::regclass;
+        """)
+        for (partition,) in cursor.fetchall():
+            cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {};").format(
+                qualified(partition), sql.Identifier(SOURCE + partition[len(TARGET):])
+            ))
+        renamed = rename_indexes(cursor)
+
+        # Otherwise dropping message_old would drop the msg_id sequence with it
+        for column, sequence in sequences:
+            cursor.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY augur_data.message.{};").format(
+                sql.SQL(sequence), sql.Identifier(column)
+            ))
+        return len(fks), renamed
+
+    start = time.perf_counter()
+    dropped, renamed = with_retries(conn, swap, retries, lock_timeout)
+    print(f"Cutover done in {time.perf_counter() - start:.1f}s: augur_data.message is now partitioned, "
+          f"the old table is augur_data.{OLD}, {renamed} indexes renamed, {dropped} referencing foreign keys dropped.")
+
+
+def extend(conn, interval, ahead, tablespace):
+    tablespace = f" TABLESPACE {tablespace}" if tablespace else ""
+    horizon = date.today()
+    for _ in range(ahead):
+        horizon = next_period(horizon, interval)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT partstrat FROM pg_partitioned_table WHERE partrelid = 'augur_data.message'::regclass;")
+        row = cursor.fetchone()
+        if row is None or row[0] != "r":
+            raise SystemExit("augur_data.message is not range partitioned.")
+        created = create_range_partitions(cursor, SOURCE, date.today(), horizon, interval, tablespace)
+    conn.commit()
+    print(f"✅ Created {created} partitions through {horizon}.")
+
+
+def migrate(scheme, partitions=PARTITIONS, interval=INTERVAL, ahead=AHEAD, tablespace=None, min_date=MIN_DATE,
+            batch_size=BATCH_SIZE, max_lag=MAX_LAG, max_active=MAX_ACTIVE, threshold=CUTOVER_THRESHOLD,
+            do_cutover=True, drop_fks=False, lock_timeout=LOCK_TIMEOUT, retries=RETRIES):
+    config = read_db_config()
+    conn = psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name=APPLICATION_NAME
+    )
+    try:
+        with conn.cursor() as cursor:
+            fks = referencing_fks(cursor)
+            cursor.execute("SELECT to_regclass('augur_data.message_new');")
+            exists = cursor.fetchone()[0] is not None
+        conn.rollback()
+
+        if fks:
+            print(f"{len(fks)} foreign keys reference augur_data.message; they cannot reference the partitioned table:")
+            for con in fks:
+                print(f"  {con['schema']}.{con['table']} {con['conname']}")
+            if do_cutover and not drop_fks:
+                raise SystemExit("Rerun with --drop-referencing-fks to drop them at cutover, or with --no-cutover.")
+            if do_cutover:
+                save_fk_definitions(fks)
+
+        if exists:
+            print(f"{TARGET} already exists, resuming.")
+        else:
+            build_target(conn, scheme, partitions, interval, ahead, tablespace, min_date)
+
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT 1 FROM pg_trigger
+                WHERE tgrelid = 'augur_data.message'::regclass AND tgname = 'message_migration_capture';
+            """)
+            installed = cursor.fetchone() is not None
+            columns = target_columns(cursor)
+        conn.rollback()
+        if not installed:
+            with_retries(conn, lambda cursor: cursor.execute(CAPTURE_DDL), retries, lock_timeout)
+            print("Installed change capture trigger on augur_data.message.")
+
+        copy_rows(conn, columns, batch_size, max_lag, max_active)
+
+        pending = pending_changes(conn)
+        print(f"Catching up on {pending} logged changes...")
+        while pending >= threshold:
+            with conn.cursor() as cursor:
+                wait_for_headroom(cursor, max_lag, max_active)
+                catch_up(cursor, columns, batch_size)
+            conn.commit()
+            pending = pending_changes(conn)
+
+        if do_cutover:
+            cutover(conn, columns, batch_size, drop_fks, lock_timeout, retries)
+            print(f"✅ Done. Drop augur_data.{OLD} and augur_data.{LOG} once you are happy.")
+        else:
+            print(f"✅ Copy is caught up ({pending} changes pending). Rerun without --no-cutover to swap the tables.")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move augur_data.message to a partitioned table online.")
+    parser.add_argument("--scheme", choices=list(SCHEMES), default="hash", help="hash on repo_id or range on msg_timestamp (default: hash).")
+    parser.add_argument("--partitions", type=int, default=PARTITIONS, help=f"Hash partitions (default: {PARTITIONS}).")
+    parser.add_argument("--interval", choices=["quarter", "year"], default=INTERVAL, help=f"Range partition size (default: {INTERVAL}).")
+    parser.add_argument("--ahead", type=int, default=AHEAD, help=f"Range partitions to create past today (default: {AHEAD}).")
+    parser.add_argument(
+        "--min-date",
+        type=date.fromisoformat,
+        default=MIN_DATE,
+        help=f"First range partition; older msg_timestamps go to the default partition (default: {MIN_DATE})."
+    )
+    parser.add_argument("--tablespace", default=None, help="Tablespace for the new table and its partitions, e.g. speed.")
+    parser.add_argument("--extend", action="store_true", help="Only add upcoming range partitions to an already migrated table.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"Rows per copy transaction (default: {BATCH_SIZE}).")
+    parser.add_argument("--max-lag", type=float, default=MAX_LAG, help=f"Pause while replication lag is above this many seconds (default: {MAX_LAG}).")
+    parser.add_argument("--max-active", type=int, default=MAX_ACTIVE, help=f"Pause while more client backends than this are active (default: {MAX_ACTIVE}).")
+    parser.add_argument(
+        "--cutover-threshold",
+        type=int,
+        default=CUTOVER_THRESHOLD,
+        help=f"Start the cutover once fewer logged changes than this are left (default: {CUTOVER_THRESHOLD})."
+    )
+    parser.add_argument("--lock-timeout", default=LOCK_TIMEOUT, help=f"lock_timeout for the trigger install and cutover (default: {LOCK_TIMEOUT}).")
+    parser.add_argument("--retries", type=int, default=RETRIES, help=f"Attempts for the trigger install and cutover (default: {RETRIES}).")
+    parser.add_argument("--no-cutover", action="store_true", help="Copy and catch up, but leave the tables as they are.")
+    parser.add_argument(
+        "--drop-referencing-fks",
+        action="store_true",
+        help="Drop the foreign keys that reference message (msg_id) at cutover; their definitions are saved to a file."
+    )
+    args = parser.parse_args()
+
+    if args.extend:
+        config = read_db_config()
+        conn = psycopg2.connect(
+            host=config['host'],
+            port=config['port'],
+            dbname=config['dbname'],
+            user=config['user'],
+            password=config['password'],
+            application_name=APPLICATION_NAME
+        )
+        try:
+            extend(conn, args.interval, args.ahead, args.tablespace)
+        finally:
+            conn.close()
+    else:
+        migrate(
+            args.scheme,
+            partitions=args.partitions,
+            interval=args.interval,
+            ahead=args.ahead,
+            tablespace=args.tablespace,
+            min_date=args.min_date,
+            batch_size=args.batch_size,
+            max_lag=args.max_lag,
+            max_active=args.max_active,
+            threshold=args.cutover_threshold,
+            do_cutover=not args.no_cutover,
+            drop_fks=args.drop_referencing_fks,
+            lock_timeout=args.lock_timeout,
+            retries=args.retries
+        )
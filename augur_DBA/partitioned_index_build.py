@@ -0,0 +1,262 @@
+#SPDX-License-Identifier: MIT
+"""
+Build an index on a partitioned table (augur_data.contributors after hash
+partitioning, or any other) without blocking writes.
+
+A plain CREATE INDEX on the parent locks out writes to every partition until
+the whole build is done. Instead, each partition gets its own index built
+with CREATE INDEX CONCURRENTLY, several partitions at a time. Then the parent
+index is created ON ONLY the parent, which is instant, and each partition
+index is attached to it. The parent index becomes valid once the last one is
+attached. Sub-partitioned tables are handled level by level.
+
+Reruns are safe. Partition indexes that already exist and are valid are
+kept. Invalid ones left by an interrupted CONCURRENTLY build are dropped and
+built again.
+"""
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import psycopg2
+import psycopg2.pool
+import psycopg2.errors
+from psycopg2 import sql
+
+CONFIG_FILE = "db.config.json"
+APPLICATION_NAME = "augur_DBA/partitioned_index_build"
+MAX_WORKERS = 4
+LOCK_TIMEOUT = "5s"
+RETRIES = 10
+NAMEDATALEN = 63
+
+TREE_SQL = """
+SELECT t.relid::regclass::text, c.relname, n.nspname, t.parentrelid::regclass::text, t.isleaf, t.level
+FROM pg_partition_tree(%s::regclass) t
+JOIN pg_class c ON c.oid = t.relid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+ORDER BY t.level DESC, c.relname;
+"""
+
+# Indexes with the given name in the given schema, with their validity and
+# whether they are already attached to a parent index
+INDEX_STATE_SQL = """
+SELECT
+  i.relname,
+  ix.indisvalid,
+  EXISTS (SELECT 1 FROM pg_inherits inh WHERE inh.inhrelid = i.oid) AS attached
+FROM pg_class i
+JOIN pg_index ix ON ix.indexrelid = i.oid
+JOIN pg_namespace n ON n.oid = i.relnamespace
+WHERE n.nspname = %s AND (i.relname = %s OR i.relname LIKE %s);
+"""
+
+
+def read_db_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+
+def partition_index_name(partition, index):
+    name = f"{partition}_{index}"
+    if len(name) > NAMEDATALEN:
+        digest = hashlib.md5(name.encode()).hexdigest()[:8]
+        name = f"{name[:NAMEDATALEN - 9]}_{digest}"
+    return name
+
+
+def index_state(cursor, schema, name):
+    """
+    Returns:
+        (valid: bool | None, attached: bool, leftovers: [names]) where valid
+        is None if the index does not exist. Leftovers are *_ccnew indexes
+        from an interrupted REINDEX CONCURRENTLY.
+    """
+    cursor.execute(INDEX_STATE_SQL, (schema, name, name[:NAMEDATALEN - 6] + "_ccnew%"))
+    valid, attached, leftovers = None, False, []
+    for relname, is_valid, is_attached in cursor.fetchall():
+        if relname == name:
+            valid, attached = is_valid, is_attached
+        else:
+            leftovers.append(relname)
+    return valid, attached, leftovers
+
+
+def run_ddl(conn, statement, lock_timeout=LOCK_TIMEOUT, retries=RETRIES):
+    """
+    Run one autocommit DDL statement, retrying with backoff if it cannot get
+    its lock within lock_timeout.
+    """
+    for attempt in range(1, retries + 1):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET lock_timeout = %s;", (lock_timeout,))
+                cursor.execute(statement)
+            return
+        except psycopg2.errors.LockNotAvailable:
+            if attempt == retries:
+                raise
+            delay = min(30, 0.5 * 2 ** (attempt - 1))
+            print(f"  lock busy, retry {attempt}/{retries - 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def build_partition_index(pool, schema, partition, name, spec, unique, retries):
+    """
+    Build (or rebuild, if invalid) one partition's index concurrently.
+    Returns:
+        (status, seconds)
+    """
+    conn = pool.getconn()
+    start = time.perf_counter()
+    # CONCURRENTLY builds wait for older transactions to finish. A
+    # lock_timeout would abort them half way and leave an invalid index, so
+    # they wait as long as it takes; they never block reads or writes.
+    no_timeout = "0"
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            valid, _, leftovers = index_state(cursor, schema, name)
+        for leftover in leftovers:
+            run_ddl(conn, sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {};").format(sql.Identifier(schema, leftover)),
+                    no_timeout, retries)
+        if valid:
+            return "kept", time.perf_counter() - start
+        status = "built"
+        if valid is False:
+            run_ddl(conn, sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {};").format(sql.Identifier(schema, name)),
+                    no_timeout, retries)
+            status = "rebuilt invalid"
+        run_ddl(conn, sql.SQL("CREATE {}INDEX CONCURRENTLY {} ON {} ").format(
+            sql.SQL("UNIQUE " if unique else ""), sql.Identifier(name), sql.Identifier(schema, partition)
+        ) + sql.SQL(spec), no_timeout, retries)
+        return status, time.perf_counter() - start
+    finally:
+        conn.autocommit = False
+        pool.putconn(conn)
+
+
+def attach_level(conn, parent_schema, parent, parent_index, children, spec, unique, lock_timeout, retries):
+    """
+    Create parent_index ON ONLY parent and attach each child's index to it.
+    children is a list of (schema, child index name).
+    """
+    run_ddl(conn, sql.SQL("CREATE {}INDEX IF NOT EXISTS {} ON ONLY {} ").format(
+        sql.SQL("UNIQUE " if unique else ""), sql.Identifier(parent_index), sql.Identifier(parent_schema, parent)
+    ) + sql.SQL(spec), lock_timeout, retries)
+    attached = 0
+    for schema, child_index in children:
+        with conn.cursor() as cursor:
+            _, is_attached, _ = index_state(cursor, schema, child_index)
+        if is_attached:
+            continue
+        run_ddl(conn, sql.SQL("ALTER INDEX {} ATTACH PARTITION {};").format(
+            sql.Identifier(parent_schema, parent_index), sql.Identifier(schema, child_index)
+        ), lock_timeout, retries)
+        attached += 1
+    return attached
+
+
+def build_index(table, name, spec, unique=False, workers=MAX_WORKERS, lock_timeout=LOCK_TIMEOUT,
+                retries=RETRIES, dry_run=False):
+    if ";" in spec:
+        raise ValueError("The index definition must be a single clause, e.g. \"USING btree (gh_login)\".")
+    config = read_db_config()
+    pool = psycopg2.pool.ThreadedConnectionPool(
+        1,
+        max(workers, 1) + 1,
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name=APPLICATION_NAME
+    )
+    start = time.perf_counter()
+    conn = pool.getconn()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(TREE_SQL, (table,))
+            tree = cursor.fetchall()
+        if len(tree) < 2:
+            raise SystemExit(f"{table} has no partitions; use a plain CREATE INDEX CONCURRENTLY.")
+
+        root = next(row for row in tree if row[5] == 0)
+        index_names = {row[0]: name if row[0] == root[0] else partition_index_name(row[1], name) for row in tree}
+        leaves = [row for row in tree if row[4]]
+        print(f"{table}: {len(leaves)} partitions, index {name} {spec}")
+        if dry_run:
+            for relid, relname, schema, _, _, _ in leaves:
+                with conn.cursor() as cursor:
+                    valid, attached, leftovers = index_state(cursor, schema, index_names[relid])
+                state = "missing" if valid is None else ("valid" if valid else "INVALID")
+                print(f"  {relid}: {index_names[relid]} {state}{', attached' if attached else ''}"
+                      f"{f', leftovers {leftovers}' if leftovers else ''}")
+            return
+
+        failed = []
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = {
+                executor.submit(build_partition_index, pool, schema, relname, index_names[relid], spec, unique,
+                                retries): relid
+                for relid, relname, schema, _, _, _ in leaves
+            }
+            for future in as_completed(futures):
+                relid = futures[future]
+                done += 1
+                try:
+                    status, elapsed = future.result()
+                    print(f"[{done}/{len(leaves)}] {relid}: {status} in {elapsed:.1f}s")
+                except Exception as e:
+                    failed.append(relid)
+                    print(f"❌ [{done}/{len(leaves)}] {relid} failed: {e}".strip())
+        if failed:
+            raise SystemExit(f"{len(failed)} partition indexes failed; rerun to retry them. Nothing was attached.")
+
+        # Deepest partitioned tables first, so every child index exists
+        # before it is attached to its parent's
+        for relid, relname, schema, _, isleaf, _ in tree:
+            if isleaf:
+                continue
+            children = [(row[2], index_names[row[0]]) for row in tree if row[3] == relid]
+            attached = attach_level(conn, schema, relname, index_names[relid], children, spec, unique,
+                                    lock_timeout, retries)
+            print(f"{relid}: {index_names[relid]} has {attached} newly attached partition indexes")
+
+        with conn.cursor() as cursor:
+            valid, _, _ = index_state(cursor, root[2], name)
+        if valid:
+            print(f"✅ {name} is valid on {table} ({time.perf_counter() - start:.1f}s)")
+        else:
+            print(f"⚠️  {name} is not valid yet; some partition still lacks an attached index.")
+    finally:
+        conn.autocommit = False
+        pool.putconn(conn)
+        pool.closeall()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build an index on a partitioned table, partition by partition, with CREATE INDEX CONCURRENTLY.")
+    parser.add_argument("--table", default="augur_data.contributors", help="Partitioned table (default: augur_data.contributors).")
+    parser.add_argument("--name", required=True, help="Name of the parent index. Partition indexes are named <partition>_<name>.")
+    parser.add_argument("--index", required=True, help="Everything after the table name, e.g. \"USING btree (gh_login)\".")
+    parser.add_argument("--unique", action="store_true", help="Build a unique index (it must include the partition key).")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help=f"Partition indexes to build at once (default: {MAX_WORKERS}).")
+    parser.add_argument("--lock-timeout", default=LOCK_TIMEOUT, help=f"lock_timeout for creating and attaching the parent index (default: {LOCK_TIMEOUT}).")
+    parser.add_argument("--retries", type=int, default=RETRIES, help=f"Attempts per DDL statement (default: {RETRIES}).")
+    parser.add_argument("--dry-run", action="store_true", help="Show each partition's index state and exit.")
+    args = parser.parse_args()
+
+    build_index(
+        args.table,
+        args.name,
+        args.index,
+        unique=args.unique,
+        workers=args.workers,
+        lock_timeout=args.lock_timeout,
+        retries=args.retries,
+        dry_run=args.dry_run
+    )
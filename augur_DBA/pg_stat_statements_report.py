@@ -0,0 +1,343 @@
+#SPDX-License-Identifier: MIT
+"""
+Find out which utility uses the database: pg_stat_statements snapshots and
+deltas.
+
+pg_stat_statements only has running totals since the last reset, so this
+takes snapshots (`snapshot`, from cron, or `run`, which loops) into a local
+SQLite file and reports on the difference between them. A counter that went
+down means the statistics were reset, and the later value counts from zero.
+
+pg_stat_statements does not record who ran a query, but pg_stat_activity
+does. Every snapshot, and with `run` every --activity-interval seconds in
+between, the query_id and application_name of each active session are
+recorded. Each fingerprint is tagged with the application names seen
+running it. The utility scripts in this repository set application_name to
+<directory>/<script>, e.g. more_cowbell/generate_delete_only. query_id in
+pg_stat_activity needs compute_query_id (on by default with
+pg_stat_statements loaded, Postgres 14+).
+
+From Postgres 14 on, pg_stat_statements keeps top-level statements and
+statements run inside functions apart (toplevel), so the same queryid can
+have two rows. Older versions have one row, stored as top-level.
+
+The report ranks fingerprints by execution time, shared blocks read and
+temp blocks written over the window, and sums each per application_name.
+"""
+import re
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+import psycopg2
+
+CONFIG_FILE = "db.config.json"
+APPLICATION_NAME = "augur_DBA/pg_stat_statements_report"
+STORE = "pg_stat_statements.sqlite"
+SNAPSHOT_MINUTES = 15
+ACTIVITY_SECONDS = 5
+TOP = 15
+QUERY_WIDTH = 90
+BLOCK_SIZE = 8192
+
+# {toplevel} is the toplevel column, or true where pg_stat_statements has none
+STATEMENTS_SQL = """
+SELECT queryid, dbid, userid, {toplevel}, query, calls, total_exec_time + total_plan_time, rows,
+       shared_blks_hit, shared_blks_read, temp_blks_read, temp_blks_written
+FROM pg_stat_statements
+WHERE queryid IS NOT NULL;
+"""
+
+TOPLEVEL_SQL = """
+SELECT EXISTS (
+  SELECT 1 FROM pg_attribute
+  WHERE attrelid = 'pg_stat_statements'::regclass AND attname = 'toplevel' AND NOT attisdropped
+);
+"""
+
+ACTIVITY_SQL = """
+SELECT query_id, coalesce(nullif(application_name, ''), usename::text, '?')
+FROM pg_stat_activity
+WHERE state = 'active' AND query_id IS NOT NULL AND pid <> pg_backend_pid();
+"""
+
+STORE_DDL = """
+CREATE TABLE IF NOT EXISTS snapshots (
+  id INTEGER PRIMARY KEY,
+  taken_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+  queryid INTEGER PRIMARY KEY,
+  query TEXT
+);
+CREATE TABLE IF NOT EXISTS counters (
+  snapshot_id INTEGER NOT NULL,
+  queryid INTEGER NOT NULL,
+  dbid INTEGER NOT NULL,
+  userid INTEGER NOT NULL,
+  toplevel INTEGER NOT NULL DEFAULT 1,
+  calls INTEGER,
+  total_ms REAL,
+  rows INTEGER,
+  blks_hit INTEGER,
+  blks_read INTEGER,
+  temp_read INTEGER,
+  temp_written INTEGER,
+  PRIMARY KEY (snapshot_id, queryid, dbid, userid, toplevel)
+);
+CREATE TABLE IF NOT EXISTS applications (
+  queryid INTEGER NOT NULL,
+  application_name TEXT NOT NULL,
+  seen INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (queryid, application_name)
+);
+"""
+
+COUNTERS = ("calls", "total_ms", "rows", "blks_hit", "blks_read", "temp_read", "temp_written")
+RANKINGS = {
+    "time": ("total_ms", "execution time"),
+    "reads": ("blks_read", "shared blocks read"),
+    "temp": ("temp_written", "temp blocks written"),
+}
+DURATION_RE = re.compile(r"^(\d+(?:\.\d+)?)([mhd])$")
+UNITS = {"m": 60, "h": 3600, "d": 86400}
+SPACE_RE = re.compile(r"\s+")
+
+
+def read_db_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+
+def connect():
+    config = read_db_config()
+    conn = psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name=APPLICATION_NAME
+    )
+    conn.autocommit = True
+    return conn
+
+
+def open_store(path):
+    store = sqlite3.connect(path)
+    columns = [row[1] for row in store.execute("PRAGMA table_info(counters);")]
+    if columns and "toplevel" not in columns:
+        # Stores from before toplevel was recorded: the key changes, so copy the rows over
+        store.execute("ALTER TABLE counters RENAME TO counters_old;")
+        store.executescript(STORE_DDL)
+        store.execute(f"INSERT INTO counters (snapshot_id, queryid, dbid, userid, {', '.join(COUNTERS)}) "
+                      f"SELECT snapshot_id, queryid, dbid, userid, {', '.join(COUNTERS)} FROM counters_old;")
+        store.execute("DROP TABLE counters_old;")
+        store.commit()
+    store.executescript(STORE_DDL)
+    return store
+
+
+def parse_duration(text):
+    m = DURATION_RE.match(text)
+    if not m:
+        raise argparse.ArgumentTypeError(f"expected a duration like 90m, 24h or 7d, got {text}")
+    return timedelta(seconds=float(m.group(1)) * UNITS[m.group(2)])
+
+
+def short(text, width=QUERY_WIDTH):
+    text = SPACE_RE.sub(" ", text or "").strip()
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+def pretty_blocks(blocks):
+    size = blocks * BLOCK_SIZE
+    for unit in ("B", "kB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def sample_activity(cursor, store):
+    cursor.execute(ACTIVITY_SQL)
+    rows = cursor.fetchall()
+    store.executemany("""
+        INSERT INTO applications (queryid, application_name, seen) VALUES (?, ?, 1)
+        ON CONFLICT (queryid, application_name) DO UPDATE SET seen = seen + 1;
+    """, rows)
+    store.commit()
+    return len(rows)
+
+
+def statements_sql(cursor):
+    cursor.execute(TOPLEVEL_SQL)
+    return STATEMENTS_SQL.format(toplevel="toplevel" if cursor.fetchone()[0] else "true")
+
+
+def take_snapshot(cursor, store):
+    cursor.execute(statements_sql(cursor))
+    rows = cursor.fetchall()
+    snapshot_id = store.execute("INSERT INTO snapshots (taken_at) VALUES (?);",
+                                (datetime.now().isoformat(timespec="seconds"),)).lastrowid
+    store.executemany("INSERT OR IGNORE INTO queries (queryid, query) VALUES (?, ?);",
+                      {(row[0], row[4]) for row in rows})
+    store.executemany(
+        "INSERT OR REPLACE INTO counters (snapshot_id, queryid, dbid, userid, toplevel, "
+        f"{', '.join(COUNTERS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
+        [(snapshot_id, queryid, dbid, userid, int(toplevel), calls, float(total_ms), n_rows, hit, read, temp_read,
+          temp_written)
+         for queryid, dbid, userid, toplevel, _, calls, total_ms, n_rows, hit, read, temp_read, temp_written in rows]
+    )
+    store.commit()
+    sample_activity(cursor, store)
+    print(f"Snapshot {snapshot_id}: {len(rows)} statements")
+    return snapshot_id
+
+
+def run(store_path, every, activity_interval):
+    store = open_store(store_path)
+    conn = connect()
+    print(f"Snapshot every {every.total_seconds() / 60:.0f} minutes, activity every {activity_interval}s. Ctrl-C to stop.")
+    try:
+        while True:
+            with conn.cursor() as cursor:
+                take_snapshot(cursor, store)
+                next_snapshot = time.time() + every.total_seconds()
+                while time.time() < next_snapshot:
+                    time.sleep(min(activity_interval, max(0, next_snapshot - time.time())))
+                    sample_activity(cursor, store)
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        conn.close()
+        store.close()
+
+
+def deltas(store, since):
+    """
+    Sum the increase of every counter between consecutive snapshots in the
+    window, per fingerprint.
+    Returns:
+        ({queryid: {counter: delta}}, first snapshot time, last snapshot time)
+    """
+    snapshots = store.execute("SELECT id, taken_at FROM snapshots WHERE taken_at >= ? ORDER BY id;",
+                              (since.isoformat(timespec="seconds"),)).fetchall()
+    # The snapshot just before the window is the baseline
+    before = store.execute("SELECT id, taken_at FROM snapshots WHERE taken_at < ? ORDER BY id DESC LIMIT 1;",
+                           (since.isoformat(timespec="seconds"),)).fetchone()
+    if before:
+        snapshots.insert(0, before)
+    if len(snapshots) < 2:
+        return {}, None, None
+
+    totals = {}
+    previous = None
+    for snapshot_id, _ in snapshots:
+        current = {
+            row[:4]: row[4:]
+            for row in store.execute(f"SELECT queryid, dbid, userid, toplevel, {', '.join(COUNTERS)} "
+                                     "FROM counters WHERE snapshot_id = ?;", (snapshot_id,))
+        }
+        if previous is not None:
+            for key, values in current.items():
+                old = previous.get(key)
+                # A missing entry (evicted or new) or a smaller counter means it started again from zero
+                if old is None or values[0] < old[0]:
+                    old = (0,) * len(COUNTERS)
+                summed = totals.setdefault(key[0], dict.fromkeys(COUNTERS, 0))
+                for name, new_value, old_value in zip(COUNTERS, values, old):
+                    summed[name] += max(0, new_value - old_value)
+        previous = current
+    return totals, snapshots[0][1], snapshots[-1][1]
+
+
+def tags(store):
+    """
+    Returns:
+        {queryid: [(application_name, seen)], most seen first}
+    """
+    tagged = {}
+    for queryid, application_name, seen in store.execute(
+            "SELECT queryid, application_name, seen FROM applications ORDER BY seen DESC;"):
+        tagged.setdefault(queryid, []).append((application_name, seen))
+    return tagged
+
+
+def report(store_path, since, top, order):
+    store = open_store(store_path)
+    try:
+        totals, first, last = deltas(store, datetime.now() - since)
+        if not totals:
+            print("Need at least two snapshots in the window; run `snapshot` (or `run`) first.")
+            return
+        queries = dict(store.execute("SELECT queryid, query FROM queries;"))
+        tagged = tags(store)
+        print(f"pg_stat_statements deltas from {first} to {last}, {len(totals)} fingerprints")
+
+        by_application = {}
+        for queryid, summed in totals.items():
+            name = tagged[queryid][0][0] if queryid in tagged else "?"
+            per = by_application.setdefault(name, dict.fromkeys(COUNTERS, 0))
+            for counter in COUNTERS:
+                per[counter] += summed[counter]
+
+        print("\nPer application_name (fingerprints tagged by the application_name seen running them most):")
+        print(f"{'application_name':<44} {'calls':>12} {'time s':>12} {'read':>10} {'temp':>10}")
+        for name, per in sorted(by_application.items(), key=lambda item: item[1]["total_ms"], reverse=True):
+            print(f"{short(name, 44):<44} {per['calls']:>12} {per['total_ms'] / 1000:>12.1f} "
+                  f"{pretty_blocks(per['blks_read']):>10} {pretty_blocks(per['temp_written']):>10}")
+
+        for ranking in order:
+            counter, label = RANKINGS[ranking]
+            ranked = sorted(totals.items(), key=lambda item: item[1][counter], reverse=True)[:top]
+            print(f"\nTop {top} by {label}:")
+            print(f"{'calls':>10} {'time s':>10} {'ms/call':>9} {'read':>10} {'hit %':>6} {'temp':>10}  application / query")
+            for queryid, summed in ranked:
+                if not summed[counter]:
+                    break
+                calls = summed["calls"]
+                accessed = summed["blks_hit"] + summed["blks_read"]
+                hit = 100 * summed["blks_hit"] / accessed if accessed else 100
+                apps = ", ".join(name for name, _ in tagged.get(queryid, [])[:2]) or "?"
+                print(f"{calls:>10} {summed['total_ms'] / 1000:>10.1f} {summed['total_ms'] / calls if calls else 0:>9.1f} "
+                      f"{pretty_blocks(summed['blks_read']):>10} {hit:>6.1f} {pretty_blocks(summed['temp_written']):>10}  "
+                      f"[{apps}] {short(queries.get(queryid))}")
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Snapshot pg_stat_statements and report which queries and utilities use the database.")
+    parser.add_argument("--store", default=STORE, help=f"SQLite file for the snapshots (default: {STORE}).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("snapshot", help="Take one snapshot (for cron).")
+
+    run_parser = commands.add_parser("run", help="Take snapshots until stopped, sampling activity in between.")
+    run_parser.add_argument("--every", type=parse_duration, default=timedelta(minutes=SNAPSHOT_MINUTES),
+                            help=f"Time between snapshots, e.g. 15m or 1h (default: {SNAPSHOT_MINUTES}m).")
+    run_parser.add_argument("--activity-interval", type=float, default=ACTIVITY_SECONDS,
+                            help=f"Seconds between pg_stat_activity samples (default: {ACTIVITY_SECONDS}).")
+
+    report_parser = commands.add_parser("report", help="Rank fingerprints by their deltas over a window.")
+    report_parser.add_argument("--since", type=parse_duration, default=parse_duration("24h"), help="Window, e.g. 90m, 24h, 7d (default: 24h).")
+    report_parser.add_argument("--top", type=int, default=TOP, help=f"Fingerprints per ranking (default: {TOP}).")
+    report_parser.add_argument("--order", nargs="+", choices=list(RANKINGS), default=list(RANKINGS),
+                               help="Rankings to print (default: time reads temp).")
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        conn = connect()
+        store = open_store(args.store)
+        try:
+            with conn.cursor() as cursor:
+                take_snapshot(cursor, store)
+        finally:
+            store.close()
+            conn.close()
+    elif args.command == "run":
+        run(args.store, args.every, args.activity_interval)
+    else:
+        report(args.store, args.since, args.top, args.order)
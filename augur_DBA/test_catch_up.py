@@ -0,0 +1,59 @@
+#SPDX-License-Identifier: MIT
+"""
+Runs the migration catch-up against the database in db.config.json, on
+temporary tables only. Skipped when psycopg2 or the config is missing.
+
+    cd augur_DBA && python -m pytest -q test_catch_up.py
+"""
+import os
+import json
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+from psycopg2 import sql
+from contributors_partition_migrate import CONFIG_FILE, catch_up_sql
+
+
+@pytest.fixture
+def conn():
+    if not os.path.exists(CONFIG_FILE):
+        pytest.skip(f"no {CONFIG_FILE}")
+    with open(CONFIG_FILE, 'r') as f:
+        config = json.load(f)
+    conn = psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name="augur_DBA/test_catch_up"
+    )
+    yield conn
+    conn.rollback()
+    conn.close()
+
+
+def test_catch_up_passes_in_one_transaction(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TEMP TABLE catch_up_source (k bigint PRIMARY KEY, v text);
+            CREATE TEMP TABLE catch_up_target (LIKE catch_up_source);
+            CREATE TEMP TABLE catch_up_log (id bigserial PRIMARY KEY, k bigint NOT NULL);
+            INSERT INTO catch_up_source SELECT i, 'new ' || i FROM generate_series(1, 4) i;
+            INSERT INTO catch_up_target VALUES (1, 'old 1'), (5, 'old 5');
+            INSERT INTO catch_up_log (k) VALUES (1), (2), (3), (4), (5);
+        """)
+        query = catch_up_sql("pg_temp.catch_up_log", "pg_temp.catch_up_source", "pg_temp.catch_up_target",
+                             "k", "bigint", sql.SQL("k, v"))
+
+        # The way cutover calls it: passes until the log is empty, no commit in between
+        passes = []
+        while True:
+            cursor.execute(query, {"batch_size": 2})
+            passes.append(cursor.fetchone()[0])
+            if not passes[-1]:
+                break
+
+        assert passes == [2, 2, 1, 0]
+        cursor.execute("SELECT k, v FROM catch_up_target ORDER BY k;")
+        assert cursor.fetchall() == [(1, "new 1"), (2, "new 2"), (3, "new 3"), (4, "new 4")]
@@ -0,0 +1,248 @@
+#SPDX-License-Identifier: MIT
+import os
+import json
+import time
+import shutil
+import argparse
+from pathlib import Path
+import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.ipc as ipc
+
+CONFIG_FILE = "db.config.json"
+APPLICATION_NAME = "augur_datamart/datamart-export"
+MANIFEST_FILE = "_manifest.json"
+BATCH_SIZE = 50000
+
+DATAMART_TABLES = [
+    "dm_repo_annual",
+    "dm_repo_monthly",
+    "dm_repo_weekly",
+    "dm_repo_group_annual",
+    "dm_repo_group_monthly",
+    "dm_repo_group_weekly",
+]
+
+# Postgres type OIDs -> Arrow types. Anything not listed is exported as text.
+PG_TO_ARROW = {
+    16: pa.bool_(),
+    20: pa.int64(),
+    21: pa.int64(),
+    23: pa.int64(),
+    700: pa.float64(),
+    701: pa.float64(),
+    1700: pa.float64(),
+    1082: pa.date32(),
+    1114: pa.timestamp("us"),
+    1184: pa.timestamp("us", tz="UTC"),
+}
+
+# Order-independent fingerprint of each year's rows, computed server-side so
+# we only pull the years whose content changed since the last export.
+FINGERPRINT_SQL = """
+SELECT t.year, count(*), sum(hashtextextended(t::text, 0))::text
+FROM augur_data.{table} t
+GROUP BY t.year;
+"""
+
+
+def read_db_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+
+def load_manifest(out_dir):
+    path = out_dir / MANIFEST_FILE
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir, manifest):
+    tmp = out_dir / f"{MANIFEST_FILE}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, out_dir / MANIFEST_FILE)
+
+
+def partition_key(year):
+    return "unknown" if year is None else str(int(year))
+
+
+def arrow_value(value, arrow_type):
+    if value is None:
+        return None
+    if pa.types.is_floating(arrow_type):
+        return float(value)
+    if pa.types.is_string(arrow_type) and not isinstance(value, str):
+        return str(value)
+    return value
+
+
+class PartitionWriter:
+    """
+    Streams record batches for one year into a temp file and moves it into
+    place on close, so readers never see a half-written partition.
+    """
+
+    def __init__(self, path, schema, file_format):
+        self.path = path
+        self.tmp_path = path.with_name(path.name + ".tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.schema = schema
+        self.rows = []
+        self.count = 0
+        if file_format == "parquet":
+            self.writer = pq.ParquetWriter(self.tmp_path, schema, compression="zstd")
+        else:
+            self.writer = ipc.new_file(
+                str(self.tmp_path), schema, options=ipc.IpcWriteOptions(compression="zstd")
+            )
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        columns = list(zip(*self.rows))
+        arrays = [
+            pa.array([arrow_value(v, field.type) for v in column], type=field.type)
+            for column, field in zip(columns, self.schema)
+        ]
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.count += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+        return self.count
+
+
+def export_table(conn, table, out_dir, manifest, file_format="parquet", full=False):
+    extension = "parquet" if file_format == "parquet" else "arrow"
+    table_dir = out_dir / table
+    previous = {} if full else manifest.get(table, {})
+
+    with conn.cursor() as cursor:
+        cursor.execute(FINGERPRINT_SQL.format(table=table))
+        current = {partition_key(year): f"{count}:{digest}" for year, count, digest in cursor.fetchall()}
+
+    changed = [
+        key for key, fingerprint in current.items()
+        if previous.get(key) != fingerprint
+        or not (table_dir / f"year={key}" / f"part.{extension}").exists()
+    ]
+    # Years dropped since the last export, and with --full (no previous
+    # manifest to go by) any year directory left on disk
+    on_disk = {path.name[len("year="):] for path in table_dir.glob("year=*") if path.is_dir()}
+    removed = sorted((set(previous) | on_disk) - set(current))
+
+    for key in removed:
+        shutil.rmtree(table_dir / f"year={key}", ignore_errors=True)
+
+    if not changed:
+        print(f"{table}: no partitions changed.")
+        manifest[table] = current
+        return 0
+
+    print(f"{table}: exporting {len(changed)} of {len(current)} year partitions...")
+    years = [int(key) for key in changed if key != "unknown"]
+    where = "t.year = ANY(%s)"
+    if "unknown" in changed:
+        where = f"({where} OR t.year IS NULL)"
+
+    start = time.perf_counter()
+    rows = 0
+    writer, writer_key = None, None
+    # A named cursor keeps the result set on the server. Rows come ordered by
+    # year, so only one partition is open at a time and we only ever hold one
+    # fetch of rows plus one pending batch.
+    with conn.cursor(name=f"export_{table}") as cursor:
+        cursor.itersize = BATCH_SIZE
+        cursor.execute(f"SELECT * FROM augur_data.{table} t WHERE {where} ORDER BY t.year NULLS LAST;", (years,))
+        schema = None
+        year_index = None
+        for row in cursor:
+            if schema is None:
+                # year lives in the partition path, not in the files, so
+                # hive-style readers do not see it twice
+                columns = [col for col in cursor.description if col.name != "year"]
+                schema = pa.schema([
+                    pa.field(col.name, PG_TO_ARROW.get(col.type_code, pa.string()))
+                    for col in columns
+                ])
+                year_index = [col.name for col in cursor.description].index("year")
+            key = partition_key(row[year_index])
+            if key != writer_key:
+                if writer is not None:
+                    rows += writer.close()
+                path = table_dir / f"year={key}" / f"part.{extension}"
+                writer, writer_key = PartitionWriter(path, schema, file_format), key
+            writer.add(row[:year_index] + row[year_index + 1:])
+
+    if writer is not None:
+        rows += writer.close()
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    rate = rows / elapsed if elapsed else 0
+    print(f"✅ {table}: {rows} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)")
+
+    manifest[table] = current
+    return rows
+
+
+def main(tables, out_dir, file_format="parquet", full=False):
+    config = read_db_config()
+    conn = psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name=APPLICATION_NAME
+    )
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(out_dir)
+
+    try:
+        for table in tables:
+            export_table(conn, table, out_dir, manifest, file_format, full)
+            # Saved after every table so an interrupted export keeps its progress
+            save_manifest(out_dir, manifest)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export Augur dm_ datamart tables to year-partitioned columnar files.")
+    parser.add_argument("--out", default="datamart_export", help="Output directory (default: datamart_export).")
+    parser.add_argument(
+        "--tables",
+        nargs="+",
+        default=DATAMART_TABLES,
+        choices=DATAMART_TABLES,
+        help="Tables to export (default: all datamart tables)."
+    )
+    parser.add_argument(
+        "--format",
+        choices=["parquet", "arrow"],
+        default="parquet",
+        help="parquet, or arrow for Arrow IPC files. Both are zstd compressed."
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Re-export every partition, not just those that changed since the last export, "
+             "and remove year directories the tables no longer have."
+    )
+    args = parser.parse_args()
+    main(args.tables, args.out, file_format=args.format, full=args.full)
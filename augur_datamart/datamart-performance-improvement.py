@@ -1,7 +1,18 @@
 import psycopg2
+import psycopg2.pool
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
 import json
+import re
+import time
+import hashlib
+import argparse
+from statistics import median
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 CONFIG_FILE = "db.config.json"
+APPLICATION_NAME = "augur_datamart/datamart-performance-improvement"
 """ {
         "table": "dm_repo_weekly",
         "group_field": "repo_id",
@@ -43,11 +54,7 @@ TABLE_CONFIGS = [
     }
 ]
 
-QUERY_TEMPLATE = """
-WITH base_info AS (
-  SELECT 'manual query' AS tool_source, '1.0' AS tool_version, 'query' AS data_source
-),
-filtered_commits AS (
+FILTERED_COMMITS_SQL = """
   SELECT
     c.repo_id,
     r.repo_group_id,
@@ -62,13 +69,87 @@ filtered_commits AS (
   FROM augur_data.commits c
   JOIN augur_data.repo r ON c.repo_id = r.repo_id
   JOIN augur_data.repo_groups g ON r.repo_group_id = g.repo_group_id
-  WHERE NOT EXISTS (
+  WHERE {exclude_filter}{bucket_filter}"""
+
+# "like" compares every commit against every exclude row with a suffix LIKE
+# that no index can serve. "resolved" looks the author email up in
+# dm_exclude_resolved, which turns the filter into an equality anti-join.
+EXCLUDE_FILTERS = {
+    "like": """NOT EXISTS (
     SELECT 1 FROM augur_data.exclude e
     WHERE (
       (c.cmt_author_email = e.email OR c.cmt_author_email LIKE CONCAT('%', e.domain))
       AND (e.projects_id = r.repo_group_id OR e.projects_id = 0)
     )
-  )
+  )""",
+    "resolved": """NOT EXISTS (
+    SELECT 1 FROM augur_data.dm_exclude_resolved x
+    WHERE x.email = c.cmt_author_email
+      AND x.projects_id IN (r.repo_group_id, 0)
+  )"""
+}
+
+# Every (author email, project) pair that the exclude list matches, resolved
+# once per distinct email rather than once per commit.
+EXCLUDE_RESOLVED_DDL = """
+CREATE TABLE IF NOT EXISTS augur_data.dm_exclude_resolved (
+  email varchar NOT NULL,
+  projects_id int4 NOT NULL,
+  PRIMARY KEY (email, projects_id)
+);
+"""
+
+# The exclude list fingerprint is part of the watermark key, so any edit to
+# augur_data.exclude forces the resolved table to be rebuilt from scratch.
+EXCLUDE_HASH_SQL = """
+SELECT md5(COALESCE(string_agg(
+  concat_ws('|', projects_id, email, domain), ',' ORDER BY projects_id, email, domain
+), ''))
+FROM augur_data.exclude;
+"""
+
+RESOLVE_EXCLUDE_TEMPLATE = """
+INSERT INTO augur_data.dm_exclude_resolved (email, projects_id)
+SELECT DISTINCT em.email, e.projects_id
+FROM (
+  SELECT DISTINCT c.cmt_author_email AS email
+  FROM augur_data.commits c
+  WHERE c.cmt_author_email IS NOT NULL
+    AND c.cmt_id <= %(high)s{commit_range}
+) em
+JOIN augur_data.exclude e
+  ON em.email = e.email OR em.email LIKE CONCAT('%%', e.domain)
+ON CONFLICT DO NOTHING;
+"""
+
+# Single-scan engine: commits are joined and filtered once into this stage,
+# and every datamart table aggregates from it instead of from commits.
+STAGE_TABLE = "augur_data.dm_stage_commits"
+
+STAGED_COMMITS_SQL = """
+  SELECT * FROM augur_data.dm_stage_commits c
+  WHERE TRUE{bucket_filter}"""
+
+STAGE_TEMPLATE = """
+DROP TABLE IF EXISTS augur_data.dm_stage_commits;
+CREATE UNLOGGED TABLE augur_data.dm_stage_commits AS
+{filtered_commits};
+"""
+
+# Buckets for the stage are (repo_group_id, year), which cover the buckets
+# of every repo and repo group table at any grain.
+STAGE_CFG = {
+    "table": "dm_stage_commits",
+    "group_field": "repo_group_id",
+    "time_unit": "'year'",
+    "period_column": None
+}
+
+QUERY_TEMPLATE = """
+WITH base_info AS (
+  SELECT 'manual query' AS tool_source, '1.0' AS tool_version, 'query' AS data_source
+),
+filtered_commits AS ({filtered_commits}
 ),
 aggs AS (
   SELECT
@@ -126,46 +207,1029 @@ def read_db_config():
     with open(CONFIG_FILE, 'r') as f:
         return json.load(f)
 
-def run_queries():
+# Per-table high-water mark on augur_data.commits.cmt_id. Commits with a
+# cmt_id above the mark have not been folded into the datamart table yet.
+# cmt_ids are handed out when a row is inserted, not when it commits, so a
+# collection transaction still open when the mark was taken can later commit
+# ids below it. Each refresh therefore re-scans RESCAN_MARGIN ids under the
+# mark; re-aggregating a bucket that was already up to date is harmless.
+RESCAN_MARGIN = 100000
+WATERMARK_DDL = """
+CREATE TABLE IF NOT EXISTS augur_data.dm_refresh_watermark (
+  table_name varchar PRIMARY KEY,
+  last_cmt_id bigint NOT NULL,
+  refreshed_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+# Repo -> repo group as of the last run. Deleted repos and repos moved to
+# another group bring no new commits, so an incremental refresh would never
+# revisit their rows; any such change forces a full rebuild instead.
+REPO_SNAPSHOT_DDL = """
+CREATE TABLE IF NOT EXISTS augur_data.dm_repo_snapshot (
+  repo_id bigint PRIMARY KEY,
+  repo_group_id bigint
+);
+"""
+
+REPOS_CHANGED_SQL = """
+SELECT count(*)
+FROM augur_data.dm_repo_snapshot s
+LEFT JOIN augur_data.repo r ON r.repo_id = s.repo_id
+WHERE r.repo_id IS NULL OR r.repo_group_id IS DISTINCT FROM s.repo_group_id;
+"""
+
+# Collects the (group, year[, period]) buckets touched by commits collected
+# since the last refresh. Only these buckets are deleted and re-aggregated.
+AFFECTED_BUCKETS_TEMPLATE = """
+CREATE TEMP TABLE dm_affected_buckets ON COMMIT DROP AS
+SELECT DISTINCT
+  {group_alias}.{group_field} AS group_id,
+  DATE_PART('year', TO_TIMESTAMP(c.cmt_committer_date, 'YYYY-MM-DD')) AS year{bucket_period_expr}
+FROM augur_data.commits c
+JOIN augur_data.repo r ON c.repo_id = r.repo_id
+WHERE c.cmt_id > %(low)s AND c.cmt_id <= %(high)s;
+"""
+
+BUCKET_FILTER_TEMPLATE = """
+  AND EXISTS (
+    SELECT 1 FROM dm_affected_buckets b
+    WHERE b.group_id = {group_alias}.{group_field}
+      AND b.year = DATE_PART('year', {commit_ts}){bucket_period_match}
+  )"""
+
+# Shadow swap: the rename at the end takes an ACCESS EXCLUSIVE lock on the
+# live table. A short lock_timeout keeps us from queueing behind a long
+# dashboard read (and stalling every reader queued behind us); we back off
+# and retry instead.
+SWAP_LOCK_TIMEOUT = "5s"
+SWAP_RETRIES = 10
+
+# Views and foreign keys that reference a table follow it through the rename,
+# so the old table could not be dropped; such tables are rebuilt in place.
+SWAP_DEPENDENTS_SQL = """
+SELECT DISTINCT v.oid::regclass::text
+FROM pg_depend d
+JOIN pg_rewrite r ON r.oid = d.objid
+JOIN pg_class v ON v.oid = r.ev_class
+WHERE d.classid = 'pg_rewrite'::regclass
+  AND d.refclassid = 'pg_class'::regclass
+  AND d.refobjid = %(table)s::regclass
+  AND v.oid <> d.refobjid
+UNION
+SELECT conrelid::regclass::text
+FROM pg_constraint
+WHERE contype = 'f' AND confrelid = %(table)s::regclass AND conrelid <> confrelid;
+"""
+
+# Constraints LIKE does not copy; primary key, unique and exclusion
+# constraints bring their own index
+SWAP_CONSTRAINTS_SQL = """
+SELECT conname, pg_get_constraintdef(oid)
+FROM pg_constraint
+WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'x', 'c', 'f')
+ORDER BY contype = 'f', conname;
+"""
+
+# Chunked builds: each table is filled one range of repo_group_ids at a time,
+# one transaction per chunk. The plan and the finished chunks are kept here so
+# an interrupted build picks up at the first unfinished chunk. Rows for a
+# table exist only while its build is in progress.
+CHECKPOINT_DDL = """
+CREATE TABLE IF NOT EXISTS augur_data.dm_build_checkpoint (
+  table_name varchar NOT NULL,
+  chunk_no int NOT NULL,
+  first_group_id bigint NOT NULL,
+  last_group_id bigint NOT NULL,
+  high_cmt_id bigint NOT NULL,
+  rows_inserted bigint,
+  seconds numeric,
+  completed_at timestamptz,
+  PRIMARY KEY (table_name, chunk_no)
+);
+"""
+
+BIGINT_MAX = 9223372036854775807
+
+# Profiling: with --profile every build statement runs under EXPLAIN ANALYZE
+# and the plan, buffer counts and wall time are kept per table build so a
+# slow refresh can be compared against earlier ones.
+HISTORY_DDL = """
+CREATE TABLE IF NOT EXISTS augur_data.dm_build_history (
+  history_id bigserial PRIMARY KEY,
+  table_name varchar NOT NULL,
+  build_mode varchar NOT NULL,
+  engine varchar NOT NULL,
+  wall_seconds numeric NOT NULL,
+  planning_ms numeric,
+  execution_ms numeric,
+  shared_hit_blocks bigint,
+  shared_read_blocks bigint,
+  temp_read_blocks bigint,
+  temp_written_blocks bigint,
+  plan_fingerprint text,
+  plans jsonb,
+  regressed boolean NOT NULL DEFAULT false,
+  recorded_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+# Runs compared against when looking for a regression
+HISTORY_BASELINE_RUNS = 5
+
+INDEXDEF_RE = re.compile(
+    r'CREATE (?P<unique>UNIQUE )?INDEX (?P<name>"(?:[^"]|"")+"|\S+) ON (?:ONLY )?(?P<table>\S+) (?P<rest>USING .*)'
+)
+
+DELETE_BUCKETS_TEMPLATE = """
+DELETE FROM augur_data.{table} t
+USING dm_affected_buckets b
+WHERE t.{group_field} = b.group_id
+  AND t.year = b.year{delete_period_match};
+"""
+
+
+def group_alias(cfg, staged=False):
+    # repo_id lives on commits, repo_group_id has to come from repo
+    # unless we are reading the stage, which carries both
+    return "c" if staged or cfg['group_field'] == "repo_id" else "r"
+
+
+def commit_ts_expr(staged=False):
+    return "c.commit_ts" if staged else "TO_TIMESTAMP(c.cmt_committer_date, 'YYYY-MM-DD')"
+
+
+def filtered_commits_sql(exclusion="resolved"):
+    return FILTERED_COMMITS_SQL.replace("{exclude_filter}", EXCLUDE_FILTERS[exclusion])
+
+
+def render_query(cfg, bucket_filter="", staged=False, exclusion="resolved"):
+    if cfg['period_column']:
+        period_expr = f"DATE_PART({cfg['time_unit']}, fc.commit_ts) AS {cfg['period_column']},"
+        group_by_expr = f"DATE_PART({cfg['time_unit']}, fc.commit_ts),"
+        column_list = f"{cfg['period_column']}, "
+        select_list = f"a.{cfg['period_column']}, "
+    else:
+        period_expr = ""
+        group_by_expr = ""
+        column_list = ""
+        select_list = ""
+
+    source = STAGED_COMMITS_SQL if staged else filtered_commits_sql(exclusion)
+    return QUERY_TEMPLATE.format(
+        filtered_commits=source.format(bucket_filter=bucket_filter),
+        table=cfg['table'],
+        group_field=cfg['group_field'],
+        period_expr=period_expr,
+        group_by_expr=group_by_expr,
+        column_list=column_list,
+        select_list=select_list
+    )
+
+
+def render_bucket_sql(cfg, staged=False):
+    if cfg['period_column']:
+        bucket_period_expr = (
+            f",\n  DATE_PART({cfg['time_unit']}, TO_TIMESTAMP(c.cmt_committer_date, 'YYYY-MM-DD')) AS period"
+        )
+        bucket_period_match = (
+            f"\n      AND b.period = DATE_PART({cfg['time_unit']}, {commit_ts_expr(staged)})"
+        )
+        delete_period_match = f"\n  AND t.{cfg['period_column']} = b.period"
+    else:
+        bucket_period_expr = ""
+        bucket_period_match = ""
+        delete_period_match = ""
+
+    buckets = AFFECTED_BUCKETS_TEMPLATE.format(
+        group_alias=group_alias(cfg),
+        group_field=cfg['group_field'],
+        bucket_period_expr=bucket_period_expr
+    )
+    bucket_filter = BUCKET_FILTER_TEMPLATE.format(
+        group_alias=group_alias(cfg, staged),
+        group_field=cfg['group_field'],
+        commit_ts=commit_ts_expr(staged),
+        bucket_period_match=bucket_period_match
+    )
+    delete = DELETE_BUCKETS_TEMPLATE.format(
+        table=cfg['table'],
+        group_field=cfg['group_field'],
+        delete_period_match=delete_period_match
+    )
+    return buckets, bucket_filter, delete
+
+
+def get_watermark(cursor, table):
+    cursor.execute(
+        "SELECT last_cmt_id FROM augur_data.dm_refresh_watermark WHERE table_name = %s;",
+        (table,)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(cursor, table, cmt_id, changed=True):
+    """
+    Move the table's watermark to cmt_id. refreshed_at, which readers such
+    as datamart_queries.py treat as the table's completion marker, only
+    moves when the build changed rows.
+    """
+    cursor.execute("""
+        INSERT INTO augur_data.dm_refresh_watermark (table_name, last_cmt_id, refreshed_at)
+        VALUES (%(table)s, %(cmt_id)s, now())
+        ON CONFLICT (table_name)
+        DO UPDATE SET last_cmt_id = EXCLUDED.last_cmt_id,
+                      refreshed_at = CASE WHEN %(changed)s THEN EXCLUDED.refreshed_at
+                                          ELSE dm_refresh_watermark.refreshed_at END;
+    """, {"table": table, "cmt_id": cmt_id, "changed": changed})
+
+
+def reset_watermarks(cursor, reason):
+    """
+    Drop every table's watermark, so the next build of each is a full one.
+    """
+    cursor.execute(
+        "DELETE FROM augur_data.dm_refresh_watermark WHERE table_name = ANY(%s);",
+        ([cfg['table'] for cfg in TABLE_CONFIGS],)
+    )
+    if cursor.rowcount:
+        print(f"{reason}; every table will be rebuilt in full.")
+
+
+def check_repos(cursor):
+    cursor.execute(REPO_SNAPSHOT_DDL)
+    cursor.execute(REPOS_CHANGED_SQL)
+    changed = cursor.fetchone()[0]
+    if changed:
+        reset_watermarks(cursor, f"{changed} repos were deleted or moved to another repo group")
+    cursor.execute("TRUNCATE TABLE augur_data.dm_repo_snapshot;")
+    cursor.execute("INSERT INTO augur_data.dm_repo_snapshot SELECT repo_id, repo_group_id FROM augur_data.repo;")
+    return changed
+
+
+def exclusions_changed(cursor):
+    """
+    Read-only: whether the exclude list differs from the one last resolved.
+    """
+    cursor.execute(EXCLUDE_HASH_SQL)
+    key = f"dm_exclude_resolved:{cursor.fetchone()[0]}"
+    cursor.execute("""
+        SELECT count(*) FILTER (WHERE table_name = %s), count(*)
+        FROM augur_data.dm_refresh_watermark
+        WHERE table_name LIKE 'dm_exclude_resolved:%%';
+    """, (key,))
+    current, resolved = cursor.fetchone()
+    return bool(resolved and not current)
+
+
+def scan_from(low, margin=RESCAN_MARGIN):
+    """
+    Lower cmt_id bound for an incremental refresh from watermark low.
+    """
+    return None if low is None else max(0, low - margin)
+
+
+def compile_exclusions(cursor, high, margin=RESCAN_MARGIN):
+    start = time.perf_counter()
+    cursor.execute(EXCLUDE_RESOLVED_DDL)
+    cursor.execute(EXCLUDE_HASH_SQL)
+    key = f"dm_exclude_resolved:{cursor.fetchone()[0]}"
+
+    low = scan_from(get_watermark(cursor, key), margin)
+    if low is None:
+        print("Resolving the exclude list against all author emails...")
+        cursor.execute("TRUNCATE TABLE augur_data.dm_exclude_resolved;")
+        cursor.execute(
+            "DELETE FROM augur_data.dm_refresh_watermark WHERE table_name LIKE 'dm_exclude_resolved:%';"
+        )
+        if cursor.rowcount:
+            # Rows aggregated under the old list would never be revisited
+            reset_watermarks(cursor, "The exclude list changed")
+        commit_range = ""
+    else:
+        print("Resolving the exclude list against new author emails...")
+        commit_range = "\n    AND c.cmt_id > %(low)s"
+
+    cursor.execute(
+        RESOLVE_EXCLUDE_TEMPLATE.format(commit_range=commit_range),
+        {"low": low, "high": high}
+    )
+    added = cursor.rowcount
+    set_watermark(cursor, key, high)
+    cursor.execute("ANALYZE augur_data.dm_exclude_resolved;")
+
+    elapsed = time.perf_counter() - start
+    print(f"Resolved {added} new excluded email/project pairs in {elapsed:.1f}s.")
+    return elapsed
+
+
+def execute_build(cursor, sql, plans=None):
+    if plans is None:
+        cursor.execute(sql)
+        return cursor.rowcount
+
+    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    plan = plan[0]
+    plans.append(plan)
+
+    # The ModifyTable node reports no rows itself; what it inserted is its input
+    top = plan['Plan']
+    source = next((p for p in top.get('Plans', []) if p.get('Parent Relationship') == 'Outer'), top)
+    return int(source.get('Actual Rows', 0) * source.get('Actual Loops', 1))
+
+
+def plan_shape(node):
+    children = ",".join(plan_shape(child) for child in node.get('Plans', []))
+    return f"{node['Node Type']}:{node.get('Relation Name', '')}({children})"
+
+
+def record_history(cursor, table, build_mode, engine, elapsed, plans, threshold):
+    def total(key):
+        return sum(p['Plan'].get(key, 0) for p in plans)
+
+    reads = total('Shared Read Blocks')
+    fingerprint = hashlib.md5(plan_shape(plans[0]['Plan']).encode()).hexdigest() if plans else None
+
+    cursor.execute("""
+        SELECT wall_seconds, shared_read_blocks, plan_fingerprint
+        FROM augur_data.dm_build_history
+        WHERE table_name = %s AND build_mode = %s AND engine = %s
+        ORDER BY recorded_at DESC
+        LIMIT %s;
+    """, (table, build_mode, engine, HISTORY_BASELINE_RUNS))
+    previous = cursor.fetchall()
+
+    regressions = []
+    if previous:
+        base_wall = float(median(row[0] for row in previous))
+        base_reads = median(row[1] or 0 for row in previous)
+        if base_wall and elapsed > threshold * base_wall:
+            regressions.append(f"wall time {elapsed:.1f}s vs median {base_wall:.1f}s")
+        if base_reads and reads > threshold * base_reads:
+            regressions.append(f"shared reads {reads} blocks vs median {base_reads:.0f}")
+
+    cursor.execute("""
+        INSERT INTO augur_data.dm_build_history (
+          table_name, build_mode, engine, wall_seconds, planning_ms, execution_ms,
+          shared_hit_blocks, shared_read_blocks, temp_read_blocks, temp_written_blocks,
+          plan_fingerprint, plans, regressed
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+    """, (
+        table, build_mode, engine, elapsed,
+        sum(p.get('Planning Time', 0) for p in plans),
+        sum(p.get('Execution Time', 0) for p in plans),
+        total('Shared Hit Blocks'), reads, total('Temp Read Blocks'), total('Temp Written Blocks'),
+        fingerprint, psycopg2.extras.Json(plans), bool(regressions)
+    ))
+
+    if regressions:
+        print(f"⚠️  {table} ({build_mode}) regressed: {'; '.join(regressions)}")
+    if previous and previous[0][2] != fingerprint:
+        print(f"⚠️  {table} ({build_mode}) plan shape changed since the last profiled run.")
+
+
+def build_full(cursor, cfg, staged=False, exclusion="resolved", plans=None):
+    print(f"Truncating {cfg['table']}...")
+    cursor.execute(f"TRUNCATE TABLE augur_data.{cfg['table']};")
+    print(f"Inserting into {cfg['table']}...")
+    execute_build(cursor, render_query(cfg, staged=staged, exclusion=exclusion), plans)
+
+
+def copy_constraints(cursor, table, shadow):
+    cursor.execute(SWAP_CONSTRAINTS_SQL, (f"augur_data.{table}",))
+    renames = []
+    for i, (name, definition) in enumerate(cursor.fetchall()):
+        shadow_constraint = f"{shadow}_con{i}"
+        cursor.execute(f"ALTER TABLE augur_data.{shadow} ADD CONSTRAINT {shadow_constraint} {definition};")
+        renames.append((shadow_constraint, name))
+    return renames
+
+
+def copy_indexes(cursor, table, shadow):
+    # Indexes behind a constraint come back with copy_constraints
+    cursor.execute("""
+        SELECT indexname, indexdef
+        FROM pg_indexes
+        WHERE schemaname = 'augur_data' AND tablename = %s
+          AND indexname NOT IN (
+            SELECT i.relname
+            FROM pg_constraint c
+            JOIN pg_class i ON i.oid = c.conindid
+            WHERE c.conrelid = %s::regclass AND c.contype IN ('p', 'u', 'x')
+          );
+    """, (table, f"augur_data.{table}"))
+    renames = []
+    for i, (name, indexdef) in enumerate(cursor.fetchall()):
+        m = INDEXDEF_RE.match(indexdef)
+        if not m:
+            print(f"⚠️  Skipping index {name}, could not parse: {indexdef}")
+            continue
+        shadow_index = f"{shadow}_idx{i}"
+        cursor.execute(f"CREATE {m['unique'] or ''}INDEX {shadow_index} ON augur_data.{shadow} {m['rest']};")
+        renames.append((shadow_index, name))
+    return renames
+
+
+def copy_grants(cursor, table, shadow):
+    cursor.execute("""
+        SELECT grantee, privilege_type
+        FROM information_schema.role_table_grants
+        WHERE table_schema = 'augur_data' AND table_name = %s;
+    """, (table,))
+    for grantee, privilege in cursor.fetchall():
+        grantee = grantee if grantee == "PUBLIC" else psycopg2.extensions.quote_ident(grantee, cursor)
+        cursor.execute(f"GRANT {privilege} ON augur_data.{shadow} TO {grantee};")
+
+
+def swap_tables(cursor, table, shadow, index_renames, constraint_renames):
+    cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}';")
+    for attempt in range(1, SWAP_RETRIES + 1):
+        cursor.execute("SAVEPOINT dm_swap;")
+        try:
+            cursor.execute(f"ALTER TABLE augur_data.{table} RENAME TO {table}_old;")
+            cursor.execute(f"ALTER TABLE augur_data.{shadow} RENAME TO {table};")
+            cursor.execute(f"DROP TABLE augur_data.{table}_old;")
+            for shadow_constraint, name in constraint_renames:
+                cursor.execute(
+                    f"ALTER TABLE augur_data.{table} RENAME CONSTRAINT {shadow_constraint} "
+                    f"TO {psycopg2.extensions.quote_ident(name, cursor)};"
+                )
+            for shadow_index, name in index_renames:
+                cursor.execute(
+                    f"ALTER INDEX augur_data.{shadow_index} RENAME TO {psycopg2.extensions.quote_ident(name, cursor)};"
+                )
+            cursor.execute("RELEASE SAVEPOINT dm_swap;")
+            print(f"🔁 Swapped {shadow} in as {table}.")
+            return
+        except psycopg2.errors.LockNotAvailable:
+            cursor.execute("ROLLBACK TO SAVEPOINT dm_swap;")
+            print(f"{table} is busy, retrying the swap ({attempt}/{SWAP_RETRIES})...")
+            time.sleep(attempt)
+    raise RuntimeError(f"Could not lock {table} for the swap after {SWAP_RETRIES} attempts.")
+
+
+def build_swap(cursor, cfg, staged=False, exclusion="resolved", plans=None):
+    table = cfg['table']
+    shadow = f"{table}_shadow"
+
+    cursor.execute(SWAP_DEPENDENTS_SQL, {"table": f"augur_data.{table}"})
+    dependents = [row[0] for row in cursor.fetchall()]
+    if dependents:
+        print(f"⚠️  {', '.join(dependents)} depend on {table}; rebuilding it in place instead of swapping.")
+        build_full(cursor, cfg, staged, exclusion, plans)
+        return
+
+    print(f"Building {shadow}...")
+    cursor.execute(f"DROP TABLE IF EXISTS augur_data.{shadow};")
+    cursor.execute(
+        f"CREATE UNLOGGED TABLE augur_data.{shadow} "
+        f"(LIKE augur_data.{table} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING IDENTITY);"
+    )
+    rows = execute_build(cursor, render_query(dict(cfg, table=shadow), staged=staged, exclusion=exclusion), plans)
+    print(f"Inserted {rows} rows into {shadow}.")
+
+    # Indexes go on after the bulk load, then the table is made durable
+    # before it replaces the live one.
+    cursor.execute(f"ALTER TABLE augur_data.{shadow} SET LOGGED;")
+    constraint_renames = copy_constraints(cursor, table, shadow)
+    index_renames = copy_indexes(cursor, table, shadow)
+    copy_grants(cursor, table, shadow)
+    cursor.execute(f"ANALYZE augur_data.{shadow};")
+
+    swap_tables(cursor, table, shadow, index_renames, constraint_renames)
+
+
+def plan_chunks(cursor, chunk_size):
+    cursor.execute("""
+        SELECT g.repo_group_id, count(r.repo_id)
+        FROM augur_data.repo_groups g
+        LEFT JOIN augur_data.repo r ON r.repo_group_id = g.repo_group_id
+        GROUP BY g.repo_group_id
+        ORDER BY g.repo_group_id;
+    """)
+    # Pack whole repo groups into ranges of roughly chunk_size repos; a group
+    # larger than chunk_size gets a chunk to itself.
+    chunks = []
+    first, repos = None, 0
+    for group_id, repo_count in cursor.fetchall():
+        if first is not None and repos + repo_count > chunk_size:
+            chunks.append([first, group_id - 1])
+            first, repos = None, 0
+        if first is None:
+            first = group_id
+        repos += repo_count
+    if first is not None:
+        chunks.append([first, BIGINT_MAX])
+
+    # Open the ends so groups added while a build is paused still land in a chunk
+    if chunks:
+        chunks[0][0] = 0
+        chunks[-1][1] = BIGINT_MAX
+    return chunks
+
+
+def build_chunked(conn, cursor, cfg, high, staged=False, exclusion="resolved", chunk_size=None, plans=None):
+    table = cfg['table']
+    cursor.execute("""
+        SELECT chunk_no, first_group_id, last_group_id, high_cmt_id, completed_at
+        FROM augur_data.dm_build_checkpoint
+        WHERE table_name = %s
+        ORDER BY chunk_no;
+    """, (table,))
+    plan = cursor.fetchall()
+
+    if plan:
+        high = plan[0][3]
+        done = sum(1 for chunk in plan if chunk[4] is not None)
+        print(f"Resuming {table}: {done}/{len(plan)} chunks already done.")
+    else:
+        chunks = plan_chunks(cursor, chunk_size)
+        print(f"Truncating {table}...")
+        cursor.execute(f"TRUNCATE TABLE augur_data.{table};")
+        for chunk_no, (first, last) in enumerate(chunks):
+            cursor.execute("""
+                INSERT INTO augur_data.dm_build_checkpoint
+                  (table_name, chunk_no, first_group_id, last_group_id, high_cmt_id)
+                VALUES (%s, %s, %s, %s, %s);
+            """, (table, chunk_no, first, last, high))
+        conn.commit()
+        plan = [(chunk_no, first, last, high, None) for chunk_no, (first, last) in enumerate(chunks)]
+        print(f"Planned {len(plan)} chunks for {table}.")
+
+    alias = group_alias({"group_field": "repo_group_id"}, staged)
+    for chunk_no, first, last, _, completed_at in plan:
+        if completed_at is not None:
+            continue
+        start = time.perf_counter()
+        chunk_filter = f"\n  AND {alias}.repo_group_id BETWEEN {int(first)} AND {int(last)}"
+        rows = execute_build(cursor, render_query(cfg, chunk_filter, staged, exclusion), plans)
+        elapsed = time.perf_counter() - start
+        cursor.execute("""
+            UPDATE augur_data.dm_build_checkpoint
+            SET rows_inserted = %s, seconds = %s, completed_at = now()
+            WHERE table_name = %s AND chunk_no = %s;
+        """, (rows, elapsed, table, chunk_no))
+        conn.commit()
+        rate = rows / elapsed if elapsed else 0
+        print(f"{table} chunk {chunk_no + 1}/{len(plan)}: {rows} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)")
+
+    set_watermark(cursor, table, high)
+    cursor.execute("DELETE FROM augur_data.dm_build_checkpoint WHERE table_name = %s;", (table,))
+    conn.commit()
+
+
+def build_incremental(cursor, cfg, low, high, staged=False, exclusion="resolved", plans=None):
+    buckets_sql, bucket_filter, delete_sql = render_bucket_sql(cfg, staged)
+
+    cursor.execute(buckets_sql, {"low": low, "high": high})
+    cursor.execute("SELECT count(*) FROM dm_affected_buckets;")
+    bucket_count = cursor.fetchone()[0]
+    if bucket_count == 0:
+        print(f"{cfg['table']} is up to date.")
+        return False
+
+    print(f"Refreshing {bucket_count} buckets in {cfg['table']}...")
+    cursor.execute("ANALYZE dm_affected_buckets;")
+    cursor.execute(delete_sql)
+    deleted = cursor.rowcount
+    print(f"Deleted {deleted} stale rows from {cfg['table']}.")
+    rows = execute_build(cursor, render_query(cfg, bucket_filter, staged, exclusion), plans)
+    print(f"Inserted {rows} rows into {cfg['table']}.")
+    return bool(deleted or rows)
+
+
+def build_stage(cursor, low, high, exclusion="resolved"):
+    if low is None:
+        print(f"Staging all filtered commits into {STAGE_TABLE}...")
+        bucket_filter = ""
+    else:
+        buckets_sql, bucket_filter, _ = render_bucket_sql(STAGE_CFG)
+        cursor.execute(buckets_sql, {"low": low, "high": high})
+        cursor.execute("ANALYZE dm_affected_buckets;")
+        print(f"Staging filtered commits for changed repo groups into {STAGE_TABLE}...")
+
+    cursor.execute(STAGE_TEMPLATE.format(
+        filtered_commits=filtered_commits_sql(exclusion).format(bucket_filter=bucket_filter)
+    ))
+    cursor.execute(f"SELECT count(*) FROM {STAGE_TABLE};")
+    print(f"Staged {cursor.fetchone()[0]} commit rows.")
+    cursor.execute(f"ANALYZE {STAGE_TABLE};")
+
+
+def pick_build_mode(low, swap=False, chunk_size=None, resume=False):
+    if resume or (low is None and chunk_size):
+        return "chunked"
+    if low is None:
+        return "swap" if swap else "full"
+    return "incremental"
+
+
+def estimate_table_costs(cursor, modes, engine="per-table", exclusion="resolved"):
+    """
+    Estimate how long each table build will take. Past profiled runs of the
+    same table, mode and engine are used where they exist; otherwise the
+    planner's total cost for the full build query is scaled into seconds
+    using the tables that have both. With no history at all the raw planner
+    cost is returned and only the ordering is meaningful.
+    Returns:
+        (estimates: dict of table -> weight, in_seconds: bool)
+    """
+    history = {}
+    cursor.execute("SELECT to_regclass('augur_data.dm_build_history');")
+    if cursor.fetchone()[0]:
+        for cfg in TABLE_CONFIGS:
+            cursor.execute("""
+                SELECT wall_seconds
+                FROM augur_data.dm_build_history
+                WHERE table_name = %s AND build_mode = %s AND engine = %s
+                ORDER BY recorded_at DESC
+                LIMIT %s;
+            """, (cfg['table'], modes[cfg['table']], engine, HISTORY_BASELINE_RUNS))
+            runs = [float(row[0]) for row in cursor.fetchall()]
+            if runs:
+                history[cfg['table']] = median(runs)
+
+    # Incremental and staged queries depend on temp and stage tables that do
+    # not exist yet, so the planner is asked about the plain full build.
+    cursor.execute("SELECT to_regclass('augur_data.dm_exclude_resolved');")
+    if exclusion == "resolved" and not cursor.fetchone()[0]:
+        exclusion = "like"
+    costs = {}
+    for cfg in TABLE_CONFIGS:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {render_query(cfg, exclusion=exclusion)}")
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        costs[cfg['table']] = plan[0]['Plan']['Total Cost']
+
+    ratios = [history[table] / costs[table] for table in history if costs[table]]
+    if not ratios:
+        return costs, False
+    ratio = median(ratios)
+    return {table: history.get(table, cost * ratio) for table, cost in costs.items()}, True
+
+
+def plan_schedule(estimates, workers):
+    """
+    Longest job first onto whichever worker frees up first. Submitting jobs
+    to the thread pool in this order gives the same assignment.
+    Returns:
+        (order: list of tables, lanes: list of per-worker table lists, makespan)
+    """
+    order = sorted(estimates, key=estimates.get, reverse=True)
+    loads = [0.0] * max(workers, 1)
+    lanes = [[] for _ in loads]
+    for table in order:
+        lane = loads.index(min(loads))
+        lanes[lane].append(table)
+        loads[lane] += estimates[table]
+    return order, lanes, max(loads)
+
+
+def print_schedule(estimates, in_seconds, lanes, makespan):
+    unit = "s" if in_seconds else " cost"
+    print("Planned schedule:")
+    for number, lane in enumerate(lanes, start=1):
+        jobs = ", ".join(f"{table} ({estimates[table]:,.1f}{unit})" for table in lane)
+        print(f"  worker {number}: {jobs or '-'}")
+    if in_seconds:
+        print(f"Estimated duration: {makespan:,.1f}s")
+    else:
+        print(f"Estimated duration: {makespan:,.1f} planner cost units (no profiled history to convert to seconds)")
+
+
+def dry_run(full=False, engine="per-table", workers=1, exclusion="resolved", swap=False, chunk_size=None):
     config = read_db_config()
     conn = psycopg2.connect(
         host=config['host'],
         port=config['port'],
         dbname=config['dbname'],
         user=config['user'],
-        password=config['password']
+        password=config['password'],
+        application_name=APPLICATION_NAME
     )
     cursor = conn.cursor()
 
+    # Read-only: the bookkeeping tables may not exist yet
+    cursor.execute("SELECT to_regclass('augur_data.dm_refresh_watermark');")
+    has_watermarks = cursor.fetchone()[0] is not None
+    cursor.execute("SELECT to_regclass('augur_data.dm_build_checkpoint');")
+    unfinished = set()
+    if cursor.fetchone()[0]:
+        cursor.execute("SELECT DISTINCT table_name FROM augur_data.dm_build_checkpoint;")
+        unfinished = {row[0] for row in cursor.fetchall()}
+    if has_watermarks and not full:
+        cursor.execute("SELECT to_regclass('augur_data.dm_repo_snapshot');")
+        if cursor.fetchone()[0]:
+            cursor.execute(REPOS_CHANGED_SQL)
+            changed = cursor.fetchone()[0]
+            if changed:
+                print(f"{changed} repos were deleted or moved to another repo group; every table will be rebuilt in full.")
+                has_watermarks = False
+    if has_watermarks and not full and exclusion == "resolved" and exclusions_changed(cursor):
+        print("The exclude list changed; every table will be rebuilt in full.")
+        has_watermarks = False
+
+    modes = {}
     for cfg in TABLE_CONFIGS:
-        print(f"Truncating {cfg['table']}...")
-        cursor.execute(f"TRUNCATE TABLE augur_data.{cfg['table']};")
-
-        if cfg['period_column']:
-            period_expr = f"DATE_PART({cfg['time_unit']}, fc.commit_ts) AS {cfg['period_column']},"
-            group_by_expr = f"DATE_PART({cfg['time_unit']}, fc.commit_ts),"
-            column_list = f"{cfg['period_column']}, "
-            select_list = f"a.{cfg['period_column']}, "
+        table = cfg['table']
+        low = None if full or not has_watermarks or table in unfinished else get_watermark(cursor, table)
+        modes[table] = pick_build_mode(low, swap, chunk_size, table in unfinished)
+
+    estimates, in_seconds = estimate_table_costs(cursor, modes, engine, exclusion)
+    _, lanes, makespan = plan_schedule(estimates, workers)
+    for table, mode in modes.items():
+        print(f"{table}: {mode}")
+    print_schedule(estimates, in_seconds, lanes, makespan)
+
+    conn.rollback()
+    cursor.close()
+    conn.close()
+
+
+def build_table(pool, cfg, low, high, staged=False, exclusion="resolved", swap=False,
+                chunk_size=None, resume=False, profile=False, regression_threshold=1.5):
+    conn = pool.getconn()
+    cursor = conn.cursor()
+    plans = [] if profile else None
+    start = time.perf_counter()
+    build_mode = pick_build_mode(low, swap, chunk_size, resume)
+    try:
+        if build_mode == "chunked":
+            build_chunked(conn, cursor, cfg, high, staged, exclusion, chunk_size, plans)
         else:
-            period_expr = ""
-            group_by_expr = ""
-            column_list = ""
-            select_list = ""
-
-        query = QUERY_TEMPLATE.format(
-            table=cfg['table'],
-            group_field=cfg['group_field'],
-            period_expr=period_expr,
-            group_by_expr=group_by_expr,
-            column_list=column_list,
-            select_list=select_list
+            changed = True
+            if build_mode == "swap":
+                build_swap(cursor, cfg, staged, exclusion, plans)
+            elif build_mode == "full":
+                build_full(cursor, cfg, staged, exclusion, plans)
+            else:
+                changed = build_incremental(cursor, cfg, low, high, staged, exclusion, plans)
+            set_watermark(cursor, cfg['table'], high, changed)
+            conn.commit()
+        elapsed = time.perf_counter() - start
+
+        if plans:
+            engine = "single-scan" if staged else "per-table"
+            record_history(cursor, cfg['table'], build_mode, engine, elapsed, plans, regression_threshold)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        pool.putconn(conn)
+
+    print(f"⏱️  {cfg['table']} built in {elapsed:.1f}s")
+    return elapsed
+
+
+def benchmark_exclusion():
+    config = read_db_config()
+    conn = psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name=APPLICATION_NAME
+    )
+    cursor = conn.cursor()
+
+    cursor.execute(WATERMARK_DDL)
+    cursor.execute("SELECT COALESCE(MAX(cmt_id), 0) FROM augur_data.commits;")
+    high = cursor.fetchone()[0]
+    compile_time = compile_exclusions(cursor, high)
+    conn.commit()
+
+    results = {}
+    for exclusion in ("like", "resolved"):
+        print(f"Counting filtered commits with the {exclusion} exclusion filter...")
+        start = time.perf_counter()
+        cursor.execute(
+            f"SELECT count(*) FROM ({filtered_commits_sql(exclusion).format(bucket_filter='')}) fc;"
         )
-        print(f"Inserting into {cfg['table']}...")
-        cursor.execute(query)
-        conn.commit()
+        results[exclusion] = (cursor.fetchone()[0], time.perf_counter() - start)
 
     cursor.close()
     conn.close()
 
+    like_rows, like_time = results["like"]
+    resolved_rows, resolved_time = results["resolved"]
+    print("\nExclusion filter timings:")
+    print(f"  {'like (before)':<22} {like_time:>10.1f}s  {like_rows} commits kept")
+    print(f"  {'resolved (after)':<22} {resolved_time:>10.1f}s  {resolved_rows} commits kept")
+    print(f"  {'resolve step':<22} {compile_time:>10.1f}s")
+    if like_rows != resolved_rows:
+        print("⚠️  Row counts differ between the two filters.")
+
+
+def run_queries(full=False, engine="per-table", workers=1, exclusion="resolved", swap=False,
+                chunk_size=None, profile=False, regression_threshold=1.5, margin=RESCAN_MARGIN):
+    config = read_db_config()
+    pool = psycopg2.pool.ThreadedConnectionPool(
+        1,
+        max(workers, 1),
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name=APPLICATION_NAME
+    )
+    conn = pool.getconn()
+    cursor = conn.cursor()
+
+    cursor.execute(WATERMARK_DDL)
+    cursor.execute(CHECKPOINT_DDL)
+    if profile:
+        cursor.execute(HISTORY_DDL)
+    conn.commit()
+
+    # Pin the upper bound once so every table is refreshed up to the same
+    # commit; anything collected while we run, or still uncommitted below
+    # the bound, is picked up next time (see RESCAN_MARGIN).
+    cursor.execute("SELECT COALESCE(MAX(cmt_id), 0) FROM augur_data.commits;")
+    high = cursor.fetchone()[0]
+
+    if exclusion == "resolved":
+        compile_exclusions(cursor, high, margin)
+        conn.commit()
+    check_repos(cursor)
+    conn.commit()
+
+    watermarks = {
+        cfg['table']: None if full else scan_from(get_watermark(cursor, cfg['table']), margin)
+        for cfg in TABLE_CONFIGS
+    }
+
+    # A table with checkpoint rows was left half built by an earlier chunked
+    # run; it has to be finished before anything else touches it.
+    cursor.execute("SELECT DISTINCT table_name FROM augur_data.dm_build_checkpoint;")
+    unfinished = {row[0] for row in cursor.fetchall()}
+    for table in unfinished & watermarks.keys():
+        watermarks[table] = None
+
+    staged = engine == "single-scan"
+    if staged:
+        # One pass over commits, wide enough for the table furthest behind
+        marks = list(watermarks.values())
+        build_stage(cursor, None if None in marks else min(marks), high, exclusion)
+        conn.commit()
+
+    configs = TABLE_CONFIGS
+    if workers > 1:
+        modes = {
+            cfg['table']: pick_build_mode(watermarks[cfg['table']], swap, chunk_size, cfg['table'] in unfinished)
+            for cfg in TABLE_CONFIGS
+        }
+        estimates, in_seconds = estimate_table_costs(cursor, modes, engine, exclusion)
+        order, lanes, makespan = plan_schedule(estimates, workers)
+        print_schedule(estimates, in_seconds, lanes, makespan)
+        by_table = {cfg['table']: cfg for cfg in TABLE_CONFIGS}
+        configs = [by_table[table] for table in order]
+        conn.rollback()
+
+    cursor.close()
+    pool.putconn(conn)
+
+    # Every table reads commits (or the stage) and writes only its own rows
+    # and watermark, so the builds are independent of each other.
+    timings = {}
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = {
+            executor.submit(
+                build_table, pool, cfg, watermarks[cfg['table']], high, staged, exclusion, swap,
+                chunk_size, cfg['table'] in unfinished, profile, regression_threshold
+            ): cfg['table']
+            for cfg in configs
+        }
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                timings[table] = future.result()
+            except Exception as e:
+                print(f"❌ {table} failed: {e}")
+                errors.append(e)
+
+    if staged:
+        conn = pool.getconn()
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {STAGE_TABLE};")
+        conn.commit()
+        pool.putconn(conn)
+
+    pool.closeall()
+
+    print("\nTable build times:")
+    for table, elapsed in sorted(timings.items(), key=lambda t: t[1], reverse=True):
+        print(f"  {table:<25} {elapsed:>10.1f}s")
+
+    if errors:
+        raise errors[0]
+
 if __name__ == '__main__':
-    run_queries()
+    parser = argparse.ArgumentParser(description="Refresh the Augur dm_ datamart tables.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Truncate and rebuild every table instead of refreshing only the buckets touched by new commits. "
+             "Incremental runs rebuild in full by themselves when the exclude list changes or repos are deleted "
+             "or moved, but miss commits deleted without being re-collected; run --full periodically."
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["per-table", "single-scan"],
+        default="per-table",
+        help="per-table re-reads commits for every table; single-scan filters commits once into a stage table "
+             "and builds every table from it."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of tables to build at once, each on its own pooled connection (default: 1)."
+    )
+    parser.add_argument(
+        "--exclusion",
+        choices=["resolved", "like"],
+        default="resolved",
+        help="resolved matches the exclude list once per distinct author email into dm_exclude_resolved; "
+             "like checks every commit against augur_data.exclude directly."
+    )
+    parser.add_argument(
+        "--benchmark-exclusion",
+        action="store_true",
+        help="Time the like and resolved exclusion filters against each other and exit without building tables."
+    )
+    parser.add_argument(
+        "--swap",
+        action="store_true",
+        help="For full rebuilds, load a shadow copy of each table and rename it into place so readers never see "
+             "an empty table."
+    )
+    parser.add_argument(
+        "--rescan-margin",
+        type=int,
+        default=RESCAN_MARGIN,
+        help=f"On an incremental refresh, also re-scan this many cmt_ids below each watermark, for commits that "
+             f"were still being collected when the last refresh ran (default: {RESCAN_MARGIN})."
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Rebuild tables in chunks of about this many repos (whole repo groups), committing and checkpointing "
+             "each chunk so an interrupted rebuild resumes where it stopped."
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Run each build statement under EXPLAIN (ANALYZE, BUFFERS) and record the plan, buffers and wall time "
+             "in augur_data.dm_build_history."
+    )
+    parser.add_argument(
+        "--regression-threshold",
+        type=float,
+        default=1.5,
+        help="With --profile, flag a build whose wall time or shared reads exceed this multiple of the median of "
+             f"the last {HISTORY_BASELINE_RUNS} profiled runs (default: 1.5)."
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the build mode of each table and the planned schedule across --workers, then exit without "
+             "changing anything."
+    )
+    args = parser.parse_args()
+    if args.swap and args.chunk_size:
+        parser.error("--swap and --chunk-size cannot be combined.")
+    if args.benchmark_exclusion:
+        benchmark_exclusion()
+    elif args.dry_run:
+        dry_run(
+            full=args.full,
+            engine=args.engine,
+            workers=args.workers,
+            exclusion=args.exclusion,
+            swap=args.swap,
+            chunk_size=args.chunk_size
+        )
+    else:
+        run_queries(
+            full=args.full,
+            engine=args.engine,
+            workers=args.workers,
+            exclusion=args.exclusion,
+            swap=args.swap,
+            chunk_size=args.chunk_size,
+            profile=args.profile,
+            regression_threshold=args.regression_threshold,
+            margin=args.rescan_margin
+        )
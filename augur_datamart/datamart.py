@@ -1,32 +1,283 @@
 #SPDX-License-Identifier: MIT
 
+import re
+import csv
 import json
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import psycopg2
 
+APPLICATION_NAME = "augur_datamart/datamart"
+MAX_WORKERS = 6
+
+# The tables a statement writes to, including from data-modifying WITH
+# clauses. Statements for the same table run in file order on one
+# connection; different tables run side by side.
+WRITE_RE = re.compile(
+    r'\b(INSERT\s+INTO|DELETE\s+FROM|UPDATE|MERGE\s+INTO)\s+(?:ONLY\s+)?([\w."]+)',
+    re.IGNORECASE
+)
+# UPDATE that is not a write: ON CONFLICT DO UPDATE, FOR [NO KEY] UPDATE [OF],
+# ON UPDATE CASCADE
+NOT_WRITE_BEFORE = {"DO", "FOR", "KEY", "ON"}
+NOT_WRITE_AFTER = {"SET", "OF", "SKIP", "NOWAIT", "CASCADE"}
+TRUNCATE_RE = re.compile(r'^\s*TRUNCATE(?:\s+TABLE)?\s+(.*)$', re.IGNORECASE | re.DOTALL)
+TRUNCATE_ITEM_RE = re.compile(r'\s*(ONLY\s+)?([\w."]+)\s*(\*)?\s*(,)?', re.IGNORECASE)
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\$([A-Za-z_]*)\$.*?\$\1\$", re.DOTALL)
+
+
 def load_db_config(filename='db.config.json'):
     with open(filename, 'r') as f:
         return json.load(f)
 
-def run_sql_script(sql, db_config):
+
+def split_statements(sql):
+    """
+    Split a SQL script on top-level semicolons, leaving semicolons inside
+    quotes, dollar-quoted bodies and comments alone.
+    Returns:
+        list of statement strings, without the trailing semicolon
+    """
+    statements = []
+    current = []
+    i = 0
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+        if sql.startswith('--', i):
+            end = sql.find('\n', i)
+            end = n if end == -1 else end
+            current.append(sql[i:end])
+            i = end
+        elif sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            current.append(sql[i:end])
+            i = end
+        elif ch in ("'", '"'):
+            end = i + 1
+            while end < n:
+                if sql[end] == ch:
+                    # a doubled quote is an escaped quote
+                    if end + 1 < n and sql[end + 1] == ch:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+        elif ch == '$':
+            m = re.match(r'\$[A-Za-z_]*\$', sql[i:])
+            if m:
+                tag = m.group(0)
+                end = sql.find(tag, i + len(tag))
+                end = n if end == -1 else end + len(tag)
+                current.append(sql[i:end])
+                i = end
+            else:
+                current.append(ch)
+                i += 1
+        elif ch == ';':
+            statements.append(''.join(current))
+            current = []
+            i += 1
+        else:
+            current.append(ch)
+            i += 1
+    statements.append(''.join(current))
+
+    return [s.strip() for s in statements if strip_comments(s).strip()]
+
+
+def strip_comments(statement):
+    statement = re.sub(r'/\*.*?\*/', '', statement, flags=re.DOTALL)
+    return re.sub(r'--[^\n]*', '', statement)
+
+
+def table_name(name):
+    return name.replace('"', '').lower()
+
+
+def split_truncate(statement):
+    """
+    Split TRUNCATE a, b [options] into one TRUNCATE per table, so each runs
+    in its table's group.
+    Returns:
+        [(table, statement)], or None if statement is not a TRUNCATE
+    """
+    m = TRUNCATE_RE.match(strip_comments(statement))
+    if not m:
+        return None
+    rest, items = m.group(1), []
+    while True:
+        item = TRUNCATE_ITEM_RE.match(rest)
+        if not item:
+            break
+        items.append((item.group(1) or "") + item.group(2) + (" *" if item.group(3) else ""))
+        rest = rest[item.end():]
+        if not item.group(4):
+            break
+    options = rest.strip()
+    return [
+        (table_name(TRUNCATE_ITEM_RE.match(item).group(2)), f"TRUNCATE TABLE {item}{' ' + options if options else ''}")
+        for item in items
+    ]
+
+
+def target_tables(statement):
+    """
+    Every table statement writes to with INSERT, DELETE, UPDATE or MERGE,
+    in the main statement or in a WITH clause. Function bodies and string
+    literals are ignored.
+    """
+    text = LITERAL_RE.sub(" ", strip_comments(statement))
+    tables = []
+    for m in WRITE_RE.finditer(text):
+        verb, name = m.group(1).upper(), m.group(2)
+        if verb == "UPDATE":
+            before = text[:m.start()].split()
+            if (before and before[-1].upper() in NOT_WRITE_BEFORE) or name.upper() in NOT_WRITE_AFTER:
+                continue
+        table = table_name(name)
+        if table not in tables:
+            tables.append(table)
+    return tables
+
+
+def group_statements(statements):
+    """
+    Statements without a target table (DDL, SET, ...) go into a prelude
+    that runs before everything else. The rest are grouped by target table.
+    TRUNCATE of several tables is split per table.
+    Raises:
+        ValueError for a statement that writes to more than one table, since
+        it cannot run in order with both tables' groups
+    """
+    prelude = []
+    groups = {}
+    for number, statement in enumerate(statements, start=1):
+        truncates = split_truncate(statement)
+        if truncates:
+            for table, truncate in truncates:
+                groups.setdefault(table, []).append((number, truncate))
+            continue
+        tables = target_tables(statement)
+        if len(tables) > 1:
+            raise ValueError(f"Statement {number} writes to {', '.join(tables)}; "
+                             f"split it so that each statement writes to one table.")
+        if tables:
+            groups.setdefault(tables[0], []).append((number, statement))
+        else:
+            prelude.append((number, statement))
+    return prelude, groups
+
+
+def run_group(name, statements, db_config):
+    """
+    Run one group of statements in a single transaction, so an error only
+    rolls back that group.
+    """
+    report = []
+    connection = psycopg2.connect(**db_config, application_name=APPLICATION_NAME)
+    cursor = connection.cursor()
     try:
-        connection = psycopg2.connect(**db_config)
-        cursor = connection.cursor()
-        cursor.execute(sql)
+        for number, statement in statements:
+            verb = strip_comments(statement).split(None, 1)[0].upper()
+            start = time.perf_counter()
+            try:
+                cursor.execute(statement)
+            except Exception as e:
+                report.append({
+                    "group": name,
+                    "statement": number,
+                    "verb": verb,
+                    "rows": "",
+                    "seconds": round(time.perf_counter() - start, 3),
+                    "status": f"error: {e}".strip(),
+                })
+                connection.rollback()
+                print(f"❌ {name} statement {number} ({verb}) failed: {e}")
+                return report
+            elapsed = time.perf_counter() - start
+            rows = cursor.rowcount if cursor.rowcount >= 0 else ""
+            report.append({
+                "group": name,
+                "statement": number,
+                "verb": verb,
+                "rows": rows,
+                "seconds": round(elapsed, 3),
+                "status": "ok",
+            })
+            print(f"{name} statement {number} ({verb}): {rows or 0} rows in {elapsed:.1f}s")
         connection.commit()
-        print("SQL script executed successfully.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
     finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
+        cursor.close()
+        connection.close()
+
+    return report
+
+
+def write_report(report, out_prefix="statement_report"):
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    csv_file = f"{out_prefix}_{ts}.csv"
+    with open(csv_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["group", "statement", "verb", "rows", "seconds", "status"])
+        writer.writeheader()
+        writer.writerows(sorted(report, key=lambda r: r["statement"]))
+    print(f"📄 Statement report written to {csv_file}")
+
+
+def run_sql_script(sql, db_config, workers=MAX_WORKERS):
+    prelude, groups = group_statements(split_statements(sql))
+    report = []
+
+    if prelude:
+        report.extend(run_group("prelude", prelude, db_config))
+        if any(r["status"] != "ok" for r in report):
+            print("Prelude failed, not running the table groups.")
+            return report
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = {
+            executor.submit(run_group, table, statements, db_config): table
+            for table, statements in groups.items()
+        }
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                report.extend(future.result())
+            except Exception as e:
+                print(f"❌ {table} failed: {e}")
+                report.append({
+                    "group": table, "statement": 0, "verb": "", "rows": "", "seconds": "",
+                    "status": f"error: {e}",
+                })
+
+    failed = sum(1 for r in report if r["status"] != "ok")
+    if failed:
+        print(f"SQL script finished with {failed} failed statement(s).")
+    else:
+        print("SQL script executed successfully.")
+    return report
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a datamart SQL script statement by statement.")
+    parser.add_argument("script", nargs="?", default="bulk_insert.sql", help="SQL file to run (default: bulk_insert.sql)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=MAX_WORKERS,
+        help=f"Number of tables to load at once, each on its own connection (default: {MAX_WORKERS})."
+    )
+    args = parser.parse_args()
+
     db_config = load_db_config()
 
     # Optionally load from file to keep things clean
-    with open("bulk_insert.sql", "r") as f:
+    with open(args.script, "r") as f:
         sql_script = f.read()
 
-    run_sql_script(sql_script, db_config)
\ No newline at end of file
+    write_report(run_sql_script(sql_script, db_config, workers=args.workers))
@@ -0,0 +1,268 @@
+#SPDX-License-Identifier: MIT
+"""
+Cached dashboard queries over the dm_ datamart tables.
+
+    from datamart_queries import DatamartQueries
+
+    dm = DatamartQueries.from_config_file()
+    dm.top_contributors(repo_group_id=25, year=2024, month=3, n=10)
+    dm.affiliation_totals(repo_group_id=25, year=2024)
+    dm.repo_lines_changed(repo_id=123)
+
+Results are kept in an in-process LRU cache with a TTL. The refreshed_at
+column of augur_data.dm_refresh_watermark, which datamart-performance-
+improvement.py sets in the same transaction as each table build, is the
+completion marker. It is looked up at most every few seconds. When a table's
+marker moves, that table's cached results are dropped, so a warm cache
+serves repeat dashboard loads without touching the database.
+"""
+import json
+import time
+import threading
+from collections import OrderedDict
+import psycopg2
+import psycopg2.pool
+import psycopg2.errors
+
+CONFIG_FILE = "db.config.json"
+APPLICATION_NAME = "augur_datamart/datamart_queries"
+
+CACHE_SIZE = 512
+CACHE_TTL = 300
+MARKER_CHECK_SECONDS = 5
+MAX_CONNECTIONS = 4
+
+CACHED_TABLES = ("dm_repo_group_monthly", "dm_repo_group_annual", "dm_repo_annual")
+
+MARKER_SQL = """
+SELECT table_name, refreshed_at
+FROM augur_data.dm_refresh_watermark
+WHERE table_name = ANY(%s);
+"""
+
+# {table} is dm_repo_group_monthly when a month is given, otherwise
+# dm_repo_group_annual
+TOP_CONTRIBUTORS_SQL = """
+SELECT
+  email,
+  max(affiliation) AS affiliation,
+  sum(added) AS added,
+  sum(removed) AS removed,
+  sum(added + removed) AS lines_changed,
+  sum(patches) AS patches
+FROM augur_data.{table}
+WHERE repo_group_id = %(repo_group_id)s
+  AND year = %(year)s{month_filter}
+GROUP BY email
+ORDER BY {order_by} DESC, email
+LIMIT %(n)s;
+"""
+
+AFFILIATION_TOTALS_SQL = """
+SELECT
+  coalesce(affiliation, 'Unknown') AS affiliation,
+  count(DISTINCT email) AS contributors,
+  sum(added) AS added,
+  sum(removed) AS removed,
+  sum(added + removed) AS lines_changed,
+  sum(patches) AS patches
+FROM augur_data.{table}
+WHERE repo_group_id = %(repo_group_id)s
+  AND year = %(year)s{month_filter}
+GROUP BY 1
+ORDER BY lines_changed DESC NULLS LAST, 1;
+"""
+
+REPO_LINES_CHANGED_SQL = """
+SELECT
+  year,
+  sum(added) AS added,
+  sum(removed) AS removed,
+  sum(added + removed) AS lines_changed,
+  sum(patches) AS patches,
+  count(DISTINCT email) AS contributors
+FROM augur_data.dm_repo_annual
+WHERE repo_id = %(repo_id)s
+  AND year BETWEEN %(start_year)s AND %(end_year)s
+GROUP BY year
+ORDER BY year;
+"""
+
+ORDER_BY = {
+    "lines_changed": "lines_changed",
+    "added": "added",
+    "patches": "patches",
+}
+
+
+def read_db_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+
+class QueryCache:
+    """
+    LRU cache whose entries expire after ttl seconds. Keys are tuples that
+    start with the dm_ table the result came from, so one table's entries
+    can be dropped on their own.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, table=None):
+        if table is None:
+            self.entries.clear()
+            return
+        for key in [key for key in self.entries if key[0] == table]:
+            del self.entries[key]
+
+
+class DatamartQueries:
+    """
+    Parameterized reads over the dm_ tables, served from a QueryCache. Safe
+    to share between threads. Returned lists are shared with the cache and
+    should not be modified.
+    """
+
+    def __init__(self, db_config, cache_size=CACHE_SIZE, ttl=CACHE_TTL,
+                 marker_check_seconds=MARKER_CHECK_SECONDS, max_connections=MAX_CONNECTIONS):
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            1,
+            max(max_connections, 1),
+            host=db_config['host'],
+            port=db_config['port'],
+            dbname=db_config['dbname'],
+            user=db_config['user'],
+            password=db_config['password'],
+            application_name=APPLICATION_NAME
+        )
+        self.cache = QueryCache(cache_size, ttl)
+        self.marker_check_seconds = marker_check_seconds
+        self.markers = {}
+        self.marker_checked = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config_file(cls, **kwargs):
+        return cls(read_db_config(), **kwargs)
+
+    def close(self):
+        self.pool.closeall()
+
+    def fetch(self, sql, params):
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                columns = [col.name for col in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            conn.rollback()
+            return rows
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    def check_markers(self, tables):
+        """
+        Drop the cached results of any table whose refresh marker moved since
+        the last check. Without a watermark table (e.g., the tables are
+        loaded by datamart.py) only the TTL applies.
+        """
+        now = time.monotonic()
+        if self.marker_checked is not None and now - self.marker_checked < self.marker_check_seconds:
+            return
+        self.marker_checked = now
+        try:
+            rows = self.fetch(MARKER_SQL, (list(tables),))
+            markers = {row["table_name"]: row["refreshed_at"] for row in rows}
+        except psycopg2.errors.UndefinedTable:
+            markers = {}
+        with self.lock:
+            for table in tables:
+                if table in self.markers and self.markers[table] != markers.get(table):
+                    self.cache.invalidate(table)
+            self.markers = markers
+
+    def cached(self, table, name, sql, params):
+        self.check_markers(CACHED_TABLES)
+        key = (table, name) + tuple(sorted(params.items()))
+        with self.lock:
+            rows = self.cache.get(key)
+            marker = self.markers.get(table)
+        if rows is None:
+            rows = self.fetch(sql, params)
+            with self.lock:
+                # If the marker moved while the query ran, the rows may predate
+                # the refresh and the invalidation already happened; don't keep them
+                if self.markers.get(table) == marker:
+                    self.cache.put(key, rows)
+        return rows
+
+    def top_contributors(self, repo_group_id, year, month=None, n=10, order_by="lines_changed"):
+        """
+        The n contributors (by author email) with the most lines changed,
+        lines added or patches in a repo group for a year, or one month of it.
+        Returns:
+            list of dicts: email, affiliation, added, removed, lines_changed, patches
+        """
+        if order_by not in ORDER_BY:
+            raise ValueError(f"order_by must be one of {', '.join(ORDER_BY)}, got {order_by!r}")
+        table = "dm_repo_group_annual" if month is None else "dm_repo_group_monthly"
+        sql = TOP_CONTRIBUTORS_SQL.format(
+            table=table,
+            month_filter="" if month is None else "\n  AND month = %(month)s",
+            order_by=ORDER_BY[order_by]
+        )
+        params = {"repo_group_id": repo_group_id, "year": year, "n": n}
+        if month is not None:
+            params["month"] = month
+        return self.cached(table, f"top_contributors:{order_by}", sql, params)
+
+    def affiliation_totals(self, repo_group_id, year, month=None):
+        """
+        Contributors, lines and patches per affiliation in a repo group for a
+        year, or one month of it.
+        Returns:
+            list of dicts: affiliation, contributors, added, removed, lines_changed, patches
+        """
+        table = "dm_repo_group_annual" if month is None else "dm_repo_group_monthly"
+        sql = AFFILIATION_TOTALS_SQL.format(
+            table=table,
+            month_filter="" if month is None else "\n  AND month = %(month)s"
+        )
+        params = {"repo_group_id": repo_group_id, "year": year}
+        if month is not None:
+            params["month"] = month
+        return self.cached(table, "affiliation_totals", sql, params)
+
+    def repo_lines_changed(self, repo_id, start_year=0, end_year=9999):
+        """
+        Lines and patches per year for one repo.
+        Returns:
+            list of dicts: year, added, removed, lines_changed, patches, contributors
+        """
+        params = {"repo_id": repo_id, "start_year": start_year, "end_year": end_year}
+        return self.cached("dm_repo_annual", "repo_lines_changed", REPO_LINES_CHANGED_SQL, params)
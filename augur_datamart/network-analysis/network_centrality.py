@@ -0,0 +1,172 @@
+#SPDX-License-Identifier: MIT
+"""
+Centrality metrics over a contributor/repo network table, computed on the
+sparse graph from network_graph.py instead of in an external tool.
+
+Contributors and repos are treated as one undirected, weighted graph: a
+contributor is linked to every repo they acted on, weighted by the action
+count. For every node we compute degree, weighted degree, PageRank and its
+connected component, and store them per contributor and per repo. Each
+metric reports its runtime. With --memory each one runs a second time under
+tracemalloc to report its peak memory; tracing slows allocations down, so
+the timed run is left untraced.
+"""
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from network_graph import ContributorRepoGraph, check_table_name, connect, copy_rows
+
+PAGERANK_ALPHA = 0.85
+PAGERANK_TOL = 1e-10
+PAGERANK_MAX_ITER = 200
+
+RESULT_DDL = """
+DROP TABLE IF EXISTS {prefix}_contributor_centrality;
+CREATE TABLE {prefix}_contributor_centrality (
+  cntrb_id uuid PRIMARY KEY,
+  degree int,
+  weighted_degree bigint,
+  pagerank double precision,
+  component int
+);
+DROP TABLE IF EXISTS {prefix}_repo_centrality;
+CREATE TABLE {prefix}_repo_centrality (
+  repo_git varchar PRIMARY KEY,
+  degree int,
+  weighted_degree bigint,
+  pagerank double precision,
+  component int
+);
+"""
+
+
+def measure(name, func, *args, memory=False, **kwargs):
+    """
+    Run func, printing how long it took. With memory, run it again under
+    tracemalloc and print the peak memory that run allocated.
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    if not memory:
+        print(f"  {name:<18} {elapsed:>10.2f}s")
+        return result
+
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    print(f"  {name:<18} {elapsed:>10.2f}s  {peak / 2**20:>10.1f} MiB peak")
+    return result
+
+
+def adjacency(graph, weighted=True):
+    """
+    Symmetric adjacency over contributors then repos: rows 0..C-1 are
+    graph.contributors, rows C..C+R-1 are graph.repos.
+    """
+    w = graph.matrix if weighted else graph.binary()
+    return sp.bmat([[None, w], [w.T, None]], format="csr", dtype=np.float64)
+
+
+def degrees(graph):
+    return np.concatenate([graph.contributor_degree(), graph.repo_degree()])
+
+
+def weighted_degrees(graph):
+    return np.concatenate([graph.contributor_weighted_degree(), graph.repo_weighted_degree()])
+
+
+def pagerank(a, alpha=PAGERANK_ALPHA, tol=PAGERANK_TOL, max_iter=PAGERANK_MAX_ITER):
+    """
+    Power iteration on the random walk over a. Rank held by nodes with no
+    edges is spread evenly over every node.
+    Returns:
+        (ranks: ndarray summing to 1, iterations: int)
+    """
+    n = a.shape[0]
+    if n == 0:
+        return np.zeros(0), 0
+    out = np.asarray(a.sum(axis=1)).ravel()
+    dangling = out == 0
+    inv_out = np.divide(1.0, out, out=np.zeros_like(out), where=~dangling)
+    a_t = a.T.tocsr()
+
+    ranks = np.full(n, 1.0 / n)
+    for iteration in range(1, max_iter + 1):
+        spread = (alpha * ranks[dangling].sum() + 1.0 - alpha) / n
+        updated = alpha * (a_t @ (ranks * inv_out)) + spread
+        delta = np.abs(updated - ranks).sum()
+        ranks = updated
+        if delta < tol:
+            break
+    return ranks, iteration
+
+
+def components(a):
+    _, labels = connected_components(a, directed=False)
+    return labels
+
+
+def compute_centrality(graph, weighted=True, memory=False):
+    print("Metric timings:")
+    a = measure("adjacency", adjacency, graph, weighted, memory=memory)
+    result = {
+        "degree": measure("degree", degrees, graph, memory=memory),
+        "weighted_degree": measure("weighted degree", weighted_degrees, graph, memory=memory),
+    }
+    result["pagerank"], iterations = measure("pagerank", pagerank, a, memory=memory)
+    result["component"] = measure("components", components, a, memory=memory)
+
+    component_count = len(np.unique(result["component"]))
+    print(f"PageRank converged in {iterations} iterations; {component_count} connected components.")
+    return result
+
+
+def write_centrality(conn, graph, result, prefix):
+    check_table_name(prefix)
+    split = len(graph.contributors)
+    columns = "degree, weighted_degree, pagerank, component"
+    with conn.cursor() as cursor:
+        cursor.execute(RESULT_DDL.format(prefix=prefix))
+        copy_rows(cursor, f"{prefix}_contributor_centrality", f"cntrb_id, {columns}", zip(
+            graph.contributors,
+            result["degree"][:split],
+            result["weighted_degree"][:split],
+            result["pagerank"][:split],
+            result["component"][:split]
+        ))
+        copy_rows(cursor, f"{prefix}_repo_centrality", f"repo_git, {columns}", zip(
+            graph.repos,
+            result["degree"][split:],
+            result["weighted_degree"][split:],
+            result["pagerank"][split:],
+            result["component"][split:]
+        ))
+    conn.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Degree, PageRank and connected components of a contributor/repo network table.")
+    parser.add_argument("--table", default="analysis.cncf_in_and_out", help="Network table to read (default: analysis.cncf_in_and_out).")
+    parser.add_argument("--prefix", default=None, help="Prefix for the result tables (default: the input table name).")
+    parser.add_argument("--cncf-only", action="store_true", help="Only use rows with is_cncf = true.")
+    parser.add_argument("--unweighted", action="store_true", help="Ignore action counts when computing PageRank.")
+    parser.add_argument("--memory", action="store_true", help="Run every step a second time to report its peak memory.")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        start = time.perf_counter()
+        graph = measure("load (COPY)", ContributorRepoGraph.load, conn, args.table, args.cncf_only, memory=args.memory)
+        print(f"Loaded {graph.edge_count} edges: {len(graph.contributors)} contributors, {len(graph.repos)} repos.")
+        result = compute_centrality(graph, weighted=not args.unweighted, memory=args.memory)
+        write_centrality(conn, graph, result, args.prefix or args.table)
+        print(f"✅ Done in {time.perf_counter() - start:.1f}s")
+    finally:
+        conn.close()
@@ -0,0 +1,331 @@
+#SPDX-License-Identifier: MIT
+"""
+In-memory contributor/repo graph over a network table such as
+analysis.cncf_in_and_out (see networks.py).
+
+The edge list is pulled once with COPY and kept as a scipy CSR matrix,
+contributors by repos, with integer indices into sorted id arrays. The COPY
+output is parsed as it arrives: each id is replaced by an int32 code right
+away, so only the distinct ids are held as text, never the whole edge list. Degrees
+and the contributor-contributor and repo-repo projections come from sparse
+matrix products rather than self-joins in Postgres. Results are written
+back with COPY.
+"""
+import io
+import re
+import csv
+import json
+import time
+import argparse
+from array import array
+import numpy as np
+import scipy.sparse as sp
+import psycopg2
+
+CONFIG_FILE = "db.config.json"
+APPLICATION_NAME = "augur_datamart/network_graph"
+COPY_CHUNK_ROWS = 1000000
+
+TABLE_RE = re.compile(r'^[a-z_][a-z0-9_]*\.[a-z_][a-z0-9_]*$')
+
+EDGES_SQL = """
+SELECT cntrb_id, repo_git, sum(counter)
+FROM {table}
+WHERE cntrb_id IS NOT NULL AND repo_git IS NOT NULL{where}
+GROUP BY cntrb_id, repo_git
+"""
+
+RESULT_DDL = """
+DROP TABLE IF EXISTS {prefix}_contributor_stats;
+CREATE TABLE {prefix}_contributor_stats (cntrb_id uuid PRIMARY KEY, repos int, weighted_degree bigint);
+DROP TABLE IF EXISTS {prefix}_repo_stats;
+CREATE TABLE {prefix}_repo_stats (repo_git varchar PRIMARY KEY, contributors int, weighted_degree bigint);
+DROP TABLE IF EXISTS {prefix}_contributor_pairs;
+CREATE TABLE {prefix}_contributor_pairs (cntrb_a uuid, cntrb_b uuid, shared_repos int);
+DROP TABLE IF EXISTS {prefix}_repo_pairs;
+CREATE TABLE {prefix}_repo_pairs (repo_a varchar, repo_b varchar, shared_contributors int);
+"""
+
+# The SQL path the projection replaces: a self-join on the edge list
+SQL_PROJECTION = """
+WITH e AS (
+  SELECT DISTINCT cntrb_id, repo_git
+  FROM {table}
+  WHERE cntrb_id IS NOT NULL AND repo_git IS NOT NULL{where}
+),
+hubs AS (
+  SELECT repo_git FROM e GROUP BY repo_git HAVING count(*) > %(max_repo_degree)s
+)
+SELECT count(*) FROM (
+  SELECT a.cntrb_id, b.cntrb_id, count(*) AS shared_repos
+  FROM e a
+  JOIN e b ON a.repo_git = b.repo_git AND a.cntrb_id < b.cntrb_id
+  WHERE a.repo_git NOT IN (SELECT repo_git FROM hubs)
+  GROUP BY a.cntrb_id, b.cntrb_id
+) pairs;
+"""
+
+
+def read_db_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+
+def connect():
+    config = read_db_config()
+    return psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name=APPLICATION_NAME
+    )
+
+
+def check_table_name(table):
+    if not TABLE_RE.match(table):
+        raise ValueError(f"Table must be a lower-case schema.table name, got {table!r}")
+
+
+class EdgeReader(io.TextIOBase):
+    """
+    Target for copy_expert that parses the CSV rows of EDGES_SQL as they
+    arrive and keeps int32 codes per id, numbered in order of appearance.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.contributors, self.repos = {}, {}
+        self.rows, self.cols, self.weights = array("i"), array("i"), array("q")
+        self.partial = ""
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        text = self.partial + data
+        # Only parse complete records: a newline inside quotes is part of a field
+        end = text.rfind("\n") + 1
+        while end and text.count('"', 0, end) % 2:
+            end = text.rfind("\n", 0, end - 1) + 1
+        self.partial = text[end:]
+        contributors, repos = self.contributors, self.repos
+        for cntrb_id, repo_git, weight in csv.reader(io.StringIO(text[:end])):
+            self.rows.append(contributors.setdefault(cntrb_id, len(contributors)))
+            self.cols.append(repos.setdefault(repo_git, len(repos)))
+            self.weights.append(int(weight))
+        return len(data)
+
+
+def sorted_codes(index, codes):
+    """
+    Turn codes numbered in order of appearance into indices into the sorted
+    ids.
+    Returns:
+        (sorted ids, int32 indices)
+    """
+    ids = np.empty(len(index), dtype=object)
+    ids[:] = list(index)
+    order = np.argsort(ids)
+    rank = np.empty(len(ids), dtype=np.int32)
+    rank[order] = np.arange(len(ids), dtype=np.int32)
+    codes = np.frombuffer(codes, dtype=np.int32) if len(codes) else np.array([], dtype=np.int32)
+    return ids[order], rank[codes]
+
+
+class ContributorRepoGraph:
+    """
+    Bipartite contributor/repo graph. Row i of `matrix` is contributors[i],
+    column j is repos[j], and the value is the summed action count.
+    """
+
+    def __init__(self, contributors, repos, matrix):
+        self.contributors = contributors
+        self.repos = repos
+        self.matrix = matrix.tocsr()
+        self.matrix.sum_duplicates()
+
+    @classmethod
+    def from_edges(cls, contributor_ids, repo_ids, weights):
+        contributors, rows = np.unique(contributor_ids, return_inverse=True)
+        repos, cols = np.unique(repo_ids, return_inverse=True)
+        matrix = sp.csr_matrix(
+            (np.asarray(weights, dtype=np.int64), (rows, cols)),
+            shape=(len(contributors), len(repos))
+        )
+        return cls(contributors, repos, matrix)
+
+    @classmethod
+    def load(cls, conn, table, cncf_only=False):
+        check_table_name(table)
+        where = "\n  AND is_cncf" if cncf_only else ""
+        edges = EdgeReader()
+        with conn.cursor() as cursor:
+            cursor.copy_expert(f"COPY ({EDGES_SQL.format(table=table, where=where)}) TO STDOUT WITH (FORMAT csv)", edges)
+        if edges.partial:
+            edges.write("\n")
+
+        contributors, rows = sorted_codes(edges.contributors, edges.rows)
+        repos, cols = sorted_codes(edges.repos, edges.cols)
+        weights = np.frombuffer(edges.weights, dtype=np.int64) if len(edges.weights) else np.array([], dtype=np.int64)
+        del edges
+        matrix = sp.csr_matrix((weights, (rows, cols)), shape=(len(contributors), len(repos)))
+        return cls(contributors, repos, matrix)
+
+    @property
+    def edge_count(self):
+        return self.matrix.nnz
+
+    def binary(self):
+        b = self.matrix.copy()
+        b.data = np.ones_like(b.data, dtype=np.int32)
+        return b
+
+    def contributor_degree(self):
+        return np.diff(self.matrix.indptr)
+
+    def repo_degree(self):
+        return np.bincount(self.matrix.indices, minlength=len(self.repos))
+
+    def contributor_weighted_degree(self):
+        return np.asarray(self.matrix.sum(axis=1)).ravel()
+
+    def repo_weighted_degree(self):
+        return np.asarray(self.matrix.sum(axis=0)).ravel()
+
+    def contributor_projection(self, max_repo_degree=None):
+        """
+        Shared-repo counts between contributors, upper triangle only.
+        Repos with more than max_repo_degree contributors are left out, since
+        a single huge repo adds n^2/2 pairs on its own.
+        Returns:
+            scipy COO matrix, contributors by contributors
+        """
+        b = self.binary()
+        if max_repo_degree:
+            b = b[:, np.flatnonzero(self.repo_degree() <= max_repo_degree)]
+        pairs = sp.triu(b @ b.T, k=1, format="coo")
+        pairs.eliminate_zeros()
+        return pairs
+
+    def repo_projection(self):
+        """
+        Shared-contributor counts between repos, upper triangle only.
+        Returns:
+            scipy COO matrix, repos by repos
+        """
+        b = self.binary()
+        pairs = sp.triu(b.T @ b, k=1, format="coo")
+        pairs.eliminate_zeros()
+        return pairs
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    COPY an iterable of tuples into table as CSV, COPY_CHUNK_ROWS at a time
+    so the text buffer stays bounded.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % COPY_CHUNK_ROWS == 0:
+            buf.seek(0)
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buf)
+            buf = io.StringIO()
+            writer = csv.writer(buf, lineterminator="\n")
+    if buf.tell():
+        buf.seek(0)
+        cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def write_results(conn, graph, prefix, max_repo_degree=None):
+    check_table_name(prefix)
+    with conn.cursor() as cursor:
+        cursor.execute(RESULT_DDL.format(prefix=prefix))
+
+        copy_rows(cursor, f"{prefix}_contributor_stats", "cntrb_id, repos, weighted_degree", zip(
+            graph.contributors, graph.contributor_degree(), graph.contributor_weighted_degree()
+        ))
+        copy_rows(cursor, f"{prefix}_repo_stats", "repo_git, contributors, weighted_degree", zip(
+            graph.repos, graph.repo_degree(), graph.repo_weighted_degree()
+        ))
+
+        pairs = graph.contributor_projection(max_repo_degree)
+        copy_rows(cursor, f"{prefix}_contributor_pairs", "cntrb_a, cntrb_b, shared_repos", zip(
+            graph.contributors[pairs.row], graph.contributors[pairs.col], pairs.data
+        ))
+        print(f"Wrote {pairs.nnz} contributor pairs.")
+
+        pairs = graph.repo_projection()
+        copy_rows(cursor, f"{prefix}_repo_pairs", "repo_a, repo_b, shared_contributors", zip(
+            graph.repos[pairs.row], graph.repos[pairs.col], pairs.data
+        ))
+        print(f"Wrote {pairs.nnz} repo pairs.")
+    conn.commit()
+
+
+def benchmark(conn, table, cncf_only=False, max_repo_degree=None):
+    check_table_name(table)
+    where = "\n    AND is_cncf" if cncf_only else ""
+    # With no cap, nothing counts as a hub
+    cap = max_repo_degree or np.iinfo(np.int64).max
+
+    print("Running the SQL self-join projection...")
+    start = time.perf_counter()
+    with conn.cursor() as cursor:
+        cursor.execute(SQL_PROJECTION.format(table=table, where=where), {"max_repo_degree": int(cap)})
+        sql_pairs = cursor.fetchone()[0]
+    sql_time = time.perf_counter() - start
+
+    print("Running the in-memory projection...")
+    start = time.perf_counter()
+    graph = ContributorRepoGraph.load(conn, table, cncf_only)
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    pairs = graph.contributor_projection(max_repo_degree)
+    project_time = time.perf_counter() - start
+    conn.rollback()
+
+    print("\nContributor projection timings:")
+    print(f"  {'SQL self-join':<22} {sql_time:>10.1f}s  {sql_pairs} pairs")
+    print(f"  {'CSR load (COPY)':<22} {load_time:>10.1f}s  {graph.edge_count} edges")
+    print(f"  {'CSR projection':<22} {project_time:>10.1f}s  {pairs.nnz} pairs")
+    if sql_pairs != pairs.nnz:
+        print("⚠️  Pair counts differ between the two paths.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Degrees and projections of a contributor/repo network table.")
+    parser.add_argument("--table", default="analysis.cncf_in_and_out", help="Network table to read (default: analysis.cncf_in_and_out).")
+    parser.add_argument("--prefix", default=None, help="Prefix for the result tables (default: the input table name).")
+    parser.add_argument("--cncf-only", action="store_true", help="Only use rows with is_cncf = true.")
+    parser.add_argument(
+        "--max-repo-degree",
+        type=int,
+        default=None,
+        help="Leave repos with more contributors than this out of the contributor projection."
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Time the SQL self-join projection against the in-memory one and exit without writing results."
+    )
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        if args.benchmark:
+            benchmark(conn, args.table, args.cncf_only, args.max_repo_degree)
+        else:
+            start = time.perf_counter()
+            graph = ContributorRepoGraph.load(conn, args.table, args.cncf_only)
+            print(f"Loaded {graph.edge_count} edges: {len(graph.contributors)} contributors, "
+                  f"{len(graph.repos)} repos in {time.perf_counter() - start:.1f}s")
+            write_results(conn, graph, args.prefix or args.table, args.max_repo_degree)
+            print(f"✅ Done in {time.perf_counter() - start:.1f}s")
+    finally:
+        conn.close()
@@ -0,0 +1,376 @@
+#SPDX-License-Identifier: MIT
+"""
+Builds the contributor network table that networks.sql creates
+(analysis.cncf_in_and_out by default) for any user's repo groups.
+
+The table is range partitioned by action_day into monthly partitions. The
+first run (or --full) builds everything. Later runs re-derive the last
+--lookback-days days before the last day already in the table, and anything
+newer. Contributors who joined the cohort since the last run get their whole
+history backfilled.
+
+The refresh is keyed on when actions happened, not when they were collected.
+Activity collected late for a day before the look-back window, e.g. the
+history of a repo newly added to a group for contributors already in the
+table, is not picked up. Run --full periodically to catch it.
+
+Every run also keeps a snapshot of the contributor/repo edge set (summed
+counter per cntrb_id, repo_git) with a hash per contributor, and appends what
+changed to {table}_edge_delta as added, removed or reweighted edges. Only
+contributors whose rows were rebuilt are re-hashed, and only those whose hash
+changed are diffed against the snapshot.
+"""
+import re
+import json
+import time
+import argparse
+from datetime import date, timedelta
+import psycopg2
+
+CONFIG_FILE = "db.config.json"
+APPLICATION_NAME = "augur_datamart/networks"
+LOOKBACK_DAYS = 30
+
+TABLE_RE = re.compile(r'^[a-z_][a-z0-9_]*\.[a-z_][a-z0-9_]*$')
+
+TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+  cntrb_id uuid,
+  reverse varchar,
+  repo_id bigint,
+  repo_name varchar,
+  repo_git varchar,
+  full_repo_context text,
+  action varchar,
+  action_day date,
+  counter bigint,
+  is_cncf boolean
+) PARTITION BY RANGE (action_day){tablespace};
+CREATE TABLE IF NOT EXISTS {table}_pdefault PARTITION OF {table} DEFAULT{tablespace};
+CREATE INDEX IF NOT EXISTS {name}_cntrb_id_idx ON {table} (cntrb_id);
+"""
+
+# Everyone who has acted on a repo in the selected groups
+COHORT_SQL = """
+CREATE TEMP TABLE network_cohort ON COMMIT DROP AS
+SELECT DISTINCT eca.cntrb_id
+FROM augur_data.explorer_contributor_actions eca
+WHERE eca.repo_id IN (
+  SELECT ur.repo_id
+  FROM augur_operations.user_groups ug
+  JOIN augur_operations.user_repos ur ON ug.group_id = ur.group_id
+  WHERE ug.user_id = %(user_id)s
+    AND ug.group_id = ANY(%(group_ids)s)
+);
+CREATE UNIQUE INDEX ON network_cohort (cntrb_id);
+ANALYZE network_cohort;
+"""
+
+# Cohort members with no rows in the table yet need their full history
+NEW_MEMBERS_SQL = """
+CREATE TEMP TABLE network_new_members ON COMMIT DROP AS
+SELECT nc.cntrb_id
+FROM network_cohort nc
+WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.cntrb_id = nc.cntrb_id);
+ANALYZE network_new_members;
+"""
+
+# Same shape as networks.sql. {since} limits both sides to recent days
+# unless the contributor is new to the table.
+STAGE_SQL = """
+CREATE TEMP TABLE network_stage ON COMMIT DROP AS
+WITH main_actions AS (
+    SELECT
+        eca.cntrb_id,
+        reverse(c.gh_login) AS reverse,
+        eca.repo_id,
+        repo.repo_name,
+        repo.repo_git,
+        SPLIT_PART(SPLIT_PART(repo.repo_git, 'github.com/', 2), '.git', 1) AS full_repo_context,
+        eca.action,
+        DATE_TRUNC('day', eca.created_at)::date AS action_day,
+        COUNT(*) AS counter,
+        TRUE AS is_cncf
+    FROM augur_data.explorer_contributor_actions eca
+    JOIN augur_data.repo repo ON eca.repo_id = repo.repo_id
+    JOIN augur_data.contributors c ON eca.cntrb_id = c.cntrb_id
+    WHERE eca.cntrb_id IN (SELECT cntrb_id FROM network_cohort){eca_since}
+    GROUP BY eca.cntrb_id, c.gh_login, eca.repo_id, repo.repo_name, repo.repo_git, eca.action, action_day
+),
+contributor_activity AS (
+    SELECT
+        cr.cntrb_id,
+        reverse(c.gh_login) AS reverse,
+        0 AS repo_id,
+        'n/a' AS repo_name,
+        cr.repo_git,
+        SPLIT_PART(SPLIT_PART(cr.repo_git, 'github.com/', 2), '.git', 1) AS full_repo_context,
+        cr.cntrb_category AS action,
+        DATE_TRUNC('day', cr.created_at)::date AS action_day,
+        COUNT(*) AS counter,
+        FALSE AS is_cncf
+    FROM augur_data.contributor_repo cr
+    JOIN augur_data.contributors c ON cr.cntrb_id = c.cntrb_id
+    WHERE cr.cntrb_id IN (SELECT cntrb_id FROM network_cohort){cr_since}
+    GROUP BY cr.cntrb_id, c.gh_login, cr.cntrb_category, cr.repo_git, action_day
+)
+SELECT * FROM main_actions
+UNION ALL
+SELECT * FROM contributor_activity;
+"""
+
+SNAPSHOT_DDL = """
+CREATE TABLE IF NOT EXISTS {table}_edges (
+  cntrb_id uuid,
+  repo_git varchar,
+  weight bigint,
+  PRIMARY KEY (cntrb_id, repo_git)
+){tablespace};
+CREATE TABLE IF NOT EXISTS {table}_edge_hash (
+  cntrb_id uuid PRIMARY KEY,
+  edges int,
+  edge_hash numeric
+){tablespace};
+CREATE TABLE IF NOT EXISTS {table}_edge_delta (
+  changed_at timestamptz,
+  cntrb_id uuid,
+  repo_git varchar,
+  change varchar,
+  old_weight bigint,
+  new_weight bigint
+){tablespace};
+CREATE INDEX IF NOT EXISTS {name}_edge_delta_changed_at_idx ON {table}_edge_delta (changed_at);
+"""
+
+# Contributors whose rows this run deleted or re-staged
+TOUCHED_DDL = """
+CREATE TEMP TABLE network_touched (cntrb_id uuid PRIMARY KEY) ON COMMIT DROP;
+"""
+
+# Current edges and per-contributor hash for the touched contributors. The
+# hash is a sum, so it does not depend on row order.
+EDGES_SQL = """
+CREATE TEMP TABLE network_edges ON COMMIT DROP AS
+SELECT t.cntrb_id, t.repo_git, sum(t.counter) AS weight
+FROM {table} t
+WHERE t.cntrb_id IN (SELECT cntrb_id FROM network_touched)
+  AND t.repo_git IS NOT NULL
+GROUP BY t.cntrb_id, t.repo_git;
+CREATE TEMP TABLE network_edge_hash ON COMMIT DROP AS
+SELECT cntrb_id, count(*) AS edges, sum(hashtextextended(repo_git || ':' || weight, 0)) AS edge_hash
+FROM network_edges
+GROUP BY cntrb_id;
+CREATE TEMP TABLE network_changed ON COMMIT DROP AS
+SELECT tc.cntrb_id
+FROM network_touched tc
+LEFT JOIN network_edge_hash n ON n.cntrb_id = tc.cntrb_id
+LEFT JOIN {table}_edge_hash o ON o.cntrb_id = tc.cntrb_id
+WHERE n.edge_hash IS DISTINCT FROM o.edge_hash
+   OR n.edges IS DISTINCT FROM o.edges;
+CREATE UNIQUE INDEX ON network_changed (cntrb_id);
+ANALYZE network_changed;
+"""
+
+DELTA_SQL = """
+INSERT INTO {table}_edge_delta
+SELECT
+  now(),
+  coalesce(n.cntrb_id, o.cntrb_id),
+  coalesce(n.repo_git, o.repo_git),
+  CASE WHEN o.cntrb_id IS NULL THEN 'added'
+       WHEN n.cntrb_id IS NULL THEN 'removed'
+       ELSE 'reweighted' END,
+  o.weight,
+  n.weight
+FROM (SELECT * FROM network_edges WHERE cntrb_id IN (SELECT cntrb_id FROM network_changed)) n
+FULL JOIN (SELECT * FROM {table}_edges WHERE cntrb_id IN (SELECT cntrb_id FROM network_changed)) o
+  ON n.cntrb_id = o.cntrb_id AND n.repo_git = o.repo_git
+WHERE n.weight IS DISTINCT FROM o.weight;
+DELETE FROM {table}_edges WHERE cntrb_id IN (SELECT cntrb_id FROM network_changed);
+INSERT INTO {table}_edges
+SELECT * FROM network_edges WHERE cntrb_id IN (SELECT cntrb_id FROM network_changed);
+DELETE FROM {table}_edge_hash WHERE cntrb_id IN (SELECT cntrb_id FROM network_changed);
+INSERT INTO {table}_edge_hash
+SELECT * FROM network_edge_hash WHERE cntrb_id IN (SELECT cntrb_id FROM network_changed);
+"""
+
+SINCE_SQL = """
+      AND ({alias}.created_at >= %(since)s
+           OR {alias}.cntrb_id IN (SELECT cntrb_id FROM network_new_members))"""
+
+
+def read_db_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def ensure_partitions(cursor, table, first_day, last_day, tablespace=""):
+    """
+    Create the monthly partitions covering first_day..last_day. Rows that
+    would land in a new month are moved out of the default partition first,
+    since Postgres refuses to attach a range the default partition overlaps.
+    """
+    month = month_start(first_day)
+    while month <= last_day:
+        end = next_month(month)
+        partition = f"{table}_p{month:%Y%m}"
+        cursor.execute("SELECT to_regclass(%s);", (partition,))
+        if cursor.fetchone()[0] is None:
+            cursor.execute(f"CREATE TEMP TABLE network_moved (LIKE {table}) ON COMMIT DROP;")
+            cursor.execute(f"""
+                WITH moved AS (
+                  DELETE FROM {table}_pdefault
+                  WHERE action_day >= %(start)s AND action_day < %(end)s
+                  RETURNING *
+                )
+                INSERT INTO network_moved SELECT * FROM moved;
+            """, {"start": month, "end": end})
+            cursor.execute(
+                f"CREATE TABLE {partition} PARTITION OF {table} "
+                f"FOR VALUES FROM (%(start)s) TO (%(end)s){tablespace};",
+                {"start": month, "end": end}
+            )
+            cursor.execute(f"INSERT INTO {table} SELECT * FROM network_moved;")
+            cursor.execute("DROP TABLE network_moved;")
+        month = end
+
+
+def record_edge_delta(cursor, table):
+    """
+    Diff the touched contributors' edges against the snapshot, append the
+    changes to {table}_edge_delta and bring the snapshot up to date.
+    """
+    cursor.execute(EDGES_SQL.format(table=table))
+    cursor.execute("SELECT count(*) FROM network_touched;")
+    touched = cursor.fetchone()[0]
+    cursor.execute("SELECT count(*) FROM network_changed;")
+    changed = cursor.fetchone()[0]
+    cursor.execute(DELTA_SQL.format(table=table))
+    cursor.execute(f"""
+        SELECT change, count(*)
+        FROM {table}_edge_delta
+        WHERE changed_at = now()
+        GROUP BY change;
+    """)
+    counts = dict(cursor.fetchall())
+    print(f"Edge delta: {changed} of {touched} re-hashed contributors changed; "
+          f"{counts.get('added', 0)} added, {counts.get('removed', 0)} removed, "
+          f"{counts.get('reweighted', 0)} reweighted edges.")
+
+
+def build_network(table, user_id, group_ids, full=False, tablespace=None, lookback_days=LOOKBACK_DAYS):
+    if not TABLE_RE.match(table):
+        raise ValueError(f"Table must be a lower-case schema.table name, got {table!r}")
+    name = table.split(".", 1)[1]
+    tablespace = f" TABLESPACE {tablespace}" if tablespace else ""
+    params = {"user_id": user_id, "group_ids": group_ids}
+
+    config = read_db_config()
+    conn = psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        dbname=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        application_name=APPLICATION_NAME
+    )
+    cursor = conn.cursor()
+    start = time.perf_counter()
+
+    try:
+        if full:
+            print(f"Dropping {table}...")
+            cursor.execute(f"DROP TABLE IF EXISTS {table};")
+        cursor.execute(TABLE_DDL.format(table=table, name=name, tablespace=tablespace))
+        cursor.execute(SNAPSHOT_DDL.format(table=table, name=name, tablespace=tablespace))
+        cursor.execute(TOUCHED_DDL)
+
+        cursor.execute(f"SELECT max(action_day) FROM {table};")
+        since = cursor.fetchone()[0]
+        if since is not None:
+            # Activity for recent days keeps arriving after we built them
+            since -= timedelta(days=lookback_days)
+        if since is None:
+            # Everyone in the last snapshot is re-checked on a full build
+            cursor.execute(f"INSERT INTO network_touched SELECT cntrb_id FROM {table}_edge_hash;")
+
+        cursor.execute(COHORT_SQL, params)
+        cursor.execute("SELECT count(*) FROM network_cohort;")
+        print(f"Cohort for user {user_id}, groups {group_ids}: {cursor.fetchone()[0]} contributors.")
+
+        if since is None:
+            print(f"Building {table} from all activity...")
+            eca_since = cr_since = ""
+        else:
+            cursor.execute(NEW_MEMBERS_SQL.format(table=table))
+            cursor.execute("SELECT count(*) FROM network_new_members;")
+            print(f"Refreshing {table} from {since} on; "
+                  f"backfilling {cursor.fetchone()[0]} new contributors.")
+            params["since"] = since
+            eca_since = SINCE_SQL.format(alias="eca")
+            cr_since = SINCE_SQL.format(alias="cr")
+            cursor.execute(f"""
+                WITH gone AS (
+                  DELETE FROM {table} WHERE action_day >= %(since)s RETURNING cntrb_id
+                )
+                INSERT INTO network_touched
+                SELECT DISTINCT cntrb_id FROM gone WHERE cntrb_id IS NOT NULL
+                ON CONFLICT DO NOTHING;
+            """, params)
+
+        cursor.execute(STAGE_SQL.format(eca_since=eca_since, cr_since=cr_since), params)
+        cursor.execute("SELECT min(action_day), max(action_day), count(*) FROM network_stage;")
+        first_day, last_day, staged = cursor.fetchone()
+
+        if staged:
+            if first_day is not None:
+                ensure_partitions(cursor, table, first_day, last_day, tablespace)
+            cursor.execute(f"INSERT INTO {table} SELECT * FROM network_stage;")
+            cursor.execute(f"ANALYZE {table};")
+            cursor.execute("""
+                INSERT INTO network_touched
+                SELECT DISTINCT cntrb_id FROM network_stage WHERE cntrb_id IS NOT NULL
+                ON CONFLICT DO NOTHING;
+            """)
+        record_edge_delta(cursor, table)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Wrote {staged} rows to {table} in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or refresh a contributor network table for a set of repo groups.")
+    parser.add_argument("--user-id", type=int, required=True, help="augur_operations.user_groups.user_id")
+    parser.add_argument("--group-ids", type=int, nargs="+", required=True, help="augur_operations.user_groups.group_id values")
+    parser.add_argument("--table", default="analysis.cncf_in_and_out", help="Target table (default: analysis.cncf_in_and_out).")
+    parser.add_argument("--tablespace", default=None, help="Tablespace for the table and its partitions, e.g. speed.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Drop and rebuild the table from all activity. Run it periodically: incremental runs miss activity "
+             "collected late for days before the look-back window."
+    )
+    parser.add_argument(
+        "--lookback-days",
+        type=int,
+        default=LOOKBACK_DAYS,
+        help=f"Days before the last day in the table to re-derive on each incremental run (default: {LOOKBACK_DAYS})."
+    )
+    args = parser.parse_args()
+    build_network(args.table, args.user_id, args.group_ids, full=args.full, tablespace=args.tablespace,
+                  lookback_days=args.lookback_days)
@@ -0,0 +1,374 @@
+#SPDX-License-Identifier: MIT
+"""
+Lock contention sampler: lock_check.sql, but running all the time.
+
+`python lock_sampler.py run` polls pg_stat_activity and pg_blocking_pids()
+every few seconds. When something is waiting on a lock, it prints the
+blocking tree. Roots are the sessions holding everyone up, often idle in
+transaction. It also stores one row per waiting session in a local SQLite
+file. Idle periods cost nothing, and queries are stored once, as
+fingerprints with literals stripped.
+
+`python lock_sampler.py report --since 24h` works out the worst blockers
+(by root query fingerprint), the most contended relations and, with
+--series, wait time per relation over time. That makes it possible to find
+out afterwards what held up a merge or a datamart build overnight.
+"""
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime
+import psycopg2
+
+APPLICATION_NAME = "augur_monitor/lock_sampler"
+STORE = "lock_samples.sqlite"
+INTERVAL = 5
+RETENTION_DAYS = 14
+TOP = 10
+QUERY_WIDTH = 80
+
+# Sessions that are blocked and the sessions blocking them. pg_locks.waitstart
+# only exists from Postgres 14 on; older servers use query_start instead.
+SAMPLE_SQL = """
+WITH sessions AS (
+  SELECT pid, pg_blocking_pids(pid) AS blockers FROM pg_stat_activity
+),
+blocked AS (
+  SELECT pid, blockers FROM sessions WHERE cardinality(blockers) > 0
+)
+SELECT
+  a.pid,
+  coalesce(b.blockers, '{{}}'),
+  a.state,
+  a.application_name,
+  a.query,
+  extract(epoch FROM now()),
+  extract(epoch FROM {wait_start}),
+  extract(epoch FROM a.xact_start),
+  coalesce(l.relation::regclass::text, l.locktype),
+  l.mode
+FROM pg_stat_activity a
+LEFT JOIN blocked b ON b.pid = a.pid
+LEFT JOIN LATERAL (
+  SELECT * FROM pg_locks WHERE pid = a.pid AND NOT granted LIMIT 1
+) l ON b.pid IS NOT NULL
+WHERE a.pid IN (SELECT pid FROM blocked UNION SELECT unnest(blockers) FROM blocked);
+"""
+
+STORE_DDL = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+  id INTEGER PRIMARY KEY,
+  hash TEXT UNIQUE NOT NULL,
+  query TEXT
+);
+CREATE TABLE IF NOT EXISTS relations (
+  id INTEGER PRIMARY KEY,
+  name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS waits (
+  sampled_at INTEGER NOT NULL,
+  pid INTEGER NOT NULL,
+  wait_start INTEGER NOT NULL,
+  wait_seconds REAL NOT NULL,
+  relation_id INTEGER,
+  mode TEXT,
+  fingerprint_id INTEGER,
+  root_pid INTEGER,
+  root_fingerprint_id INTEGER,
+  root_state TEXT
+);
+CREATE INDEX IF NOT EXISTS waits_sampled_at ON waits (sampled_at);
+"""
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+SPACE_RE = re.compile(r"\s+")
+DURATION_RE = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def load_config(filename="db.config.json"):
+    with open(filename, "r") as f:
+        return json.load(f)
+
+
+def fingerprint(query):
+    """
+    Normalize a query so that runs with different literals match.
+    Returns:
+        (hash, normalized query)
+    """
+    normalized = LITERAL_RE.sub("?", query or "")
+    normalized = LIST_RE.sub("(...)", normalized)
+    normalized = SPACE_RE.sub(" ", normalized).strip()
+    return hashlib.md5(normalized.encode()).hexdigest()[:16], normalized
+
+
+def parse_duration(text):
+    m = DURATION_RE.match(text)
+    if not m:
+        raise argparse.ArgumentTypeError(f"expected a duration like 30m, 24h or 7d, got {text}")
+    return float(m.group(1)) * UNITS[m.group(2)]
+
+
+def short(text, width=QUERY_WIDTH):
+    text = SPACE_RE.sub(" ", text or "").strip()
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+def open_store(path):
+    store = sqlite3.connect(path)
+    store.executescript(STORE_DDL)
+    return store
+
+
+def relation_id(store, cache, name):
+    if name is None:
+        return None
+    if name not in cache:
+        store.execute("INSERT OR IGNORE INTO relations (name) VALUES (?);", (name,))
+        cache[name] = store.execute("SELECT id FROM relations WHERE name = ?;", (name,)).fetchone()[0]
+    return cache[name]
+
+
+def fingerprint_id(store, cache, query):
+    if query is None:
+        return None
+    digest, normalized = fingerprint(query)
+    if digest not in cache:
+        store.execute("INSERT OR IGNORE INTO fingerprints (hash, query) VALUES (?, ?);", (digest, normalized))
+        cache[digest] = store.execute("SELECT id FROM fingerprints WHERE hash = ?;", (digest,)).fetchone()[0]
+    return cache[digest]
+
+
+def find_root(pid, sessions):
+    """
+    Follow the first blocker up to a session that is not blocked itself.
+    """
+    seen = set()
+    while sessions.get(pid, {}).get("blockers") and pid not in seen:
+        seen.add(pid)
+        pid = sessions[pid]["blockers"][0]
+    return pid
+
+
+def print_tree(sessions, now):
+    children = {}
+    for pid, s in sessions.items():
+        for blocker in s["blockers"][:1]:
+            children.setdefault(blocker, []).append(pid)
+    roots = [pid for pid in sessions if not sessions[pid]["blockers"]]
+
+    def walk(pid, depth):
+        s = sessions.get(pid)
+        if s is None:
+            print(f"{'  ' * depth}{pid} (gone)")
+            return
+        if s["blockers"]:
+            detail = f"waits {now - s['wait_start']:.0f}s on {s['relation']} ({s['mode']})"
+        else:
+            held = f"{now - s['xact_start']:.0f}s" if s["xact_start"] else "?"
+            detail = f"{s['state']}, transaction open {held}"
+        prefix = "  " * depth + ("└ " if depth else "")
+        print(f"{prefix}{pid} [{s['application_name'] or '-'}] {detail}: {short(s['query'])}")
+        for child in sorted(children.get(pid, [])):
+            walk(child, depth + 1)
+
+    print(f"--- {datetime.fromtimestamp(now):%Y-%m-%d %H:%M:%S}: "
+          f"{sum(1 for s in sessions.values() if s['blockers'])} sessions waiting")
+    for root in sorted(roots):
+        walk(root, 0)
+
+
+def sample_sql(cursor):
+    cursor.execute("SHOW server_version_num;")
+    version = int(cursor.fetchone()[0])
+    wait_start = "coalesce(l.waitstart, a.query_start)" if version >= 140000 else "a.query_start"
+    return SAMPLE_SQL.format(wait_start=wait_start)
+
+
+def take_sample(cursor, sample_query):
+    cursor.execute(sample_query)
+    sessions, now = {}, time.time()
+    for (pid, blockers, state, application_name, query, now, wait_start, xact_start,
+         relation, mode) in cursor.fetchall():
+        now = float(now)
+        sessions[pid] = {
+            "blockers": list(blockers),
+            "state": state,
+            "application_name": application_name,
+            "query": query,
+            "wait_start": float(wait_start) if wait_start is not None else now,
+            "xact_start": float(xact_start) if xact_start is not None else None,
+            "relation": relation,
+            "mode": mode,
+        }
+    return sessions, now
+
+
+def record(store, caches, sessions, now):
+    rows = []
+    for pid, s in sessions.items():
+        if not s["blockers"]:
+            continue
+        root = find_root(pid, sessions)
+        root_session = sessions.get(root, {})
+        rows.append((
+            int(now),
+            pid,
+            int(s["wait_start"]),
+            now - s["wait_start"],
+            relation_id(store, caches["relations"], s["relation"]),
+            s["mode"],
+            fingerprint_id(store, caches["fingerprints"], s["query"]),
+            root,
+            fingerprint_id(store, caches["fingerprints"], root_session.get("query")),
+            root_session.get("state"),
+        ))
+    store.executemany("INSERT INTO waits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);", rows)
+    store.commit()
+    return len(rows)
+
+
+def run(store_path=STORE, interval=INTERVAL, retention_days=RETENTION_DAYS, quiet=False):
+    config = load_config()
+    store = open_store(store_path)
+    caches = {"relations": {}, "fingerprints": {}}
+    conn = None
+    sample_query = None
+    last_purge = 0
+    print(f"Sampling locks every {interval}s into {store_path}. Ctrl-C to stop.")
+    try:
+        while True:
+            started = time.time()
+            try:
+                if conn is None or conn.closed:
+                    conn = psycopg2.connect(**config, application_name=APPLICATION_NAME)
+                    conn.autocommit = True
+                    with conn.cursor() as cursor:
+                        sample_query = sample_sql(cursor)
+                with conn.cursor() as cursor:
+                    sessions, now = take_sample(cursor, sample_query)
+            except psycopg2.OperationalError as e:
+                print(f"⚠️  {str(e).strip()}; reconnecting")
+                conn = None
+                time.sleep(interval)
+                continue
+
+            if sessions:
+                record(store, caches, sessions, now)
+                if not quiet:
+                    print_tree(sessions, now)
+
+            if started - last_purge > 3600:
+                store.execute("DELETE FROM waits WHERE sampled_at < ?;", (int(started - retention_days * 86400),))
+                store.commit()
+                last_purge = started
+            time.sleep(max(0, interval - (time.time() - started)))
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        store.close()
+        if conn is not None:
+            conn.close()
+
+
+# One wait episode is one (pid, wait_start); its length is the longest wait
+# seen for it
+EPISODES_SQL = """
+WITH episodes AS (
+  SELECT pid, wait_start, max(wait_seconds) AS seconds, relation_id, fingerprint_id,
+         root_fingerprint_id, root_state, min(sampled_at) AS first_seen
+  FROM waits
+  WHERE sampled_at >= ?
+  GROUP BY pid, wait_start
+)
+"""
+
+BLOCKERS_SQL = EPISODES_SQL + """
+SELECT f.query, count(*), sum(e.seconds), max(e.seconds), group_concat(DISTINCT e.root_state)
+FROM episodes e LEFT JOIN fingerprints f ON f.id = e.root_fingerprint_id
+GROUP BY e.root_fingerprint_id
+ORDER BY sum(e.seconds) DESC
+LIMIT ?;
+"""
+
+RELATIONS_SQL = EPISODES_SQL + """
+SELECT r.name, count(*), sum(e.seconds), max(e.seconds)
+FROM episodes e LEFT JOIN relations r ON r.id = e.relation_id
+GROUP BY e.relation_id
+ORDER BY sum(e.seconds) DESC
+LIMIT ?;
+"""
+
+WAITERS_SQL = EPISODES_SQL + """
+SELECT f.query, count(*), sum(e.seconds), max(e.seconds)
+FROM episodes e LEFT JOIN fingerprints f ON f.id = e.fingerprint_id
+GROUP BY e.fingerprint_id
+ORDER BY sum(e.seconds) DESC
+LIMIT ?;
+"""
+
+SERIES_SQL = """
+SELECT sampled_at / ? * ? AS bucket, r.name, count(DISTINCT pid), max(wait_seconds)
+FROM waits w LEFT JOIN relations r ON r.id = w.relation_id
+WHERE sampled_at >= ?
+GROUP BY bucket, w.relation_id
+ORDER BY bucket, max(wait_seconds) DESC;
+"""
+
+
+def report(store_path=STORE, since=86400, top=TOP, series=None):
+    store = open_store(store_path)
+    start = int(time.time() - since)
+    try:
+        print(f"Lock waits since {datetime.fromtimestamp(start):%Y-%m-%d %H:%M:%S}")
+
+        print("\nWorst blockers (root of the blocking tree):")
+        print(f"{'waits':>7} {'total s':>10} {'max s':>9}  state / query")
+        for query, count, total, longest, states in store.execute(BLOCKERS_SQL, (start, top)):
+            print(f"{count:>7} {total:>10.0f} {longest:>9.0f}  [{states or '?'}] {short(query)}")
+
+        print("\nMost contended relations:")
+        print(f"{'waits':>7} {'total s':>10} {'max s':>9}  relation")
+        for name, count, total, longest in store.execute(RELATIONS_SQL, (start, top)):
+            print(f"{count:>7} {total:>10.0f} {longest:>9.0f}  {name or '?'}")
+
+        print("\nLongest waiting queries:")
+        print(f"{'waits':>7} {'total s':>10} {'max s':>9}  query")
+        for query, count, total, longest in store.execute(WAITERS_SQL, (start, top)):
+            print(f"{count:>7} {total:>10.0f} {longest:>9.0f}  {short(query)}")
+
+        if series:
+            bucket = int(series)
+            print(f"\nWaits per relation every {bucket}s:")
+            print(f"{'time':<20} {'waiting':>8} {'max s':>9}  relation")
+            for ts, name, waiting, longest in store.execute(SERIES_SQL, (bucket, bucket, start)):
+                print(f"{datetime.fromtimestamp(ts):%Y-%m-%d %H:%M:%S}  {waiting:>8} {longest:>9.0f}  {name or '?'}")
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sample lock waits and blocking trees, and report on them later.")
+    parser.add_argument("--store", default=STORE, help=f"SQLite file for the samples (default: {STORE}).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Sample until stopped.")
+    run_parser.add_argument("--interval", type=float, default=INTERVAL, help=f"Seconds between samples (default: {INTERVAL}).")
+    run_parser.add_argument("--retention-days", type=float, default=RETENTION_DAYS, help=f"Days of samples to keep (default: {RETENTION_DAYS}).")
+    run_parser.add_argument("--quiet", action="store_true", help="Do not print blocking trees, only store them.")
+
+    report_parser = commands.add_parser("report", help="Report the worst blockers and relations.")
+    report_parser.add_argument("--since", type=parse_duration, default=parse_duration("24h"), help="Window to report on, e.g. 30m, 24h, 7d (default: 24h).")
+    report_parser.add_argument("--top", type=int, default=TOP, help=f"Rows per section (default: {TOP}).")
+    report_parser.add_argument("--series", type=parse_duration, default=None, help="Also print waits per relation in buckets of this size, e.g. 5m.")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args.store, args.interval, args.retention_days, args.quiet)
+    else:
+        report(args.store, args.since, args.top, args.series)
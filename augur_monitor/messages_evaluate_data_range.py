@@ -4,6 +4,8 @@ import json
 import csv
 from concurrent.futures import ThreadPoolExecutor
 
+APPLICATION_NAME = "augur_monitor/messages_evaluate_data_range"
+
 # Load DB config
 def load_config(filename="db.config.json"):
     with open(filename, "r") as f:
@@ -34,7 +36,7 @@ def load_urls(filename="repo_urls.txt"):
 def process_repo(url, db_config):
     results = []
     try:
-        conn = psycopg2.connect(**db_config)
+        conn = psycopg2.connect(**db_config, application_name=APPLICATION_NAME)
         cursor = conn.cursor()
 
         cursor.execute("SELECT repo_id FROM augur_data.repo WHERE repo_git = %s", (url,))
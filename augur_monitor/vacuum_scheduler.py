@@ -0,0 +1,311 @@
+#SPDX-License-Identifier: MIT
+"""
+Bloat and dead tuple monitor with a targeted VACUUM scheduler.
+
+Each run (from cron, e.g. hourly):
+
+1. Samples pg_stat_all_tables for every table in the schema, with a
+   statistics-based bloat estimate (the same idea as the usual bloat
+   queries: expected size from reltuples and pg_stats row widths versus the
+   actual size). With --pgstattuple the worst candidates are measured with
+   pgstattuple_approx instead, which reads only the pages the visibility
+   map does not cover.
+2. Stores the sample in a local SQLite file, so dead tuple growth per hour
+   can be worked out from the previous sample.
+3. Ranks tables by reclaimable bytes: dead tuples plus estimated bloat now,
+   plus the dead tuples expected over the next --horizon hours at the
+   current growth rate.
+4. Runs VACUUM (ANALYZE) on the worst tables, one after the other, until the
+   time budget or the byte budget is used up. A manual VACUUM is not
+   throttled by default; it runs here with vacuum_cost_delay and
+   vacuum_cost_limit, so it cannot swamp collection I/O.
+
+Sizes and dead tuples before and after each VACUUM are printed and logged.
+"""
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime, timezone
+import psycopg2
+
+APPLICATION_NAME = "augur_monitor/vacuum_scheduler"
+SCHEMA = "augur_data"
+STORE = "vacuum_monitor.sqlite"
+TOP = 10
+BUDGET_MINUTES = 30
+BUDGET_GB = 200
+HORIZON_HOURS = 24
+MIN_DEAD = 10000
+MIN_DEAD_RATIO = 0.02
+COST_DELAY = 2
+COST_LIMIT = 2000
+
+# Row width from pg_stats plus the 24 byte tuple header and 4 byte line
+# pointer, against the heap size. Tables without statistics get no estimate.
+SAMPLE_SQL = """
+WITH widths AS (
+  SELECT schemaname, tablename, sum((1 - null_frac) * avg_width) AS width
+  FROM pg_stats
+  WHERE schemaname = %(schema)s
+  GROUP BY schemaname, tablename
+)
+SELECT
+  c.oid,
+  s.relname,
+  s.n_live_tup,
+  s.n_dead_tup,
+  s.n_mod_since_analyze,
+  pg_relation_size(c.oid) AS table_bytes,
+  pg_total_relation_size(c.oid) AS total_bytes,
+  CASE WHEN w.width IS NULL OR c.relpages = 0 THEN NULL
+       ELSE greatest(0, 1 - (c.reltuples * (w.width + 28)) / (c.relpages::numeric * current_setting('block_size')::int))
+  END AS bloat_ratio,
+  CASE WHEN c.reltuples > 0 THEN pg_relation_size(c.oid) / c.reltuples ELSE NULL END AS row_bytes,
+  greatest(s.last_vacuum, s.last_autovacuum) AS last_vacuum,
+  s.autovacuum_count
+FROM pg_stat_all_tables s
+JOIN pg_class c ON c.oid = s.relid
+LEFT JOIN widths w ON w.schemaname = s.schemaname AND w.tablename = s.relname
+WHERE s.schemaname = %(schema)s AND c.relkind IN ('r', 'm', 't');
+"""
+
+# Dead tuple and free space percentages, from a partial scan
+PGSTATTUPLE_SQL = """
+SELECT (dead_tuple_percent + approx_free_percent) / 100.0 FROM pgstattuple_approx(%s::oid);
+"""
+
+RUNNING_SQL = """
+SELECT relid FROM pg_stat_progress_vacuum;
+"""
+
+TABLE_STATS_SQL = """
+SELECT s.n_dead_tup, pg_relation_size(s.relid), pg_total_relation_size(s.relid)
+FROM pg_stat_all_tables s WHERE s.relid = %s;
+"""
+
+STORE_DDL = """
+CREATE TABLE IF NOT EXISTS samples (
+  sampled_at TEXT NOT NULL,
+  relname TEXT NOT NULL,
+  n_live_tup INTEGER,
+  n_dead_tup INTEGER,
+  table_bytes INTEGER,
+  total_bytes INTEGER,
+  bloat_ratio REAL,
+  PRIMARY KEY (relname, sampled_at)
+);
+CREATE TABLE IF NOT EXISTS vacuums (
+  started_at TEXT NOT NULL,
+  relname TEXT NOT NULL,
+  seconds REAL,
+  dead_before INTEGER,
+  dead_after INTEGER,
+  table_bytes_before INTEGER,
+  table_bytes_after INTEGER,
+  total_bytes_before INTEGER,
+  total_bytes_after INTEGER,
+  error TEXT
+);
+"""
+
+
+def load_config(filename="db.config.json"):
+    with open(filename, "r") as f:
+        return json.load(f)
+
+
+def pretty_size(size):
+    for unit in ("B", "kB", "MB", "GB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def open_store(path):
+    store = sqlite3.connect(path)
+    store.executescript(STORE_DDL)
+    return store
+
+
+def previous_samples(store, schema):
+    rows = store.execute("""
+        SELECT relname, sampled_at, n_dead_tup FROM samples s
+        WHERE relname LIKE ? AND sampled_at = (SELECT max(sampled_at) FROM samples WHERE relname = s.relname)
+    """, (f"{schema}.%",))
+    return {relname: (datetime.fromisoformat(sampled_at), dead) for relname, sampled_at, dead in rows}
+
+
+def sample(cursor, schema, use_pgstattuple, top):
+    cursor.execute(SAMPLE_SQL, {"schema": schema})
+    columns = [col.name for col in cursor.description]
+    tables = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    for t in tables:
+        t["name"] = f"{schema}.{t['relname']}"
+        t["bloat_ratio"] = float(t["bloat_ratio"]) if t["bloat_ratio"] is not None else 0.0
+        t["row_bytes"] = float(t["row_bytes"]) if t["row_bytes"] is not None else 0.0
+        t["bloat_source"] = "stats"
+
+    if use_pgstattuple:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pgstattuple';")
+        if cursor.fetchone() is None:
+            print("⚠️  pgstattuple is not installed (CREATE EXTENSION pgstattuple); using statistics estimates.")
+        else:
+            # Only measure the likely candidates; pgstattuple_approx still reads pages
+            candidates = sorted(tables, key=lambda t: t["bloat_ratio"] * t["table_bytes"], reverse=True)[:top * 2]
+            for t in candidates:
+                cursor.execute(PGSTATTUPLE_SQL, (t["oid"],))
+                t["bloat_ratio"] = float(cursor.fetchone()[0])
+                t["bloat_source"] = "pgstattuple"
+    return tables
+
+
+def rank(tables, previous, now, horizon_hours, min_dead, min_dead_ratio):
+    """
+    Adds growth and score to each table and returns the ones worth a
+    VACUUM, worst first.
+    """
+    candidates = []
+    for t in tables:
+        growth = 0.0
+        if t["name"] in previous:
+            sampled_at, dead_before = previous[t["name"]]
+            hours = (now - sampled_at).total_seconds() / 3600
+            if hours > 0:
+                growth = max(0.0, (t["n_dead_tup"] - dead_before) / hours)
+        t["dead_per_hour"] = growth
+        dead_bytes = t["n_dead_tup"] * t["row_bytes"]
+        bloat_bytes = t["bloat_ratio"] * t["table_bytes"]
+        t["score"] = max(dead_bytes, bloat_bytes) + growth * horizon_hours * t["row_bytes"]
+
+        live = t["n_live_tup"] + t["n_dead_tup"]
+        dead_ratio = t["n_dead_tup"] / live if live else 0
+        if t["n_dead_tup"] >= min_dead and dead_ratio >= min_dead_ratio:
+            candidates.append(t)
+    return sorted(candidates, key=lambda t: t["score"], reverse=True)
+
+
+def record_samples(store, tables, now):
+    store.executemany(
+        "INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?);",
+        [(now.isoformat(), t["name"], t["n_live_tup"], t["n_dead_tup"], t["table_bytes"], t["total_bytes"],
+          t["bloat_ratio"]) for t in tables]
+    )
+    store.commit()
+
+
+def table_stats(cursor, oid):
+    cursor.execute(TABLE_STATS_SQL, (oid,))
+    return cursor.fetchone()
+
+
+def vacuum_tables(conn, store, schema, tables, budget_minutes, budget_bytes, cost_delay, cost_limit):
+    conn.autocommit = True
+    deadline = time.perf_counter() + budget_minutes * 60
+    spent_bytes = 0
+    vacuumed = 0
+    with conn.cursor() as cursor:
+        cursor.execute("SET vacuum_cost_delay = %s;", (cost_delay,))
+        cursor.execute("SET vacuum_cost_limit = %s;", (cost_limit,))
+        cursor.execute(RUNNING_SQL)
+        running = {row[0] for row in cursor.fetchall()}
+
+        for t in tables:
+            if time.perf_counter() >= deadline:
+                print("Time budget used up.")
+                break
+            if t["oid"] in running:
+                print(f"  {t['name']}: already being vacuumed, skipped")
+                continue
+            if spent_bytes + t["total_bytes"] > budget_bytes:
+                print(f"  {t['name']}: {pretty_size(t['total_bytes'])} would exceed the I/O budget, skipped")
+                continue
+
+            dead_before, table_before, total_before = table_stats(cursor, t["oid"])
+            started_at = datetime.now(timezone.utc)
+            start = time.perf_counter()
+            error = None
+            try:
+                cursor.execute(f'VACUUM (ANALYZE) "{schema}"."{t["relname"]}";')
+            except psycopg2.Error as e:
+                error = str(e).strip()
+            seconds = time.perf_counter() - start
+            dead_after, table_after, total_after = table_stats(cursor, t["oid"])
+            spent_bytes += total_before
+            vacuumed += 1
+
+            store.execute(
+                "INSERT INTO vacuums VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                (started_at.isoformat(), t["name"], seconds, dead_before, dead_after, table_before, table_after,
+                 total_before, total_after, error)
+            )
+            store.commit()
+            if error:
+                print(f"❌ {t['name']}: {error}")
+            else:
+                print(f"✅ {t['name']} in {seconds:.1f}s: dead tuples {dead_before} -> {dead_after}, "
+                      f"table {pretty_size(table_before)} -> {pretty_size(table_after)}, "
+                      f"total {pretty_size(total_before)} -> {pretty_size(total_after)}")
+    conn.autocommit = False
+    print(f"Vacuumed {vacuumed} tables, {pretty_size(spent_bytes)} of relations.")
+
+
+def main(schema=SCHEMA, store_path=STORE, top=TOP, budget_minutes=BUDGET_MINUTES, budget_gb=BUDGET_GB,
+         horizon_hours=HORIZON_HOURS, min_dead=MIN_DEAD, min_dead_ratio=MIN_DEAD_RATIO, use_pgstattuple=False,
+         cost_delay=COST_DELAY, cost_limit=COST_LIMIT, dry_run=False):
+    conn = psycopg2.connect(**load_config(), application_name=APPLICATION_NAME)
+    store = open_store(store_path)
+    now = datetime.now(timezone.utc)
+    try:
+        with conn.cursor() as cursor:
+            tables = sample(cursor, schema, use_pgstattuple, top)
+        conn.rollback()
+        previous = previous_samples(store, schema)
+        worst = rank(tables, previous, now, horizon_hours, min_dead, min_dead_ratio)[:top]
+        record_samples(store, tables, now)
+
+        print(f"Sampled {len(tables)} tables in {schema}; {len(worst)} need a VACUUM.")
+        print(f"{'table':<50} {'dead':>12} {'dead/h':>10} {'bloat':>7} {'size':>10} {'score':>10}")
+        for t in worst:
+            print(f"{t['name']:<50} {t['n_dead_tup']:>12} {t['dead_per_hour']:>10.0f} "
+                  f"{t['bloat_ratio']:>6.0%}{'*' if t['bloat_source'] == 'pgstattuple' else ' '} "
+                  f"{pretty_size(t['table_bytes']):>10} {pretty_size(t['score']):>10}")
+        if dry_run or not worst:
+            return
+        vacuum_tables(conn, store, schema, worst, budget_minutes, budget_gb * 1024 ** 3, cost_delay, cost_limit)
+    finally:
+        store.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rank tables by bloat and dead tuple growth and VACUUM the worst within a budget.")
+    parser.add_argument("--schema", default=SCHEMA, help=f"Schema to watch (default: {SCHEMA}).")
+    parser.add_argument("--store", default=STORE, help=f"SQLite file for samples and the vacuum log (default: {STORE}).")
+    parser.add_argument("--top", type=int, default=TOP, help=f"Most tables to VACUUM per run (default: {TOP}).")
+    parser.add_argument("--budget-minutes", type=float, default=BUDGET_MINUTES, help=f"Stop starting new VACUUMs after this long (default: {BUDGET_MINUTES}).")
+    parser.add_argument("--budget-gb", type=float, default=BUDGET_GB, help=f"Total size of the relations to VACUUM per run (default: {BUDGET_GB}).")
+    parser.add_argument("--horizon", type=float, default=HORIZON_HOURS, help=f"Hours of dead tuple growth counted in the score (default: {HORIZON_HOURS}).")
+    parser.add_argument("--min-dead", type=int, default=MIN_DEAD, help=f"Ignore tables with fewer dead tuples (default: {MIN_DEAD}).")
+    parser.add_argument("--min-dead-ratio", type=float, default=MIN_DEAD_RATIO, help=f"Ignore tables with a lower dead tuple share (default: {MIN_DEAD_RATIO}).")
+    parser.add_argument("--pgstattuple", action="store_true", help="Measure the worst candidates with pgstattuple_approx.")
+    parser.add_argument("--cost-delay", type=float, default=COST_DELAY, help=f"vacuum_cost_delay in ms (default: {COST_DELAY}).")
+    parser.add_argument("--cost-limit", type=int, default=COST_LIMIT, help=f"vacuum_cost_limit (default: {COST_LIMIT}).")
+    parser.add_argument("--dry-run", action="store_true", help="Sample and rank, but do not VACUUM.")
+    args = parser.parse_args()
+
+    main(
+        schema=args.schema,
+        store_path=args.store,
+        top=args.top,
+        budget_minutes=args.budget_minutes,
+        budget_gb=args.budget_gb,
+        horizon_hours=args.horizon,
+        min_dead=args.min_dead,
+        min_dead_ratio=args.min_dead_ratio,
+        use_pgstattuple=args.pgstattuple,
+        cost_delay=args.cost_delay,
+        cost_limit=args.cost_limit,
+        dry_run=args.dry_run
+    )
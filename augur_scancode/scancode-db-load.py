@@ -4,6 +4,8 @@ import subprocess
 import psycopg2
 from psycopg2.extras import execute_values
 
+APPLICATION_NAME = "augur_scancode/scancode-db-load"
+
 # Load config.json for repo and scan output paths
 with open("config.json") as f:
     config = json.load(f)
@@ -27,7 +29,7 @@ def get_repo_git_url(repo_dir):
         return None
 
 # Connect to the database
-conn = psycopg2.connect(**db_config)
+conn = psycopg2.connect(**db_config, application_name=APPLICATION_NAME)
 cur = conn.cursor()
 
 for filename in os.listdir(SCAN_DIR):
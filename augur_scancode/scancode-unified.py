@@ -4,6 +4,8 @@ import subprocess
 import psycopg2
 from psycopg2.extras import execute_values
 
+APPLICATION_NAME = "augur_scancode/scancode-unified"
+
 # ------------------------------
 # CONFIG LOADING
 # ------------------------------
@@ -72,7 +74,7 @@ def get_repo_git_url(repo_dir):
 # ------------------------------
 # CONNECT TO DB
 # ------------------------------
-conn = psycopg2.connect(**db_config)
+conn = psycopg2.connect(**db_config, application_name=APPLICATION_NAME)
 cur = conn.cursor()
 
 # ------------------------------
@@ -12,6 +12,8 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import Counter, defaultdict
 import psycopg2
 
+APPLICATION_NAME = "augur_sysadmin/check_clones"
+
 results = []
 MAX_WORKERS = 24
 
@@ -25,7 +27,8 @@ def load_repo_base_from_db(config_path='../db.config.json'):
         user=db_config['user'],
         password=db_config['password'],
         host=db_config['host'],
-        port=db_config.get('port', 5432)
+        port=db_config.get('port', 5432),
+        application_name=APPLICATION_NAME
     )
 
     with conn.cursor() as cur:
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Suggest postgresql.conf values from what the server is actually doing.
+
+Reads pg_settings, pg_stat_database (cache hit ratio, temp files),
+pg_stat_checkpointer or, before Postgres 17, pg_stat_bgwriter (requested vs
+timed checkpoints), pg_stat_wal (WAL written per hour) and the host's RAM
+and CPUs. It prints a suggestion for the memory, WAL and checkpoint
+settings, each with the numbers behind it. Then it diffs the suggestions
+against a postgresql.conf from this repository (this directory's, or one of
+augur_multi_host/postgres/augur*/postgresql.conf).
+
+The statistics count from their last reset, so give the server a day or
+more of normal collection first. RAM and CPUs are read from the machine the
+script runs on; pass --ram-gb and --cpus when the database runs elsewhere,
+e.g. in a container with a memory limit.
+"""
+import os
+import re
+import json
+import difflib
+import argparse
+from datetime import datetime
+import psycopg2
+
+APPLICATION_NAME = "augur_sysadmin/pg_settings_audit"
+
+SETTINGS = (
+    "shared_buffers", "effective_cache_size", "work_mem", "maintenance_work_mem", "max_connections",
+    "max_wal_size", "min_wal_size", "checkpoint_timeout", "checkpoint_completion_target", "wal_buffers",
+)
+
+SETTINGS_SQL = """
+SELECT name, setting, unit, source FROM pg_settings WHERE name = ANY(%s);
+"""
+
+DATABASE_SQL = """
+SELECT blks_hit, blks_read, temp_files, temp_bytes,
+       extract(epoch FROM now() - coalesce(stats_reset, pg_postmaster_start_time()))
+FROM pg_stat_database WHERE datname = current_database();
+"""
+
+CHECKPOINTER_SQL = """
+SELECT num_timed, num_requested, extract(epoch FROM now() - stats_reset) FROM pg_stat_checkpointer;
+"""
+
+BGWRITER_SQL = """
+SELECT checkpoints_timed, checkpoints_req, extract(epoch FROM now() - stats_reset) FROM pg_stat_bgwriter;
+"""
+
+WAL_SQL = """
+SELECT wal_bytes, extract(epoch FROM now() - stats_reset) FROM pg_stat_wal;
+"""
+
+ACTIVE_SQL = """
+SELECT count(*) FROM pg_stat_activity WHERE backend_type = 'client backend';
+"""
+
+UNITS = {"B": 1, "kB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+TIME_UNITS = {"ms": 0.001, "s": 1, "min": 60, "h": 3600, "d": 86400}
+VALUE_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*$")
+CONF_LINE_RE = re.compile(r"^(\s*#?\s*)([a-z_]+)(\s*=\s*)('[^']*'|[^\s#]+)(.*)$")
+
+
+def load_db_config(config_path):
+    with open(config_path, 'r') as f:
+        return json.load(f)
+
+
+def to_bytes(value, default_unit="B"):
+    """
+    '333GB', '64MB', '4096' (in default_unit) -> bytes
+    """
+    m = VALUE_RE.match(str(value).strip("'"))
+    if not m:
+        raise ValueError(f"not a size: {value}")
+    number, unit = float(m.group(1)), m.group(2) or default_unit
+    if unit == "8kB":
+        return number * 8192
+    return number * UNITS[unit]
+
+
+def to_seconds(value, default_unit="s"):
+    m = VALUE_RE.match(str(value).strip("'"))
+    if not m:
+        raise ValueError(f"not a duration: {value}")
+    return float(m.group(1)) * TIME_UNITS[m.group(2) or default_unit]
+
+
+def format_bytes(size):
+    """
+    Round down to a whole postgresql.conf value: 64GB, 512MB, 256kB.
+    """
+    for unit in ("TB", "GB", "MB"):
+        if size >= UNITS[unit] * (1 if unit == "MB" else 4):
+            return f"{int(size // UNITS[unit])}{unit}"
+    return f"{max(64, int(size // 1024))}kB"
+
+
+def format_seconds(seconds):
+    return f"{int(seconds // 60)}min" if seconds % 60 == 0 else f"{int(seconds)}s"
+
+
+def pretty(size):
+    for unit in ("B", "kB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def host_resources():
+    ram = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    return ram, os.cpu_count() or 1
+
+
+def gather(cursor):
+    cursor.execute("SHOW server_version_num;")
+    version = int(cursor.fetchone()[0])
+
+    cursor.execute(SETTINGS_SQL, (list(SETTINGS),))
+    live = {}
+    for name, setting, unit, source in cursor.fetchall():
+        if unit in ("8kB", "kB", "MB", "B"):
+            value = to_bytes(setting, unit)
+        elif unit in TIME_UNITS:
+            value = to_seconds(setting, unit)
+        else:
+            value = float(setting)
+        live[name] = {"value": value, "source": source}
+
+    cursor.execute(DATABASE_SQL)
+    hit, read, temp_files, temp_bytes, db_seconds = cursor.fetchone()
+    cursor.execute(CHECKPOINTER_SQL if version >= 170000 else BGWRITER_SQL)
+    timed, requested, checkpoint_seconds = cursor.fetchone()
+    wal_bytes = wal_seconds = None
+    if version >= 140000:
+        cursor.execute(WAL_SQL)
+        wal_bytes, wal_seconds = cursor.fetchone()
+    cursor.execute(ACTIVE_SQL)
+    connections = cursor.fetchone()[0]
+
+    return live, {
+        "hit_ratio": hit / (hit + read) if hit + read else 1.0,
+        "temp_files": temp_files,
+        "temp_bytes": temp_bytes,
+        "db_hours": float(db_seconds) / 3600,
+        "checkpoints_timed": timed,
+        "checkpoints_requested": requested,
+        "checkpoint_hours": float(checkpoint_seconds or 0) / 3600,
+        "wal_bytes": float(wal_bytes) if wal_bytes is not None else None,
+        "wal_hours": float(wal_seconds or 0) / 3600,
+        "connections": connections,
+    }
+
+
+def suggest(live, stats, ram, expected_active):
+    """
+    Returns:
+        [(setting, suggested value as written in postgresql.conf, reason)]
+    """
+    suggestions = []
+    value = {name: live[name]["value"] for name in live}
+
+    # shared_buffers: about a quarter of RAM; more only pays off when the
+    # working set does not fit and the OS cache cannot help
+    shared = value["shared_buffers"]
+    hit = stats["hit_ratio"]
+    target = ram * 0.25
+    if shared > ram * 0.4:
+        suggestions.append(("shared_buffers", format_bytes(target),
+                            f"{pretty(shared)} is {shared / ram:.1%} of {pretty(ram)} RAM, leaving little for the OS cache, "
+                            f"work_mem and maintenance (cache hit ratio {hit:.2%})"))
+        shared = target
+    elif hit < 0.99 and shared < target * 0.9:
+        suggestions.append(("shared_buffers", format_bytes(target),
+                            f"cache hit ratio is {hit:.2%} (below 99%) with shared_buffers at {pretty(shared)} "
+                            f"({shared / ram:.1%} of {pretty(ram)} RAM)"))
+        shared = target
+
+    # effective_cache_size: what the planner may assume is cached,
+    # shared_buffers plus the OS cache
+    cache = value["effective_cache_size"]
+    target = ram * 0.7
+    if not ram * 0.5 <= cache <= ram * 0.8:
+        suggestions.append(("effective_cache_size", format_bytes(target),
+                            f"{pretty(cache)} is {cache / ram:.1%} of {pretty(ram)} RAM; shared_buffers plus OS cache is about 70%"))
+
+    # work_mem: every sort or hash node of every active query may use it, so
+    # the ceiling is the memory left over divided among the active backends
+    work_mem = value["work_mem"]
+    left_over = ram * 0.75 - shared
+    ceiling = max(4 * 1024 ** 2, left_over / (expected_active * 2))
+    temp_files, temp_bytes = stats["temp_files"], stats["temp_bytes"]
+    average_spill = temp_bytes / temp_files if temp_files else 0
+    temp_per_hour = temp_bytes / stats["db_hours"] if stats["db_hours"] else 0
+    if work_mem > ceiling:
+        suggestions.append(("work_mem", format_bytes(ceiling),
+                            f"{expected_active} active queries x 2 nodes x {pretty(work_mem)} could need "
+                            f"{pretty(expected_active * 2 * work_mem)}; the ceiling is {pretty(ceiling)} = "
+                            f"(75% of {pretty(ram)} RAM - {pretty(shared)} shared_buffers) / ({expected_active} x 2)"
+                            f"{' raised to the 4MB default' if ceiling > left_over / (expected_active * 2) else ''}"))
+    elif temp_files and average_spill > work_mem:
+        target = min(ceiling, 2 ** (int(average_spill).bit_length()))
+        if target > work_mem * 1.5:
+            suggestions.append(("work_mem", format_bytes(target),
+                                f"{temp_files} temp files averaging {pretty(average_spill)} "
+                                f"({pretty(temp_per_hour)}/hour) spill past work_mem {pretty(work_mem)}"))
+
+    # maintenance_work_mem: VACUUM, CREATE INDEX; autovacuum workers each get it too
+    maintenance = value["maintenance_work_mem"]
+    target = min(ram * 0.05, 8 * 1024 ** 3)
+    if maintenance < target / 2 or maintenance > ram * 0.1:
+        suggestions.append(("maintenance_work_mem", format_bytes(target),
+                            f"{pretty(maintenance)} for VACUUM and index builds; about 5% of RAM (capped at 8GB) fits "
+                            f"{pretty(ram)}"))
+
+    # Checkpoints: requested ones mean max_wal_size filled up before
+    # checkpoint_timeout came round
+    timed, requested = stats["checkpoints_timed"], stats["checkpoints_requested"]
+    total = timed + requested
+    requested_share = requested / total if total else 0
+    timeout = value["checkpoint_timeout"]
+    per_hour = total / stats["checkpoint_hours"] if stats["checkpoint_hours"] else 0
+    if timeout < 15 * 60:
+        suggestions.append(("checkpoint_timeout", "15min",
+                            f"{per_hour:.1f} checkpoints/hour; each one makes the next change to every page "
+                            f"write a full page image to WAL"))
+        timeout = 15 * 60
+    if value["checkpoint_completion_target"] < 0.9:
+        suggestions.append(("checkpoint_completion_target", "0.9",
+                            "spreads checkpoint writes over 90% of the interval instead of bursts"))
+
+    max_wal = value["max_wal_size"]
+    if stats["wal_bytes"] is not None and stats["wal_hours"]:
+        wal_per_hour = stats["wal_bytes"] / stats["wal_hours"]
+        # WAL of one checkpoint interval, with headroom for peaks
+        target = wal_per_hour * timeout / 3600 * 3
+        if requested_share > 0.1 or target > max_wal * 1.5:
+            suggestions.append(("max_wal_size", format_bytes(max(target, max_wal * 2)),
+                                f"{requested} of {total} checkpoints ({requested_share:.0%}) were requested, not timed; "
+                                f"{pretty(wal_per_hour)}/hour of WAL is {pretty(wal_per_hour * timeout / 3600)} "
+                                f"per {format_seconds(timeout)} checkpoint"))
+            if value["min_wal_size"] < max(target, max_wal * 2) / 4:
+                suggestions.append(("min_wal_size", format_bytes(max(target, max_wal * 2) / 4),
+                                    "keeps recycled WAL segments around between checkpoints"))
+    elif requested_share > 0.1:
+        suggestions.append(("max_wal_size", format_bytes(max_wal * 2),
+                            f"{requested} of {total} checkpoints ({requested_share:.0%}) were requested, not timed"))
+
+    return suggestions
+
+
+def read_conf(path):
+    """
+    Returns:
+        (lines, {setting: (line index, value, commented out)}); the last
+        active line for a setting wins, as it does for Postgres.
+    """
+    with open(path, 'r') as f:
+        lines = f.readlines()
+    found = {}
+    for i, line in enumerate(lines):
+        m = CONF_LINE_RE.match(line)
+        if not m:
+            continue
+        commented = "#" in m.group(1)
+        name = m.group(2)
+        if commented and name in found:
+            continue
+        if not commented or name not in found:
+            found[name] = (i, m.group(4), commented)
+    return lines, found
+
+
+def apply_suggestions(lines, found, suggestions):
+    lines = list(lines)
+    appended = []
+    for name, value, _ in suggestions:
+        if name in found:
+            i, _, _ = found[name]
+            m = CONF_LINE_RE.match(lines[i])
+            lines[i] = f"{name}{m.group(3)}{value}{m.group(5)}\n"
+        else:
+            appended.append(f"{name} = {value}\n")
+    if appended:
+        lines.append(f"\n# Suggested by pg_settings_audit.py on {datetime.now():%Y-%m-%d}\n")
+        lines += appended
+    return lines
+
+
+def main(db_config, conf, ram, cpus, expected_active, output):
+    conn = psycopg2.connect(
+        dbname=db_config['dbname'],
+        user=db_config['user'],
+        password=db_config['password'],
+        host=db_config['host'],
+        port=db_config.get('port', 5432),
+        application_name=APPLICATION_NAME
+    )
+    try:
+        with conn.cursor() as cursor:
+            live, stats = gather(cursor)
+    finally:
+        conn.close()
+
+    expected_active = expected_active or min(int(live["max_connections"]["value"]), cpus * 4)
+    print(f"Host: {pretty(ram)} RAM, {cpus} CPUs; sizing work_mem for {expected_active} active queries.")
+    print(f"Cache hit ratio {stats['hit_ratio']:.2%}, {stats['temp_files']} temp files / {pretty(stats['temp_bytes'])} "
+          f"over {stats['db_hours']:.0f}h, checkpoints {stats['checkpoints_timed']} timed / "
+          f"{stats['checkpoints_requested']} requested over {stats['checkpoint_hours']:.0f}h.")
+
+    suggestions = suggest(live, stats, ram, expected_active)
+    lines, found = read_conf(conf)
+    print(f"\n{'setting':<30} {'live':>12} {'in ' + os.path.basename(conf):>18} {'suggested':>12}  why")
+    for name, value, reason in suggestions:
+        in_file = found[name][1] if name in found and not found[name][2] else "(default)"
+        source = live[name]["source"]
+        current = format_seconds(live[name]["value"]) if name == "checkpoint_timeout" else (
+            format_bytes(live[name]["value"]) if name.endswith(("_size", "_mem", "_buffers")) else f"{live[name]['value']:g}"
+        )
+        print(f"{name:<30} {current:>12} {in_file:>18} {value:>12}  {reason}"
+              f"{' (live value set from ' + source + ')' if source not in ('configuration file', 'default') else ''}")
+    if not suggestions:
+        print("✅ Nothing to suggest.")
+        return
+
+    updated = apply_suggestions(lines, found, suggestions)
+    print()
+    print("".join(difflib.unified_diff(lines, updated, fromfile=conf, tofile=f"{conf} (suggested)")))
+    if output:
+        with open(output, 'w') as f:
+            f.writelines(updated)
+        print(f"📄 Wrote {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Suggest memory, WAL and checkpoint settings from live statistics and diff them against a postgresql.conf")
+    parser.add_argument('--db-config', default="../db.config.json", help="Path to Augur-style db.config.json")
+    parser.add_argument('--conf', default="postgresql.conf", help="postgresql.conf to compare against, e.g. ../augur_multi_host/postgres/augur3/postgresql.conf")
+    parser.add_argument('--ram-gb', type=float, default=None, help="RAM available to Postgres (default: this machine's)")
+    parser.add_argument('--cpus', type=int, default=None, help="CPUs available to Postgres (default: this machine's)")
+    parser.add_argument('--expected-active', type=int, default=None, help="Queries expected to run at once (default: 4 per CPU, at most max_connections)")
+    parser.add_argument('--output', default=None, help="Write the config with the suggestions applied to this file")
+    args = parser.parse_args()
+
+    host_ram, host_cpus = host_resources()
+    main(
+        load_db_config(args.db_config),
+        args.conf,
+        args.ram_gb * 1024 ** 3 if args.ram_gb else host_ram,
+        args.cpus or host_cpus,
+        args.expected_active,
+        args.output
+    )
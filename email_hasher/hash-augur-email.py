@@ -17,6 +17,8 @@ import json
 import sys
 import traceback
 
+APPLICATION_NAME = "email_hasher/hash-augur-email"
+
 # Read database connection details from JSON file
 def read_db_config(file_path="db.config.json"):
     try:
@@ -34,7 +36,8 @@ def connect_to_db(db_config):
             user=db_config["user"],
             password=db_config["password"],
             host=db_config["host"],
-            port=db_config["port"]
+            port=db_config["port"],
+            application_name=APPLICATION_NAME
         )
         return conn
     except Exception as e:
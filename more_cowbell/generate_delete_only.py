@@ -10,6 +10,8 @@ import time
 from urllib.parse import urlparse
 import sys
 
+APPLICATION_NAME = "more_cowbell/generate_delete_only"
+
 # Read GitHub API token from JSON file
 def read_github_token(file_path="githubapi.json"):
     try:
@@ -37,7 +39,8 @@ def connect_to_db(db_config):
             user=db_config["user"],
             password=db_config["password"],
             host=db_config["host"],
-            port=db_config["port"]
+            port=db_config["port"],
+            application_name=APPLICATION_NAME
         )
         return conn
     except Exception as e:
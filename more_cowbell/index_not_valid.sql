@@ -0,0 +1,33 @@
+-- Phase 1, generated from index.sql by constraint_rollout.py.
+-- Catalog-only changes: existing rows are checked in phase 2.
+-- NOT VALID is not supported for foreign keys on partitioned tables before Postgres 18.
+SET lock_timeout = '2s';
+
+ALTER TABLE "augur_data"."issue_assignees"
+  DROP CONSTRAINT "fk_issue_assignees_issues_1",
+  DROP CONSTRAINT "issue_assignees_cntrb_id_fkey",
+  ADD CONSTRAINT "fk_issue_assignees_issues_1" FOREIGN KEY ("issue_id") REFERENCES "augur_data"."issues" ("issue_id") ON DELETE CASCADE ON UPDATE CASCADE NOT VALID,
+  ADD CONSTRAINT "issue_assignees_cntrb_id_fkey" FOREIGN KEY ("cntrb_id") REFERENCES "augur_data"."contributors" ("cntrb_id") ON DELETE RESTRICT ON UPDATE CASCADE  DEFERRABLE INITIALLY DEFERRED NOT VALID;
+
+ALTER TABLE "augur_data"."pull_request_review_message_ref"
+  DROP CONSTRAINT "fk_pull_request_review_message_ref_message_1",
+  ADD CONSTRAINT "fk_pull_request_review_message_ref_message_1" FOREIGN KEY ("msg_id") REFERENCES "augur_data"."message" ("msg_id") ON DELETE CASCADE ON UPDATE CASCADE DEFERRABLE INITIALLY DEFERRED NOT VALID;
+
+ALTER TABLE "augur_data"."pull_request_message_ref"
+  DROP CONSTRAINT "fk_pull_request_message_ref_message_1",
+  ADD CONSTRAINT "fk_pull_request_message_ref_message_1" FOREIGN KEY ("msg_id") REFERENCES "augur_data"."message" ("msg_id") ON DELETE CASCADE ON UPDATE CASCADE DEFERRABLE INITIALLY DEFERRED NOT VALID;
+
+ALTER TABLE "augur_data"."pull_request_review_message_ref"
+  DROP CONSTRAINT "fk_pull_request_review_message_ref_pull_request_reviews_1",
+  ADD CONSTRAINT "fk_pull_request_review_message_ref_pull_request_reviews_1" FOREIGN KEY ("pr_review_id") REFERENCES "augur_data"."pull_request_reviews" ("pr_review_id") ON DELETE CASCADE ON UPDATE CASCADE DEFERRABLE INITIALLY DEFERRED NOT VALID;
+
+ALTER TABLE "augur_data"."pull_requests"
+  DROP CONSTRAINT "pull_requests_pr_augur_contributor_id_fkey",
+  ADD CONSTRAINT "pull_requests_pr_augur_contributor_id_fkey" FOREIGN KEY ("pr_augur_contributor_id") REFERENCES "augur_data"."contributors" ("cntrb_id") ON DELETE RESTRICT ON UPDATE CASCADE DEFERRABLE INITIALLY DEFERRED NOT VALID;
+
+ALTER TABLE "augur_data"."pull_request_events"
+  DROP CONSTRAINT "fkprevent_repo_id",
+  DROP CONSTRAINT "pull_request_events_cntrb_id_fkey",
+  ADD CONSTRAINT "fkprevent_repo_id" FOREIGN KEY ("repo_id") REFERENCES "augur_data"."repo" ("repo_id") ON DELETE RESTRICT ON UPDATE CASCADE DEFERRABLE INITIALLY DEFERRED NOT VALID,
+  ADD CONSTRAINT "pull_request_events_cntrb_id_fkey" FOREIGN KEY ("cntrb_id") REFERENCES "augur_data"."contributors" ("cntrb_id") ON DELETE RESTRICT ON UPDATE CASCADE DEFERRABLE INITIALLY DEFERRED NOT VALID;
+
@@ -0,0 +1,12 @@
+-- Phase 2, generated from index.sql by constraint_rollout.py.
+-- Each VALIDATE takes SHARE UPDATE EXCLUSIVE; reads and writes carry on.
+-- python constraint_rollout.py --validate does the same with a time budget.
+
+ALTER TABLE "augur_data"."issue_assignees" VALIDATE CONSTRAINT "fk_issue_assignees_issues_1";
+ALTER TABLE "augur_data"."issue_assignees" VALIDATE CONSTRAINT "issue_assignees_cntrb_id_fkey";
+ALTER TABLE "augur_data"."pull_request_review_message_ref" VALIDATE CONSTRAINT "fk_pull_request_review_message_ref_message_1";
+ALTER TABLE "augur_data"."pull_request_message_ref" VALIDATE CONSTRAINT "fk_pull_request_message_ref_message_1";
+ALTER TABLE "augur_data"."pull_request_review_message_ref" VALIDATE CONSTRAINT "fk_pull_request_review_message_ref_pull_request_reviews_1";
+ALTER TABLE "augur_data"."pull_requests" VALIDATE CONSTRAINT "pull_requests_pr_augur_contributor_id_fkey";
+ALTER TABLE "augur_data"."pull_request_events" VALIDATE CONSTRAINT "fkprevent_repo_id";
+ALTER TABLE "augur_data"."pull_request_events" VALIDATE CONSTRAINT "pull_request_events_cntrb_id_fkey";
@@ -6,6 +6,8 @@ import json
 import pandas as pd
 import psycopg2  # PostgreSQL Database Driver
 
+APPLICATION_NAME = "more_cowbell/repo_validator"
+
 # Read GitHub API token from JSON file
 def read_github_token(file_path="githubapi.json"):
     try:
@@ -33,7 +35,8 @@ def connect_to_db(db_config):
             user=db_config["user"],
             password=db_config["password"],
             host=db_config["host"],
-            port=db_config["port"]
+            port=db_config["port"],
+            application_name=APPLICATION_NAME
         )
         return conn
     except Exception as e:
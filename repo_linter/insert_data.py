@@ -3,6 +3,8 @@ import json
 import psycopg2
 from psycopg2.extras import execute_values
 
+APPLICATION_NAME = "repo_linter/insert_data"
+
 # Database connection settings (Modify as needed)
 DB_CONFIG = {
     "dbname": "xx",
@@ -56,7 +58,7 @@ CREATE TABLE IF NOT EXISTS analysis.linter_targets (
 
 # Function to insert data into the database
 def insert_data(data):
-    conn = psycopg2.connect(**DB_CONFIG)
+    conn = psycopg2.connect(**DB_CONFIG, application_name=APPLICATION_NAME)
     cur = conn.cursor()
 
     for repo in data:
@@ -101,7 +103,7 @@ def insert_data(data):
 # Main execution
 if __name__ == "__main__":
     # Connect to DB and create tables
-    conn = psycopg2.connect(**DB_CONFIG)
+    conn = psycopg2.connect(**DB_CONFIG, application_name=APPLICATION_NAME)
     cur = conn.cursor()
     cur.execute(CREATE_TABLES_SQL)
     conn.commit()
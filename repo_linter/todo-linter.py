@@ -4,6 +4,8 @@ import json
 import subprocess
 import os
 
+APPLICATION_NAME = "repo_linter/todo-linter"
+
 # Database connection parameters
 #DB_HOST = "xx.xx.1.xx"
 #DB_PORT = "xx"
@@ -37,7 +39,8 @@ try:
         port=DB_PORT,
         dbname=DB_NAME,
         user=DB_USER,
-        password=DB_PASSWORD
+        password=DB_PASSWORD,
+        application_name=APPLICATION_NAME
     )
     cursor = conn.cursor()
 